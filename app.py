@@ -1,82 +1,208 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+import concurrent.futures
+import contextvars
 import json
+import logging
 import os
-import requests
-from utils.disease_handler import get_disease_info, detect_language as detect_lang_disease
-from utils.vaccine_handler import get_vaccine_info, get_vaccination_reminder
+import random
+import time
+from utils.disease_handler import get_available_diseases, get_disease_info, detect_language as detect_lang_disease
+from utils.vaccine_handler import get_available_vaccines, get_vaccine_info, get_vaccination_reminder, get_due_vaccines_info
 from utils.language_utils import (
     detect_language, 
     get_language_from_dialogflow, 
     normalize_disease_name, 
     normalize_vaccine_name,
     get_greeting_response,
-    extract_temperature
+    extract_child_age_weeks
+)
+from utils.emergency import assess_emergency
+from utils.knowledge_base import get_knowledge_base, get_knowledge_base_stats
+from utils.entity_matcher import SCHEDULE_KEY, get_disease_matcher, get_vaccine_matcher
+from utils.response_cache import get_response_cache_stats
+from utils.intent_classifier import (
+    classify_intent,
+    record_dialogflow_agreement,
+    get_agreement_stats,
+    INTENT_ALIASES,
+    LOCAL_INTENT_THRESHOLD
+)
+from utils.whatsapp_delivery import send_whatsapp_message, enqueue_whatsapp_message, get_delivery_stats
+from utils.message_dedup import is_duplicate_message, forget_message, get_dedup_stats
+from utils.conversation_state import (
+    ENTITY_PARAMETERS,
+    EMPTY_STATE,
+    detect_followup,
+    followup_parameters,
+    get_conversation,
+    get_conversation_stats,
+    resolve_language,
+    save_conversation
+)
+from utils.structured_logging import (
+    configure_logging,
+    bind_request_id,
+    reset_request_id,
+    session_correlation_id,
+    get_logging_stats,
+    sampled_info_enabled
+)
+from utils.metrics import (
+    METRICS_ENABLED,
+    STAGE_SECONDS,
+    INTENT_SECONDS,
+    DIALOGFLOW_REQUESTS,
+    REPLY_PATHS,
+    render_metrics
 )
 
 # ADD THESE NEW IMPORTS
-from google.cloud import dialogflow
-from google.oauth2 import service_account
+from utils.dialogflow_client import (
+    get_dialogflow_client,
+    record_success as record_dialogflow_success,
+    record_failure as record_dialogflow_failure,
+    dialogflow_health,
+    dialogflow_breaker,
+    get_hedge_executor,
+    DIALOGFLOW_TIMEOUT,
+    DIALOGFLOW_HEDGE_AFTER
+)
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
 # ADD THESE NEW GLOBAL VARIABLES
 PROJECT_ID = "arovi-nahi"  # Your Google Cloud Project ID
-CREDENTIALS_PATH = "credentials.json"  # Path to your JSON credentials file
 SESSION_ID = "default-session"  # Can be any unique identifier
-
-def get_dialogflow_client():
-    """Initialize Dialogflow client with credentials"""
-    try:
-        # Try environment variable first (for Render deployment)
-        credentials_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
-        if credentials_json:
-            credentials_info = json.loads(credentials_json)
-            credentials = service_account.Credentials.from_service_account_info(credentials_info)
-        else:
-            # Fallback to file (for local development)
-            credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_PATH)
-        
-        client = dialogflow.SessionsClient(credentials=credentials)
-        return client
-    except Exception as e:
-        print(f"Error initializing Dialogflow client: {str(e)}")
-        return None
+# Fraction of confidently classified messages still sent to Dialogflow to measure agreement
+LOCAL_INTENT_SHADOW_RATE = float(os.environ.get('LOCAL_INTENT_SHADOW_RATE', '0'))
+# Most queries one /webhook/batch call may carry
+WEBHOOK_BATCH_MAX_ITEMS = int(os.environ.get('WEBHOOK_BATCH_MAX_ITEMS', '1000'))
 
 def call_dialogflow_detect_intent(message_text, session_id=SESSION_ID):
-    """Call Dialogflow's detectIntent API"""
+    """Call Dialogflow's detectIntent API using the worker's shared client.
+
+    Returns None (so callers use the local fallback) when the call fails,
+    misses its deadline or the circuit breaker is open.
+    """
+    ticket = dialogflow_breaker.allow()
+    if not ticket:
+        DIALOGFLOW_REQUESTS.inc('short_circuited')
+        return None
+    started = time.monotonic()
     try:
         client = get_dialogflow_client()
         if not client:
+            DIALOGFLOW_REQUESTS.inc('no_client')
+            dialogflow_breaker.record(False, ticket=ticket)
             return None
             
         session_path = client.session_path(PROJECT_ID, session_id)
-        text_input = dialogflow.TextInput(text=message_text, language_code="en-US")
-        query_input = dialogflow.QueryInput(text=text_input)
+        query_input = {"text": {"text": message_text, "language_code": "en-US"}}
         
         response = client.detect_intent(
-            request={"session": session_path, "query_input": query_input}
+            request={"session": session_path, "query_input": query_input},
+            timeout=DIALOGFLOW_TIMEOUT,
+            retry=None
         )
         
+        duration = time.monotonic() - started
+        STAGE_SECONDS.observe(duration, 'dialogflow')
+        record_dialogflow_success(duration, ticket)
+        DIALOGFLOW_REQUESTS.inc('success')
         return response
     except Exception as e:
-        print(f"Error calling Dialogflow: {str(e)}")
+        duration = time.monotonic() - started
+        STAGE_SECONDS.observe(duration, 'dialogflow')
+        logger.warning("Error calling Dialogflow", extra={'error': str(e)})
+        record_dialogflow_failure(duration, ticket)
+        DIALOGFLOW_REQUESTS.inc('error')
         return None
 
-@app.route('/', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
+def call_dialogflow_hedged(message_text, session_id=SESSION_ID):
+    """Like call_dialogflow_detect_intent, but stop waiting after DIALOGFLOW_HEDGE_AFTER.
+
+    The late call keeps running (and still feeds the breaker); the caller
+    gets None and answers from the local fallback instead.
+    """
+    if DIALOGFLOW_HEDGE_AFTER <= 0:
+        return call_dialogflow_detect_intent(message_text, session_id)
+    future = get_hedge_executor().submit(
+        contextvars.copy_context().run, call_dialogflow_detect_intent, message_text, session_id
+    )
+    try:
+        return future.result(timeout=DIALOGFLOW_HEDGE_AFTER)
+    except concurrent.futures.TimeoutError:
+        DIALOGFLOW_REQUESTS.inc('hedged')
+        logger.info("Dialogflow over latency budget, answering locally", extra={'budget_seconds': DIALOGFLOW_HEDGE_AFTER})
+        return None
+
+def health_status():
+    """Health check payload shared by the sync and async servers"""
+    return {
         'status': 'healthy',
         'message': 'Healthcare Chatbot API is running',
         'supported_languages': ['odia', 'english', 'hindi'],
-        'supported_diseases': ['fever', 'cold', 'malaria', 'dengue'],
-        'supported_vaccines': ['bcg', 'opv', 'ipv', 'dpt', 'pentavalent', 'rotavirus', 'pcv', 'mr_vaccine', 'hepatitis_b', 'je_vaccine', 'dpt_booster_1', 'dpt_booster_2', 'opv_booster', 'td_vaccine']
-    })
+        'supported_diseases': get_available_diseases(),
+        'supported_vaccines': get_available_vaccines(),
+        'dialogflow': dialogflow_health(),
+        'delivery': get_delivery_stats(),
+        'dedup': get_dedup_stats(),
+        'conversations': get_conversation_stats(),
+        'logging': get_logging_stats(),
+        'response_cache': get_response_cache_stats(),
+        'knowledge_base': get_knowledge_base_stats(),
+        'local_intent': {
+            'threshold': LOCAL_INTENT_THRESHOLD,
+            'dialogflow_agreement': get_agreement_stats()
+        }
+    }
+
+def request_correlation_id():
+    """MessageSid for Twilio, a hash of the session for Dialogflow"""
+    if request.path == '/whatsapp':
+        return request.form.get('MessageSid')
+    if request.path == '/webhook':
+        return session_correlation_id((request.get_json(silent=True) or {}).get('session'))
+    return None
+
+@app.before_request
+def bind_log_context():
+    """Tag every log line of this request with its correlation ID"""
+    g.log_context = bind_request_id(request_correlation_id())
+
+@app.teardown_request
+def unbind_log_context(exc):
+    if 'log_context' in g:
+        reset_request_id(g.log_context)
+
+@app.route('/', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(health_status())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for all workers (404 unless METRICS_ENABLED)"""
+    if not METRICS_ENABLED:
+        return 'metrics disabled\n', 404
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @app.route('/whatsapp', methods=['POST'])
 def whatsapp_webhook():
-    """Handle incoming WhatsApp messages from Twilio - NOW ROUTES THROUGH DIALOGFLOW"""
+    """Handle incoming WhatsApp messages from Twilio - NOW ROUTES THROUGH DIALOGFLOW
+
+    The reply is built and sent from the background delivery queue so Twilio
+    gets its 200 immediately instead of waiting on Dialogflow and the send.
+    """
+    message_sid = request.form.get('MessageSid')
     try:
+        # Twilio retries slow webhooks with the same MessageSid - reply only once
+        if is_duplicate_message(message_sid):
+            return '', 200
+        
         # Get message data from Twilio
         from_number = request.form.get('From', '').replace('whatsapp:', '')
         message_body = request.form.get('Body', '')
@@ -84,42 +210,145 @@ def whatsapp_webhook():
         if not message_body:
             return '', 200
         
-        # STEP 1: Send message to Dialogflow for intent detection
-        dialogflow_response = call_dialogflow_detect_intent(message_body, from_number)
+        logger.info("WhatsApp message received", extra={'from': from_number, 'chars': len(message_body), 'sample': True})
         
-        if dialogflow_response:
-            # STEP 2: Dialogflow processed successfully - extract the response
-            response_text = dialogflow_response.query_result.fulfillment_text
-            
-            # If Dialogflow has no fulfillment text, it means it should call our webhook
-            # In that case, we simulate the webhook call
-            if not response_text:
-                # Simulate webhook request structure
-                mock_request = {
-                    'queryResult': {
-                        'intent': {
-                            'displayName': dialogflow_response.query_result.intent.display_name
-                        },
-                        'parameters': {k: (v[0] if isinstance(v, list) and len(v) == 1 else str(v)) for k, v in dialogflow_response.query_result.parameters.items()},
-                        'queryText': message_body
-                    }
-                }
-                
-                # Call our existing webhook logic
-                response_text = process_webhook_request(mock_request)
-        else:
-            # FALLBACK: If Dialogflow fails, use old direct processing
-            language = detect_language(message_body)
-            response_text = handle_whatsapp_message_fallback(message_body, language)
+        def build_reply():
+            return build_whatsapp_reply(from_number, message_body)
         
-        # STEP 3: Send response back to WhatsApp
-        send_whatsapp_message(from_number, response_text)
+        if not enqueue_whatsapp_message(from_number, build_reply):
+            # Queue is full - degrade to the old inline behaviour
+            send_whatsapp_message(from_number, build_reply())
         return '', 200
         
-    except Exception as e:
-        print(f"WhatsApp error: {str(e)}")
+    except Exception:
+        logger.exception("WhatsApp error")
+        # Twilio retries on a 500; let that retry through the dedup check
+        forget_message(message_sid)
         return '', 500
 
+def build_whatsapp_reply(from_number, message_body):
+    """Build the reply text for an incoming WhatsApp message"""
+    started = time.monotonic()
+    conversation = get_conversation(from_number)
+    language = resolve_language(message_body, conversation)
+    
+    # STEP 0: Answer clear messages ("dengue", "bcg vaccine") and follow-ups locally
+    local, response_text = try_local_reply(message_body, language, conversation)
+    if response_text is not None:
+        remember_turn(from_number, conversation, language, message_body, local.intent, local.parameters, started)
+        return response_text
+    
+    # STEP 1: Send message to Dialogflow for intent detection
+    dialogflow_response = call_dialogflow_hedged(message_body, from_number)
+    response_text = reply_from_dialogflow(dialogflow_response, message_body, local, language)
+    if dialogflow_response:
+        remember_turn(from_number, conversation, language, message_body,
+                      dialogflow_response.query_result.intent.display_name, dialogflow_parameters(dialogflow_response), started)
+    else:
+        remember_turn(from_number, conversation, language, message_body, local.intent, local.parameters, started)
+    return response_text
+
+def try_local_reply(message_body, language=None, conversation=EMPTY_STATE):
+    """Classify locally; return (local intent, reply or None if Dialogflow is needed)"""
+    with STAGE_SECONDS.time('local_intent'):
+        local = classify_intent(message_body)
+    shadow = random.random() < LOCAL_INTENT_SHADOW_RATE
+    if local.confidence >= LOCAL_INTENT_THRESHOLD and not shadow:
+        REPLY_PATHS.inc('local')
+        language = language or detect_language(message_body)
+        return local, process_intent(local.intent, local.parameters, message_body, language)
+    if local.intent is None:
+        # "what about in Hindi?", "and its treatment?" - no topic of their own
+        followup = detect_followup(message_body, conversation)
+        if followup:
+            REPLY_PATHS.inc('followup')
+            response_text = answer_followup(followup, conversation, message_body, language or detect_language(message_body))
+            # Report the previous topic as what this turn answered
+            return local._replace(intent=conversation.intent, parameters=followup_parameters(conversation)), response_text
+    return local, None
+
+def answer_followup(followup, conversation, message_body, language):
+    """Answer a follow-up from the previous turn's intent and entity"""
+    if followup == 'next_dose':
+        if conversation.child_age_weeks is not None:
+            return get_due_vaccines_info(conversation.child_age_weeks, language)
+        return get_vaccine_info(SCHEDULE_KEY, language)
+    return process_intent(conversation.intent, followup_parameters(conversation), message_body, language)
+
+def remember_turn(from_number, conversation, language, message_body, intent_name=None, parameters=None, started=None):
+    """Save the sender's language, the topic just answered and the child's age on vaccine questions.
+
+    Also logs one "Message handled" line per message for utils.log_analytics
+    with what was derived from it (the text is only written when LOG_REDACT
+    is off); nothing is derived for lines dropped by log sampling.
+    """
+    intent = INTENT_ALIASES.get(intent_name) if intent_name else None
+    updates = {'language': language}
+    parameter = entity = None
+    if intent:
+        # A new topic replaces the old entity, even when it has none of its own
+        parameter = ENTITY_PARAMETERS.get(intent)
+        entity = parameters.get(parameter) if parameter and parameters else None
+        if entity:
+            entity = normalize_disease_name(entity) if parameter == 'disease' else normalize_vaccine_name(entity)
+        updates.update(intent=intent, entity=entity or None)
+    # Only vaccine questions say how old the child is; "fever for 3 weeks" does not
+    child_age_weeks = extract_child_age_weeks(message_body) if intent == 'vaccine_info' else None
+    if child_age_weeks is not None:
+        updates['child_age_weeks'] = child_age_weeks
+    save_conversation(from_number, conversation._replace(**updates), conversation)
+    # Re-detecting the language and emergency is only worth it for a line that is kept
+    if not sampled_info_enabled(logger):
+        return
+    logger.info("Message handled", extra={
+        'text': message_body,
+        'intent': intent or 'fallback',
+        'language': language,
+        'detected_language': detect_language(message_body),
+        'disease': entity if parameter == 'disease' else None,
+        'vaccine': entity if parameter == 'vaccine' else None,
+        'emergency': assess_emergency(message_body),
+        'latency_ms': round((time.monotonic() - started) * 1000, 2) if started is not None else None,
+        'sample': True
+    })
+
+def dialogflow_parameters(dialogflow_response):
+    """detectIntent parameters as plain values (single-item lists unwrapped)"""
+    return {k: (v[0] if isinstance(v, list) and len(v) == 1 else str(v)) for k, v in dialogflow_response.query_result.parameters.items()}
+
+def reply_from_dialogflow(dialogflow_response, message_body, local=None, language=None):
+    """Turn a detectIntent response (or None on failure) into the reply text"""
+    if dialogflow_response:
+        REPLY_PATHS.inc('dialogflow')
+        if local is not None:
+            record_dialogflow_agreement(local, dialogflow_response.query_result.intent.display_name)
+        # STEP 2: Dialogflow processed successfully - extract the response
+        response_text = dialogflow_response.query_result.fulfillment_text
+        
+        # If Dialogflow has no fulfillment text, it means it should call our webhook
+        # In that case, we simulate the webhook call
+        if not response_text:
+            # Simulate webhook request structure
+            mock_request = {
+                'queryResult': {
+                    'intent': {
+                        'displayName': dialogflow_response.query_result.intent.display_name
+                    },
+                    'parameters': dialogflow_parameters(dialogflow_response),
+                    'queryText': message_body
+                }
+            }
+            
+            # Call our existing webhook logic
+            response_text = process_webhook_request(mock_request)
+    else:
+        # FALLBACK: If Dialogflow fails, use old direct processing
+        REPLY_PATHS.inc('fallback')
+        language = language or detect_language(message_body)
+        response_text = handle_whatsapp_message_fallback(message_body, language)
+    
+    return response_text
+
 def process_webhook_request(mock_request):
     """Process the webhook request (used for both real webhook and WhatsApp simulation)"""
     try:
@@ -138,8 +367,8 @@ def process_webhook_request(mock_request):
         response_text = process_intent(intent_name, parameters, query_text, language)
         return response_text
         
-    except Exception as e:
-        print(f"Webhook processing error: {str(e)}")
+    except Exception:
+        logger.exception("Webhook processing error")
         return "Sorry, something went wrong. Please try again."
 
 def handle_whatsapp_message_fallback(message, language):
@@ -148,44 +377,14 @@ def handle_whatsapp_message_fallback(message, language):
     if disease:
         return get_disease_info(disease, language, message)
     
-    vaccine_keywords = ['vaccine', 'टीका', 'ଟିକା', 'baby', 'बच्चा', 'ବାଚ୍ଚା']
-    if any(keyword in message.lower() for keyword in vaccine_keywords):
-        return get_vaccine_info('complete', language)
+    vaccine = get_vaccine_matcher().match(message)
+    if vaccine == SCHEDULE_KEY:
+        return get_schedule_reply(message, language)
+    if vaccine:
+        return get_vaccine_info(vaccine, language)
     
     return get_greeting_response(language)
 
-def send_whatsapp_message(to_number, message):
-    """Send WhatsApp message via Twilio"""
-    try:
-        TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
-        TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
-        
-        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
-            print("ERROR: Twilio credentials not found in environment variables")
-            return False
-        
-        url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
-        data = {
-            'From': 'whatsapp:+14155238886',  # Twilio sandbox number
-            'To': f'whatsapp:{to_number}',
-            'Body': message
-        }
-        
-        print(f"Sending WhatsApp message to {to_number}: {message[:100]}...")
-        
-        response = requests.post(url, data=data, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN))
-        
-        if response.status_code == 201:
-            print("✅ WhatsApp message sent successfully")
-            return True
-        else:
-            print(f"❌ Twilio API error: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Error sending WhatsApp message: {str(e)}")
-        return False
-
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Main webhook endpoint for Dialogflow"""
@@ -203,8 +402,8 @@ def webhook():
             'fulfillmentText': response_text
         })
         
-    except Exception as e:
-        print(f"Webhook error: {str(e)}")
+    except Exception:
+        logger.exception("Webhook error")
         error_responses = {
             'odia': 'ଦୁଃଖିତ, କିଛି ସମସ୍ୟା ହୋଇଛି। ପୁଣି ଚେଷ୍ଟା କରନ୍ତୁ।',
             'english': 'Sorry, something went wrong. Please try again.',
@@ -214,8 +413,92 @@ def webhook():
             'fulfillmentText': error_responses.get('english')
         })
 
+@app.route('/webhook/batch', methods=['POST'])
+def webhook_batch():
+    """Fulfill many queries in one call (JSON, or NDJSON lines when streaming)"""
+    try:
+        items, stream = parse_batch_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if stream or wants_ndjson(request.args.get('stream'), request.headers.get('Accept')):
+        return Response(stream_with_context(iter_batch_ndjson(items)), mimetype='application/x-ndjson')
+    return jsonify(batch_response(items))
+
+def parse_batch_request(body):
+    """Return (items, stream) from a batch body: a list, or {"items": [...], "stream": bool}"""
+    stream = False
+    if isinstance(body, dict):
+        stream = bool(body.get('stream'))
+        body = body.get('items')
+    if not isinstance(body, list):
+        raise ValueError('expected a list of items or {"items": [...]}')
+    if len(body) > WEBHOOK_BATCH_MAX_ITEMS:
+        raise ValueError(f'at most {WEBHOOK_BATCH_MAX_ITEMS} items per batch')
+    return body, stream
+
+def wants_ndjson(stream_arg, accept_header):
+    """?stream=1 or Accept: application/x-ndjson"""
+    return (stream_arg or '').lower() in ('1', 'true', 'yes') or 'application/x-ndjson' in (accept_header or '')
+
+def batch_item_request(item):
+    """Webhook request for one batch item (a queryResult, a full request or raw text), or None"""
+    if isinstance(item, str):
+        # Raw text has no Dialogflow intent; classify it locally
+        local = classify_intent(item)
+        return {'queryResult': {'queryText': item, 'intent': {'displayName': local.intent or ''}, 'parameters': local.parameters}}
+    if isinstance(item, dict):
+        if isinstance(item.get('queryResult'), dict):
+            return item
+        if 'queryText' in item or 'intent' in item:
+            return {'queryResult': item}
+    return None
+
+def iter_batch_results(items):
+    """Yield {'index', 'id'?, 'fulfillmentText' or 'error', 'ms'} per item, in order.
+
+    Identical queries in one batch (IVR menus, repeated symptoms) are
+    answered once.
+    """
+    answers = {}
+    for index, item in enumerate(items):
+        started = time.perf_counter()
+        result = {'index': index}
+        if isinstance(item, dict) and 'id' in item:
+            result['id'] = item['id']
+        webhook_request = batch_item_request(item)
+        if webhook_request is None:
+            result['error'] = 'expected a queryResult object or text'
+        else:
+            key = json.dumps(webhook_request['queryResult'], sort_keys=True, default=str)
+            if key not in answers:
+                answers[key] = process_webhook_request(webhook_request)
+            result['fulfillmentText'] = answers[key]
+        result['ms'] = round((time.perf_counter() - started) * 1000, 3)
+        yield result
+
+def batch_response(items):
+    """Whole-batch JSON payload"""
+    started = time.perf_counter()
+    results = list(iter_batch_results(items))
+    return {'results': results, 'count': len(results), 'total_ms': round((time.perf_counter() - started) * 1000, 3)}
+
+def iter_batch_ndjson(items):
+    """One JSON line per result as it is ready, then a summary line"""
+    started = time.perf_counter()
+    count = 0
+    for result in iter_batch_results(items):
+        count += 1
+        yield json.dumps(result, ensure_ascii=False) + '\n'
+    yield json.dumps({'done': True, 'count': count, 'total_ms': round((time.perf_counter() - started) * 1000, 3)}) + '\n'
+
 def process_intent(intent_name, parameters, query_text, language):
     """Process different intents and return appropriate response"""
+    # Label by canonical intent so unknown names cannot blow up the label set
+    with INTENT_SECONDS.time(INTENT_ALIASES.get(intent_name, 'fallback')):
+        return dispatch_intent(intent_name, parameters, query_text, language)
+
+def dispatch_intent(intent_name, parameters, query_text, language):
+    """Route an intent to its handler"""
     
     # Default Welcome Intent
     if intent_name in ['Default Welcome Intent', 'welcome', 'greeting']:
@@ -241,15 +524,10 @@ def process_intent(intent_name, parameters, query_text, language):
         # Convert to string to handle any remaining objects
         vaccine_name = str(vaccine_name) if vaccine_name else ''
 
-        if not vaccine_name:
-            # Check for baby/schedule keywords
-            if any(word in query_text.lower() for word in ['baby', 'बच्चा', 'ବାଚ୍ଚା', 'schedule', 'शेड्यूल', 'କାର୍ଯ୍ଯସୂଚୀ']):
-                vaccine_name = 'complete'
-
-        if not vaccine_name:
-            vaccine_name = 'complete'
-            
-        normalized_vaccine = normalize_vaccine_name(vaccine_name)
+        # No vaccine named: the whole schedule (or what is due for the child's age)
+        normalized_vaccine = normalize_vaccine_name(vaccine_name) if vaccine_name else SCHEDULE_KEY
+        if normalized_vaccine == SCHEDULE_KEY:
+            return get_schedule_reply(query_text, language)
         return get_vaccine_info(normalized_vaccine, language)
         
     # Emergency Intent
@@ -265,57 +543,15 @@ def process_intent(intent_name, parameters, query_text, language):
         return handle_fallback(query_text, language)
 def extract_disease_from_query(query_text):
     """Extract disease name from user query"""
-    disease_keywords = {
-    'fever': ['fever', 'ଜ୍ୱର', 'jwara', 'बुखार', 'bukhar'],
-    'cold': ['cold', 'ଶର୍ଦି', 'sardi', 'सर्दी', 'common cold'],
-    'malaria': ['malaria', 'ମଲେରିଆ', 'मलेरिया'],
-    'dengue': ['dengue', 'ଡେଙ୍ଗୁ', 'डेंगू', 'dengue fever'],
-    'asthma': ['asthma', 'ଆଜମା', 'अस्थमा'],
-    'diabetes': ['diabetes', 'ଡାଏବେଟିସ୍', 'ଡାଏବେଟିସ', 'डायबिटीज', 'मधुमेह', 'diabetes mellitus'],
-    'hypertension': ['hypertension', 'high blood pressure', 'ଉଚ୍ଚ ରକ୍ତଚାପ', 'उच्च रक्तचाप'],
-    'diarrhea': ['diarrhea', 'diarrhoea', 'loose motion', 'ଝାଡ଼ା', 'jhada', 'दस्त', 'लूज मोशन'],
-    'typhoid': ['typhoid', 'typhoid fever', 'ଟାଇଫଏଡ୍', 'ଟାଇଫଏଡ', 'टाइफाइड'],
-    'tuberculosis': ['tuberculosis', 'tb', 'ଯକ୍ଷ୍ମା', 'yakshma', 'तपेदिक', 'क्षय रोग'],
-    'jaundice': ['jaundice', 'ଜଣ୍ଡିସ୍', 'ଜଣ୍ଡିସ', 'jandis', 'पीलिया'],
-    'chickenpox': ['chickenpox', 'chicken pox', 'ଚିକେନ୍‌ପକ୍ସ', 'चिकनपॉक्स', 'varicella'],
-    'migraine': ['migraine', 'migraine headache', 'ମାଇଗ୍ରେନ୍', 'माइग्रेन'],
-    'gastritis': ['gastritis', 'ଗ୍ୟାଷ୍ଟ୍ରାଇଟିସ୍', 'गैस्ट्राइटिस'],
-    'anemia': ['anemia', 'anaemia', 'ରକ୍ତହୀନତା', 'एनीमिया', 'खून की कमी'],
-    'pneumonia': ['pneumonia', 'ନିମୋନିଆ', 'निमोनिया'],
-    'kidney_stone': ['kidney stone', 'kidney stones', 'renal stone', 'renal calculi', 'କିଡନୀ ପଥର', 'किडनी स्टोन', 'पथरी'],
-    'hepatitis': ['hepatitis', 'ହେପାଟାଇଟିସ୍', 'हेपेटाइटिस'],
-    'arthritis': ['arthritis', 'ଆର୍ଥ୍ରାଇଟିସ୍', 'गठिया'],
-    'ulcer': ['ulcer', 'stomach ulcer', 'peptic ulcer', 'gastric ulcer', 'ଅଲସର୍', 'अल्सर'],
-    'thyroid': ['thyroid', 'thyroid disorder', 'ଥାଇରଏଡ୍', 'थायराइड', 'hypothyroidism', 'hyperthyroidism'],
-    'bronchitis': ['bronchitis', 'ବ୍ରୋଙ୍କାଇଟିସ୍', 'ब्रोंकाइटिस'],
-    'scabies': ['scabies', 'ସ୍କାବିଜ୍', 'स्केबीज', 'खुजली'],
-    'urinary_tract_infection': ['urinary tract infection', 'uti', 'urine infection', 'ମୂତ୍ରନଳୀ ସଂକ୍ରମଣ', 'मूत्र पथ संक्रमण'],
-    'conjunctivitis': ['conjunctivitis', 'pink eye', 'କଞ୍ଜଙ୍କଟିଭାଇଟିସ୍', 'कंजंक्टिवाइटिस', 'आंख आना']
-}
-    
-    query_lower = query_text.lower()
-    for disease, keywords in disease_keywords.items():
-        for keyword in keywords:
-            if keyword in query_lower:
-                return disease
-    
-    return None
+    return get_disease_matcher().match(query_text)
 
 def handle_emergency(query_text, language):
     """Handle emergency situations"""
-    from utils.disease_handler import check_emergency_condition, load_data
-    
-    # Check for temperature in query
-    temp = extract_temperature(query_text)
-    if temp and temp >= 103:
-        _, phrases = load_data()
-        return phrases['emergency_responses']['fever_above_103'][language]
-    
-    # Check other emergency conditions
-    emergency = check_emergency_condition(None, query_text)
-    if emergency:
-        _, phrases = load_data()
-        return phrases['emergency_responses'][emergency][language]
+    # One pass finds a dangerous temperature or a red-flag symptom
+    emergency = assess_emergency(query_text)
+    responses = get_knowledge_base().phrases['emergency_responses']
+    if emergency in responses:
+        return responses[emergency][language]
     
     # General emergency response
     emergency_responses = {
@@ -326,15 +562,22 @@ def handle_emergency(query_text, language):
     
     return emergency_responses.get(language, emergency_responses['english'])
 
+HEALTH_TIPS = {
+    'odia': 'ସୁସ୍ଥ ରହିବା ପାଇଁ:\n• ସଫା ପାଣି ପିଅନ୍ତୁ\n• ହାତ ବାରମ୍ବାର ଧୋଇନ୍ତୁ\n• ସୁସ୍ଥ ଖାଦ୍ୟ ଖାଅନ୍ତୁ\n• ନିୟମିତ ବ୍ୟାୟାମ କରନ୍ତୁ\n• ପର୍ଯ୍ୟାପ୍ତ ଶୋଇନ୍ତୁ',
+    'english': 'To stay healthy:\n• Drink clean water\n• Wash hands frequently\n• Eat healthy food\n• Exercise regularly\n• Get adequate sleep',
+    'hindi': 'स्वस्थ रहने के लिए:\n• साफ पानी पिएं\n• बार-बार हाथ धोएं\n• स्वस्थ खाना खाएं\n• नियमित व्यायाम करें\n• पर्याप्त नींद लें'
+}
+
 def get_general_health_tips(language):
     """Get general health tips"""
-    tips = {
-        'odia': 'ସୁସ୍ଥ ରହିବା ପାଇଁ:\n• ସଫା ପାଣି ପିଅନ୍ତୁ\n• ହାତ ବାରମ୍ବାର ଧୋଇନ୍ତୁ\n• ସୁସ୍ଥ ଖାଦ୍ୟ ଖାଅନ୍ତୁ\n• ନିୟମିତ ବ୍ୟାୟାମ କରନ୍ତୁ\n• ପର୍ଯ୍ୟାପ୍ତ ଶୋଇନ୍ତୁ',
-        'english': 'To stay healthy:\n• Drink clean water\n• Wash hands frequently\n• Eat healthy food\n• Exercise regularly\n• Get adequate sleep',
-        'hindi': 'स्वस्थ रहने के लिए:\n• साफ पानी पिएं\n• बार-बार हाथ धोएं\n• स्वस्थ खाना खाएं\n• नियमित व्यायाम करें\n• पर्याप्त नींद लें'
-    }
-    
-    return tips.get(language, tips['english'])
+    return HEALTH_TIPS.get(language, HEALTH_TIPS['english'])
+
+def get_schedule_reply(query_text, language):
+    """Vaccines due for the child's age if the message gives one ("my baby is 10 weeks old"), else the full schedule"""
+    child_age_weeks = extract_child_age_weeks(query_text)
+    if child_age_weeks is not None:
+        return get_due_vaccines_info(child_age_weeks, language)
+    return get_vaccine_info(SCHEDULE_KEY, language)
 
 def handle_fallback(query_text, language):
     """Handle fallback cases when intent is not clear"""
@@ -345,9 +588,11 @@ def handle_fallback(query_text, language):
         return get_disease_info(disease, language, query_text)
     
     # Check if it's about vaccination
-    vaccine_keywords = ['vaccine', 'टीका', 'ଟିକା', 'vaccination', 'immunization']
-    if any(keyword in query_text.lower() for keyword in vaccine_keywords):
-        return get_vaccine_info('complete', language)
+    vaccine = get_vaccine_matcher().match(query_text)
+    if vaccine == SCHEDULE_KEY:
+        return get_schedule_reply(query_text, language)
+    if vaccine:
+        return get_vaccine_info(vaccine, language)
     
     # General fallback response
     fallback_responses = {
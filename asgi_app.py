@@ -0,0 +1,273 @@
+"""Async (ASGI) serving mode for the webhook endpoints.
+
+Runs the same business logic as app.py (process_intent and friends), but
+Dialogflow and Twilio are called with async clients so a few processes
+can keep thousands of conversations in flight:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port $PORT --workers 2
+
+The sync Flask app under gunicorn remains the default deployment.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+import urllib.parse
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as sync_app
+from utils.dialogflow_client import (
+    get_async_dialogflow_client,
+    record_success as record_dialogflow_success,
+    record_failure as record_dialogflow_failure,
+    dialogflow_breaker,
+    DIALOGFLOW_TIMEOUT,
+    DIALOGFLOW_HEDGE_AFTER
+)
+from utils.conversation_state import get_conversation, resolve_language
+from utils.message_dedup import forget_message, is_duplicate_message
+from utils.structured_logging import request_context, session_correlation_id
+from utils.metrics import METRICS_ENABLED, STAGE_SECONDS, DIALOGFLOW_REQUESTS, render_metrics
+from utils.whatsapp_delivery import send_whatsapp_message_async, close_async_clients, record_delivery
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on replies being built/sent concurrently per process
+ASGI_MAX_INFLIGHT = int(os.environ.get('ASGI_MAX_INFLIGHT', '5000'))
+# Upper bound on reply tasks held per process (running or waiting for a slot);
+# past it new messages get a 503 instead of piling up in memory
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', str(ASGI_MAX_INFLIGHT * 4)))
+
+_inflight = set()
+_inflight_limit = None
+_recipient_locks = {}  # recipient -> [asyncio.Lock, tasks holding or waiting for it]
+
+
+async def call_dialogflow_detect_intent_async(message_text, session_id=sync_app.SESSION_ID):
+    """Async twin of app.call_dialogflow_detect_intent"""
+    ticket = dialogflow_breaker.allow()
+    if not ticket:
+        DIALOGFLOW_REQUESTS.inc('short_circuited')
+        return None
+    started = time.monotonic()
+    try:
+        client = get_async_dialogflow_client()
+        if not client:
+            DIALOGFLOW_REQUESTS.inc('no_client')
+            dialogflow_breaker.record(False, ticket=ticket)
+            return None
+
+        session_path = client.session_path(sync_app.PROJECT_ID, session_id)
+        query_input = {"text": {"text": message_text, "language_code": "en-US"}}
+
+        response = await client.detect_intent(
+            request={"session": session_path, "query_input": query_input},
+            timeout=DIALOGFLOW_TIMEOUT,
+            retry=None
+        )
+
+        duration = time.monotonic() - started
+        STAGE_SECONDS.observe(duration, 'dialogflow')
+        record_dialogflow_success(duration, ticket)
+        DIALOGFLOW_REQUESTS.inc('success')
+        return response
+    except Exception as e:
+        duration = time.monotonic() - started
+        STAGE_SECONDS.observe(duration, 'dialogflow')
+        logger.warning("Error calling Dialogflow", extra={'error': str(e)})
+        record_dialogflow_failure(duration, ticket)
+        DIALOGFLOW_REQUESTS.inc('error')
+        return None
+
+
+async def call_dialogflow_hedged_async(message_text, session_id=sync_app.SESSION_ID):
+    """Async twin of app.call_dialogflow_hedged"""
+    if DIALOGFLOW_HEDGE_AFTER <= 0:
+        return await call_dialogflow_detect_intent_async(message_text, session_id)
+    task = asyncio.ensure_future(call_dialogflow_detect_intent_async(message_text, session_id))
+    done, _ = await asyncio.wait({task}, timeout=DIALOGFLOW_HEDGE_AFTER)
+    if task in done:
+        return task.result()
+    # Let the late call finish in the background so it still feeds the breaker
+    _inflight.add(task)
+    task.add_done_callback(_inflight.discard)
+    DIALOGFLOW_REQUESTS.inc('hedged')
+    logger.info("Dialogflow over latency budget, answering locally", extra={'budget_seconds': DIALOGFLOW_HEDGE_AFTER})
+    return None
+
+
+def _local_turn(from_number, message_body):
+    """Load the conversation and try to answer without Dialogflow"""
+    conversation = get_conversation(from_number)
+    language = resolve_language(message_body, conversation)
+    local, response_text = sync_app.try_local_reply(message_body, language, conversation)
+    return conversation, language, local, response_text
+
+
+async def build_whatsapp_reply_async(from_number, message_body):
+    """Async twin of app.build_whatsapp_reply"""
+    started = time.monotonic()
+    # SQLite reads/writes and the local answer are blocking, so they run in the thread pool
+    conversation, language, local, response_text = await run_in_threadpool(_local_turn, from_number, message_body)
+    if response_text is not None:
+        await run_in_threadpool(sync_app.remember_turn, from_number, conversation, language, message_body,
+                                local.intent, local.parameters, started)
+        return response_text
+
+    dialogflow_response = await call_dialogflow_hedged_async(message_body, from_number)
+    response_text = await run_in_threadpool(sync_app.reply_from_dialogflow, dialogflow_response, message_body, local, language)
+    if dialogflow_response:
+        await run_in_threadpool(sync_app.remember_turn, from_number, conversation, language, message_body,
+                                dialogflow_response.query_result.intent.display_name,
+                                sync_app.dialogflow_parameters(dialogflow_response), started)
+    else:
+        await run_in_threadpool(sync_app.remember_turn, from_number, conversation, language, message_body,
+                                local.intent, local.parameters, started)
+    return response_text
+
+
+@contextlib.asynccontextmanager
+async def _recipient_turn(recipient):
+    """Serialize replies to one recipient so they arrive in the order received"""
+    entry = _recipient_locks.get(recipient)
+    if entry is None:
+        entry = _recipient_locks[recipient] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _recipient_locks[recipient]
+
+
+async def reply_to_whatsapp_message(from_number, message_body, received_at):
+    """Build and send one reply; runs as a background task"""
+    # Wait for our turn before taking an in-flight slot so queued
+    # follow-ups of one busy conversation do not hold slots idle
+    async with _recipient_turn(from_number), _inflight_limit:
+        try:
+            started = time.monotonic()
+            response_text = await build_whatsapp_reply_async(from_number, message_body)
+            if response_text:
+                sent = await send_whatsapp_message_async(from_number, response_text)
+                record_delivery(sent, started - received_at, time.monotonic() - started)
+        except Exception:
+            logger.exception("WhatsApp reply error")
+
+
+async def whatsapp_webhook(request):
+    """Handle incoming WhatsApp messages from Twilio; acknowledges immediately"""
+    try:
+        # Twilio posts application/x-www-form-urlencoded; parsing it here avoids
+        # needing python-multipart for request.form()
+        form = dict(urllib.parse.parse_qsl((await request.body()).decode('utf-8')))
+    except Exception:
+        logger.exception("WhatsApp error")
+        return Response(status_code=500)
+
+    with request_context(form.get('MessageSid')):
+        try:
+            # Shed load before marking the message seen so Twilio's retry is not dropped as a duplicate
+            if len(_inflight) >= ASGI_MAX_PENDING:
+                logger.warning("Too many pending replies, rejecting message", extra={'pending': len(_inflight)})
+                return Response(status_code=503)
+
+            if await run_in_threadpool(is_duplicate_message, form.get('MessageSid')):
+                return Response(status_code=200)
+
+            from_number = form.get('From', '').replace('whatsapp:', '')
+            message_body = form.get('Body', '')
+
+            if not message_body:
+                return Response(status_code=200)
+
+            logger.info("WhatsApp message received", extra={'from': from_number, 'chars': len(message_body), 'sample': True})
+            # The task copies the current context, so its log lines keep the request_id
+            task = asyncio.create_task(reply_to_whatsapp_message(from_number, message_body, time.monotonic()))
+            # Keep a reference until the task finishes so it is not garbage collected
+            _inflight.add(task)
+            task.add_done_callback(_inflight.discard)
+            return Response(status_code=200)
+
+        except Exception:
+            logger.exception("WhatsApp error")
+            # Twilio retries on a 500; let that retry through the dedup check
+            await run_in_threadpool(forget_message, form.get('MessageSid'))
+            return Response(status_code=500)
+
+
+async def webhook(request):
+    """Dialogflow fulfillment webhook"""
+    try:
+        req = await request.json()
+    except Exception:
+        logger.exception("Webhook error")
+        return JSONResponse({'fulfillmentText': 'Sorry, something went wrong. Please try again.'})
+
+    if not req:
+        return JSONResponse({'fulfillmentText': 'Invalid request'})
+    with request_context(session_correlation_id(req.get('session'))):
+        try:
+            return JSONResponse({'fulfillmentText': await run_in_threadpool(sync_app.process_webhook_request, req)})
+        except Exception:
+            logger.exception("Webhook error")
+            return JSONResponse({'fulfillmentText': 'Sorry, something went wrong. Please try again.'})
+
+
+async def webhook_batch(request):
+    """Batch fulfillment; the CPU-bound answering runs off the event loop"""
+    try:
+        items, stream = sync_app.parse_batch_request(await request.json())
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if stream or sync_app.wants_ndjson(request.query_params.get('stream'), request.headers.get('accept')):
+        # Starlette iterates a plain generator in its thread pool
+        return StreamingResponse(sync_app.iter_batch_ndjson(items), media_type='application/x-ndjson')
+    return JSONResponse(await run_in_threadpool(sync_app.batch_response, items))
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    status = sync_app.health_status()
+    status['mode'] = 'asgi'
+    status['inflight_replies'] = len(_inflight)
+    return JSONResponse(status)
+
+
+async def metrics(request):
+    """Prometheus metrics for all workers (404 unless METRICS_ENABLED)"""
+    if not METRICS_ENABLED:
+        return Response('metrics disabled\n', status_code=404, media_type='text/plain')
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def on_startup():
+    global _inflight_limit
+    # Created inside the serving loop (one per worker process)
+    _inflight_limit = asyncio.Semaphore(ASGI_MAX_INFLIGHT)
+
+
+async def on_shutdown():
+    if _inflight:
+        await asyncio.wait(_inflight, timeout=10)
+    await close_async_clients()
+
+
+app = Starlette(
+    routes=[
+        Route('/', health_check, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/whatsapp', whatsapp_webhook, methods=['POST']),
+        Route('/webhook', webhook, methods=['POST']),
+        Route('/webhook/batch', webhook_batch, methods=['POST'])
+    ],
+    on_startup=[on_startup],
+    on_shutdown=[on_shutdown]
+)
@@ -0,0 +1,91 @@
+"""Micro-benchmark: single-pass language detection vs the previous detector.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_language_detection
+"""
+import timeit
+
+from utils.language_utils import detect_language, detect_by_common_words
+
+# Real message shapes seen on the WhatsApp channel
+CORPUS = {
+    'odia': [
+        'ମୋ ପିଲାର ଜ୍ୱର ହୋଇଛି, କଣ କରିବି?',
+        'ଡେଙ୍ଗୁ ର ଲକ୍ଷଣ କଣ?',
+        'ବାଚ୍ଚା ଟିକା କାର୍ଯ୍ୟସୂଚୀ',
+        'ମୋର ୧୦୪ ଡିଗ୍ରୀ ଜ୍ୱର ଅଛି ଏବଂ ମୁଣ୍ଡ ବିନ୍ଧୁଛି, ଡାକ୍ତରଙ୍କ ପାଖକୁ ଯିବା ଦରକାର କି?'
+    ],
+    'hindi': [
+        'मुझे बुखार है',
+        'डेंगू के लक्षण क्या हैं?',
+        'बच्चे का टीकाकरण कब करवाना है',
+        'मेरे बच्चे को तीन दिन से तेज बुखार और खांसी है, क्या करें?'
+    ],
+    'english': [
+        'fever',
+        'What are the symptoms of dengue?',
+        'bcg vaccine',
+        'My child has had a high fever of 104 for two days, what should I do?'
+    ],
+    'romanized': [
+        'mujhe bukhar hai',
+        'mo pila ra jwara hoichi kana karibi',
+        'bacche ka tika kab lagega',
+        'dengue ke lakshan kya hai'
+    ],
+    'mixed': [
+        'BCG ଟିକା କେବେ ଦିଆଯାଏ?',
+        'dengue का इलाज',
+        'fever 103 हो गया',
+        'Odia re kuha'
+    ]
+}
+
+
+def legacy_detect_language(text):
+    """Detector as it was before the single-pass rewrite"""
+    if not text or not isinstance(text, str):
+        return 'english'
+    text = text.strip()
+    language_indicators = {
+        'odia': ['odia', 'ଓଡ଼ିଆ', 'oriya'],
+        'hindi': ['hindi', 'हिंदी', 'devanagari'],
+        'english': ['english', 'angrezi']
+    }
+    text_lower = text.lower()
+    for lang, indicators in language_indicators.items():
+        for indicator in indicators:
+            if indicator in text_lower:
+                return lang
+    odia_count = sum(1 for char in text if '଀' <= char <= '୿')
+    hindi_count = sum(1 for char in text if 'ऀ' <= char <= 'ॿ')
+    english_count = sum(1 for char in text if '\u0000' <= char <= '\u007F' and char.isalpha())
+    if odia_count > 0:
+        return 'odia'
+    elif hindi_count > 0:
+        return 'hindi'
+    elif english_count > 0:
+        return 'english'
+    return detect_by_common_words(text)
+
+
+def bench(func, messages, number):
+    seconds = timeit.timeit(lambda: [func(message) for message in messages], number=number)
+    return seconds / (number * len(messages)) * 1e6
+
+
+def main(number=20000):
+    print(f"{'group':<10} {'legacy us/msg':>14} {'single-pass us/msg':>19} {'speedup':>8}")
+    for group, messages in CORPUS.items():
+        for message in messages:
+            expected = legacy_detect_language(message)
+            actual = detect_language(message)
+            assert actual == expected, f"{message!r}: {actual} != {expected}"
+        legacy = bench(legacy_detect_language, messages, number)
+        current = bench(detect_language, messages, number)
+        print(f"{group:<10} {legacy:>14.2f} {current:>19.2f} {legacy / current:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
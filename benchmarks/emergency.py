@@ -0,0 +1,128 @@
+"""Correctness and speed of the emergency engine on a labelled multilingual corpus.
+
+Each line of emergency_corpus.jsonl has a message, the disease it is about
+(or null), the emergency condition expected (or null) and the temperature
+in °F expected to be read from it (or null). The script reports every
+mismatch and times the engine against the pre-engine implementation (kept
+below for comparison), which re-split the message and called float() per
+token, and compiled its temperature regexes on every call. Messages with
+and without a digit are also timed apart: most real messages ("what is
+dengue") have none and take the engine's keyword-only path.
+
+    python -m benchmarks.emergency
+    python -m benchmarks.emergency --repeat 2000 --output emergency.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from utils.emergency import get_emergency_engine
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'emergency_corpus.jsonl')
+
+LEGACY_KEYWORDS = {
+    'severe_stomach_pain': ['severe pain', 'गंभीर दर्द', 'ଗଭୀର ଯନ୍ତ୍ରଣା', 'stomach pain', 'पेट दर्द', 'ପେଟ ଯନ୍ତ୍ରଣା'],
+    'difficulty_breathing': ['can\'t breathe', 'सांस नहीं', 'ଦମ ନେବାରେ କଷ୍ଟ', 'breathing problem'],
+    'blood_vomiting': ['blood vomit', 'खून की उल्टी', 'ରକ୍ତ ବାନ୍ତି']
+}
+
+
+def legacy_extract_temperature(text):
+    temp_patterns = [
+        r'(\d+(?:\.\d+)?)\s*(?:degree|°|deg)?\s*(?:f|fahrenheit|फ|ଫ)?',
+        r'(\d+(?:\.\d+)?)\s*(?:ଡିଗ୍ରୀ|डिग्री)',
+        r'temperature\s+(\d+(?:\.\d+)?)',
+        r'temp\s+(\d+(?:\.\d+)?)'
+    ]
+    for pattern in temp_patterns:
+        matches = re.findall(pattern, text.lower())
+        if matches:
+            try:
+                return float(matches[0])
+            except ValueError:
+                continue
+    return None
+
+
+def legacy_check(disease_name, user_input):
+    """The emergency check (temperature, then keywords) as handle_emergency did it before the engine"""
+    temp = legacy_extract_temperature(user_input)
+    if temp and temp >= 103:
+        return 'fever_above_103'
+    if disease_name == 'fever':
+        for word in user_input.lower().split():
+            if word.replace('.', '').replace('°', '').replace('f', '').isdigit():
+                if float(word.replace('°', '').replace('f', '')) >= 103:
+                    return 'fever_above_103'
+    user_input_lower = user_input.lower()
+    for condition, keywords in LEGACY_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword.lower() in user_input_lower:
+                return condition
+    return None
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check(corpus, assess):
+    """Return the cases whose (condition, temperature) differ from the labels"""
+    failures = []
+    for case in corpus:
+        condition, temperature = assess(case['text'], case['disease'])
+        temperature = round(temperature, 1) if temperature is not None else None
+        if condition != case['condition'] or temperature != case['temperature_f']:
+            failures.append({'case': case, 'got': {'condition': condition, 'temperature_f': temperature}})
+    return failures
+
+
+def time_per_message(corpus, function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in corpus:
+            function(case['text'], case['disease'])
+    return (time.perf_counter() - started) / (repeat * len(corpus))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--repeat', type=int, default=500, help='passes over the corpus for timing')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    with_digits = [case for case in corpus if re.search(r'\d', case['text'])]
+    without_digits = [case for case in corpus if not re.search(r'\d', case['text'])]
+    engine = get_emergency_engine()
+    failures = check(corpus, lambda text, disease: engine.assess(text, disease))
+    legacy_failures = check(corpus, lambda text, disease: (legacy_check(disease, text), legacy_extract_temperature(text)))
+
+    results = {
+        'cases': len(corpus),
+        'engine_failures': len(failures),
+        'legacy_condition_errors': sum(1 for f in legacy_failures if f['got']['condition'] != f['case']['condition'])
+    }
+    for label, cases in (('', corpus), ('with_digits_', with_digits), ('without_digits_', without_digits)):
+        results[f'{label}engine_us_per_message'] = round(time_per_message(cases, engine.assess, args.repeat) * 1e6, 2)
+        results[f'{label}legacy_us_per_message'] = round(
+            time_per_message(cases, lambda text, disease: legacy_check(disease, text), args.repeat) * 1e6, 2
+        )
+    for failure in failures:
+        print(f"MISMATCH {failure['case']['text']!r}: expected {failure['case']['condition']}/"
+              f"{failure['case']['temperature_f']}, got {failure['got']['condition']}/{failure['got']['temperature_f']}")
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Latency benchmark suite with stubbed Dialogflow and Twilio.
+
+Replays a multilingual corpus built from the disease and vaccine synonyms
+in the data files and writes machine-readable results that can be diffed
+between versions:
+
+    python -m benchmarks.harness run --output bench-new.json
+    python -m benchmarks.harness diff bench-old.json bench-new.json
+
+``run`` has two phases:
+
+stages  in-process; every corpus message goes through language detection,
+        intent processing (local classifier, Dialogflow stub when it is not
+        confident), rendering and outbound delivery (Twilio stub), each timed
+http    the server (gunicorn or uvicorn, --server) is driven over /whatsapp
+        and /webhook with benchmarks.loadtest and the same corpus
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+from benchmarks import loadtest
+from utils.entity_matcher import SCHEDULE_ENTRY
+from utils.knowledge_base import get_knowledge_base
+from utils.language_utils import classify_language
+
+STAGES = ['language', 'intent', 'render', 'outbound', 'total']
+
+DISEASE_TEMPLATES = {
+    'english': ['{}', 'what is {}', 'symptoms of {}', 'tell me about {} treatment', '{} kya hai'],
+    'hindi': ['{}', '{} के लक्षण क्या हैं?', 'मुझे {} है', '{} के बारे में बताओ'],
+    'odia': ['{}', '{} ର ଲକ୍ଷଣ କଣ?', 'ମୋତେ {} ହୋଇଛି', '{} ବିଷୟରେ କୁହନ୍ତୁ']
+}
+
+VACCINE_TEMPLATES = {
+    'english': ['{} vaccine', 'when is {} given', 'tell me about {} vaccination'],
+    'hindi': ['{} टीका', '{} टीका कब लगता है?'],
+    'odia': ['{} ଟିକା', '{} ଟିକା କେବେ ଦିଆଯାଏ?']
+}
+
+# Messages the local classifier is not sure about, so they reach Dialogflow
+AMBIGUOUS_TEMPLATES = [
+    'my child has {disease} and needs the {vaccine} vaccine',
+    'मेरे बच्चे को {disease} है, क्या {vaccine} टीका लगवाना चाहिए?',
+    'I have been feeling weak since last week, could it be {disease}?',
+    'I feel tired all the time',
+    'ମୋ ପିଲାକୁ କେଉଁ ଡାକ୍ତର ପାଖକୁ ନେବି?'
+]
+
+FIXED_MESSAGES = [
+    ('greeting', 'hello'), ('greeting', 'नमस्ते'), ('greeting', 'ନମସ୍କାର'),
+    ('emergency', 'fever 104'), ('emergency', 'severe stomach pain'), ('emergency', 'खून की उल्टी'),
+    ('emergency', 'ରକ୍ତ ବାନ୍ତି'), ('general_health', 'health tips'), ('general_health', 'how to stay healthy')
+]
+
+
+def data_synonyms(entries):
+    """Key -> the "synonyms" list of every entry in a data file"""
+    return {key: list(info.get('synonyms', ())) for key, info in entries.items() if key != SCHEDULE_ENTRY}
+
+
+def build_corpus(size=2000, seed=7):
+    """Return ``size`` messages as dicts {'kind', 'text'}, deterministic for a seed"""
+    rng = random.Random(seed)
+    snapshot = get_knowledge_base().snapshot()
+    disease_synonyms = data_synonyms(snapshot.diseases)
+    vaccine_synonyms = data_synonyms(snapshot.vaccines)
+    messages = []
+    for key, phrases in disease_synonyms.items():
+        for phrase in phrases:
+            language = classify_language(phrase).language
+            for template in DISEASE_TEMPLATES[language]:
+                messages.append({'kind': 'disease', 'text': template.format(phrase)})
+    for key, phrases in vaccine_synonyms.items():
+        for phrase in phrases:
+            language = classify_language(phrase).language
+            for template in VACCINE_TEMPLATES[language]:
+                messages.append({'kind': 'vaccine', 'text': template.format(phrase)})
+    disease_phrases = [phrase for phrases in disease_synonyms.values() for phrase in phrases]
+    vaccine_phrases = [phrase for phrases in vaccine_synonyms.values() for phrase in phrases]
+    for template in AMBIGUOUS_TEMPLATES:
+        for _ in range(20):
+            text = template.format(disease=rng.choice(disease_phrases), vaccine=rng.choice(vaccine_phrases))
+            messages.append({'kind': 'ambiguous', 'text': text})
+    messages.extend({'kind': kind, 'text': text} for kind, text in FIXED_MESSAGES)
+
+    rng.shuffle(messages)
+    return [messages[i % len(messages)] for i in range(size)]
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stage_summary(samples):
+    values = sorted(samples)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+        'p50_ms': round(loadtest.percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(loadtest.percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(loadtest.percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3)
+    }
+
+
+def run_stages(corpus, stub_env):
+    """Time each stage of the reply pipeline in this process"""
+    os.environ.update(stub_env)
+    # Per-message info lines would swamp the report
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # Imported only now so the clients and logging pick up these settings
+    import app
+    from utils.intent_classifier import classify_intent, LOCAL_INTENT_THRESHOLD
+    from utils.response_cache import get_response_cache_stats
+
+    timings = {stage: [] for stage in STAGES}
+    paths = {'local': 0, 'dialogflow': 0}
+    failures = 0
+
+    for i, message in enumerate(corpus):
+        text = message['text']
+        sender = f'+9199{i:08d}'
+        started = time.perf_counter()
+        language = app.detect_language(text)
+        language_done = time.perf_counter()
+
+        local = classify_intent(text)
+        dialogflow_response = None
+        if local.confidence < LOCAL_INTENT_THRESHOLD:
+            dialogflow_response = app.call_dialogflow_detect_intent(text, sender)
+        intent_done = time.perf_counter()
+
+        if dialogflow_response is None and local.confidence >= LOCAL_INTENT_THRESHOLD:
+            paths['local'] += 1
+            reply = app.process_intent(local.intent, local.parameters, text, language)
+        else:
+            paths['dialogflow'] += 1
+            reply = app.reply_from_dialogflow(dialogflow_response, text)
+        render_done = time.perf_counter()
+
+        if not app.send_whatsapp_message(sender, reply):
+            failures += 1
+        finished = time.perf_counter()
+
+        timings['language'].append(language_done - started)
+        timings['intent'].append(intent_done - language_done)
+        timings['render'].append(render_done - intent_done)
+        timings['outbound'].append(finished - render_done)
+        timings['total'].append(finished - started)
+
+    return {
+        'stages': {stage: stage_summary(samples) for stage, samples in timings.items()},
+        'paths': paths,
+        'outbound_failures': failures,
+        'response_cache': {key: value for key, value in get_response_cache_stats().items() if key != 'renderers'}
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=loadtest.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_command(args):
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus(args.corpus_size, args.seed)
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'corpus_size': len(corpus),
+            'seed': args.seed,
+            'twilio_latency_ms': args.twilio_latency_ms,
+            'dialogflow_latency_ms': args.dialogflow_latency_ms
+        }
+    }
+
+    if 'stages' in args.phases:
+        stubs, stub_env = loadtest.start_stubs(args)
+        try:
+            results.update(run_stages(corpus, stub_env))
+        finally:
+            for stub in stubs:
+                loadtest.stop_process(stub)
+
+    if 'http' in args.phases:
+        texts = [message['text'] for message in corpus]
+        results['http'] = []
+        for run_id, endpoint in enumerate(['whatsapp', 'webhook']):
+            endpoint_args = argparse.Namespace(**dict(vars(args), endpoint=endpoint))
+            results['http'].append(loadtest.run_mode(args.server, endpoint_args, run_id, texts))
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return ''
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def diff_command(args):
+    with open(args.old, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"{'metric':<40}{'old':>12}{'new':>12}{'delta':>10}")
+    rows = []
+    for stage in STAGES:
+        for field in ('p50_ms', 'p95_ms', 'p99_ms'):
+            rows.append((f'stages.{stage}.{field}',
+                         old.get('stages', {}).get(stage, {}).get(field),
+                         new.get('stages', {}).get(stage, {}).get(field)))
+    old_http = {(run['mode'], run['endpoint']): run for run in old.get('http', [])}
+    for run in new.get('http', []):
+        previous = old_http.get((run['mode'], run['endpoint']), {})
+        name = f"http.{run['mode']}.{run['endpoint']}"
+        rows.append((f'{name}.throughput_rps', previous.get('throughput_rps'), run['throughput_rps']))
+        for section in ('request_latency', 'reply_latency'):
+            for field in ('p50_ms', 'p95_ms', 'p99_ms'):
+                rows.append((f'{name}.{section}.{field}',
+                             (previous.get(section) or {}).get(field),
+                             (run.get(section) or {}).get(field)))
+    for name, old_value, new_value in rows:
+        if old_value is None and new_value is None:
+            continue
+        print(f"{name:<40}{str(old_value):>12}{str(new_value):>12}{_delta(old_value, new_value):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmark and write JSON results')
+    run.add_argument('--phases', nargs='+', choices=['stages', 'http'], default=['stages', 'http'])
+    run.add_argument('--server', choices=['sync', 'async'], default='sync')
+    run.add_argument('--corpus', help='JSON lines file of {"kind", "text"} (default: generated)')
+    run.add_argument('--corpus-size', type=int, default=2000)
+    run.add_argument('--seed', type=int, default=7)
+    run.add_argument('--output', help='write results to this file as well as stdout')
+    loadtest.add_server_arguments(run)
+
+    diff = commands.add_parser('diff', help='compare two result files')
+    diff.add_argument('old')
+    diff.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_command(args)
+    else:
+        diff_command(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Import-time profile of the app: what a cold start spends importing.
+
+Imports the given modules (default: app) in a fresh interpreter under
+``python -X importtime`` and reports each module's self and cumulative
+import time, the total per top-level package, and whether the Dialogflow
+client library (gRPC/protobuf) was loaded:
+
+    python -m benchmarks.import_profile                 # import app
+    python -m benchmarks.import_profile asgi_app --top 40
+"""
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.loadtest import ROOT
+
+HEAVY_MODULES = ('google.cloud.dialogflow', 'grpc', 'google.protobuf', 'httpx', 'numpy')
+
+
+def profile_imports(modules):
+    """Return (rows, loaded heavy modules, wall seconds); rows are (module, self us, cumulative us, depth)"""
+    code = (
+        'import sys, time; started = time.perf_counter()\n'
+        + ''.join(f'import {module}\n' for module in modules)
+        + f'print(__import__("json").dumps([time.perf_counter() - started, '
+          f'[m for m in {list(HEAVY_MODULES)!r} if m in sys.modules]]))'
+    )
+    env = dict(os.environ, LOG_LEVEL='WARNING')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    wall, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return rows, heavy, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=['app'])
+    parser.add_argument('--top', type=int, default=25, help='modules to list by cumulative time')
+    parser.add_argument('--output', help='write the per-module rows as JSON to this file')
+    args = parser.parse_args()
+
+    rows, heavy, wall = profile_imports(args.modules)
+
+    by_package = collections.Counter()
+    for name, self_us, _, _ in rows:
+        by_package[name.split('.')[0]] += self_us
+
+    print(f"import {', '.join(args.modules)}: {wall * 1000:.1f} ms wall, {len(rows)} modules")
+    print(f"heavy libraries loaded: {', '.join(heavy) or 'none'}\n")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {'  ' * depth}{name}")
+    print(f"\n{'self ms':>14}  top-level package")
+    for package, self_us in by_package.most_common(args.top):
+        print(f"{self_us / 1000:>14.1f}  {package}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump([{'module': name, 'self_us': s, 'cumulative_us': c} for name, s, c, _ in rows], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Load test for the webhook endpoints: sync (gunicorn + Flask) vs async (uvicorn + ASGI).
+
+Starts Twilio and Dialogflow stubs (benchmarks.stubs) in their own
+processes, launches each server mode as a subprocess with the same number
+of worker processes, fires concurrent requests and reports throughput plus
+request and end-to-end reply latency percentiles:
+
+    python -m benchmarks.loadtest --mode compare --requests 2000 --concurrency 200 --workers 2
+
+The default messages are ones the local intent classifier answers;
+benchmarks.harness replays a full corpus through the same code.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = ['dengue', 'bcg vaccine', 'मुझे बुखार है', 'ଜ୍ୱର', 'malaria symptoms', 'hello', 'डेंगू के लक्षण क्या हैं?']
+
+SERVER_COMMANDS = {
+    'sync': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--threads', '8'
+    ],
+    'async': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--no-access-log', '--log-level', 'warning'
+    ]
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2) if values else None,
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2) if values else None
+    }
+
+
+def wait_until_healthy(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not become healthy')
+
+
+async def fire(base_url, endpoint, messages, total, concurrency, run_id):
+    """Send ``total`` requests with at most ``concurrency`` in flight"""
+    sent_at = {}
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def one(i):
+            nonlocal errors
+            message = messages[i % len(messages)]
+            sender = f'+9100{run_id}{i:07d}'
+            async with semaphore:
+                started = time.time()
+                try:
+                    if endpoint == 'whatsapp':
+                        response = await client.post('/whatsapp', data={
+                            'From': f'whatsapp:{sender}', 'Body': message, 'MessageSid': f'SM{run_id}{i}'
+                        })
+                    else:
+                        response = await client.post('/webhook', json={
+                            'queryResult': {'intent': {'displayName': ''}, 'parameters': {}, 'queryText': message}
+                        })
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.time() - started)
+                sent_at[sender] = started
+
+        started = time.time()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.time() - started
+
+    return sent_at, latencies, errors, elapsed
+
+
+def fetch_received(stub_url):
+    with urllib.request.urlopen(stub_url + '/_received', timeout=10) as response:
+        return json.load(response)
+
+
+def stop_process(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def start_stubs(args):
+    """Start the Twilio and Dialogflow stubs; return (processes, env for the app)"""
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    stubs = [
+        subprocess.Popen([sys.executable, '-m', 'benchmarks.stubs', 'twilio', '--port', str(args.stub_port),
+                          '--latency-ms', str(args.twilio_latency_ms)], cwd=ROOT),
+        subprocess.Popen([sys.executable, '-m', 'benchmarks.stubs', 'dialogflow', '--port', str(args.dialogflow_port),
+                          '--latency-ms', str(args.dialogflow_latency_ms)], cwd=ROOT)
+    ]
+    env = {
+        'TWILIO_API_BASE': stub_url,
+        'TWILIO_ACCOUNT_SID': 'ACloadtest',
+        'TWILIO_AUTH_TOKEN': 'loadtest',
+        'DIALOGFLOW_EMULATOR_HOST': f'127.0.0.1:{args.dialogflow_port}'
+    }
+    try:
+        wait_until_healthy(stub_url + '/_received')
+    except RuntimeError:
+        for stub in stubs:
+            stop_process(stub)
+        raise
+    return stubs, env
+
+
+def run_mode(mode, args, run_id, messages=MESSAGES):
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    stubs, stub_env = start_stubs(args)
+    env = dict(os.environ, PYTHONUNBUFFERED='1', **stub_env)
+    server = subprocess.Popen(SERVER_COMMANDS[mode](args.port, args.workers), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base_url = f'http://127.0.0.1:{args.port}'
+        wait_until_healthy(base_url + '/')
+        sent_at, latencies, errors, elapsed = asyncio.run(
+            fire(base_url, args.endpoint, messages, args.requests, args.concurrency, run_id))
+
+        replies = []
+        if args.endpoint == 'whatsapp':
+            # Wait for the background replies to reach the Twilio stub
+            deadline = time.time() + args.drain_timeout
+            received = fetch_received(stub_url)
+            while sum(map(len, received.values())) < args.requests and time.time() < deadline:
+                time.sleep(0.25)
+                received = fetch_received(stub_url)
+            for sender, started in sent_at.items():
+                arrivals = received.get(sender)
+                if arrivals:
+                    replies.append(arrivals[0] - started)
+
+        return {
+            'mode': mode,
+            'endpoint': args.endpoint,
+            'workers': args.workers,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'errors': errors,
+            'throughput_rps': round(args.requests / elapsed, 1),
+            'request_latency': summarize(latencies),
+            'reply_latency': summarize(replies) if args.endpoint == 'whatsapp' else None
+        }
+    finally:
+        stop_process(server)
+        for stub in stubs:
+            stop_process(stub)
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--stub-port', type=int, default=8766)
+    parser.add_argument('--dialogflow-port', type=int, default=8767)
+    parser.add_argument('--twilio-latency-ms', type=float, default=150)
+    parser.add_argument('--dialogflow-latency-ms', type=float, default=80)
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--drain-timeout', type=float, default=120)
+    add_stub_arguments(parser)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['sync', 'async', 'compare'], default='compare')
+    parser.add_argument('--endpoint', choices=['whatsapp', 'webhook'], default='whatsapp')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    modes = ['sync', 'async'] if args.mode == 'compare' else [args.mode]
+    results = [run_mode(mode, args, run_id) for run_id, mode in enumerate(modes)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
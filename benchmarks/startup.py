@@ -0,0 +1,135 @@
+"""Startup time, time-to-first-response and per-worker memory of the gunicorn server.
+
+Starts gunicorn (gunicorn.conf.py) with and without preload_app, waits
+for the health check, then times the first /webhook replies (served by workers
+that have not answered anything yet) and reads each process's memory from
+/proc/<pid>/smaps_rollup:
+
+    python -m benchmarks.startup --workers 4
+
+RSS counts shared pages in every process, so compare ``private_mb`` (pages
+only that worker holds) and ``pss_total_mb`` (the pool's real footprint).
+Linux only.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.loadtest import ROOT, stop_process, wait_until_healthy
+
+DISEASES = ['dengue', 'malaria', 'fever', 'typhoid', 'jaundice', 'asthma', 'cold', 'diabetes']
+
+
+def read_memory(pid):
+    """Rss/Pss/private memory of ``pid`` in MB"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_mb': round(fields.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(fields.get('Pss', 0) / 1024, 1),
+        'private_mb': round((fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024, 1)
+    }
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # Field 4 is the parent pid; the command name (field 2) may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def post_intent(base_url, disease):
+    payload = json.dumps({
+        'queryResult': {'intent': {'displayName': 'disease_info'}, 'parameters': {'disease': disease}, 'queryText': disease}
+    }).encode('utf-8')
+    request = urllib.request.Request(base_url + '/webhook', data=payload, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=30) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def run_server(preload, args):
+    base_url = f'http://127.0.0.1:{args.port}'
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0', LOG_LEVEL='WARNING',
+               WEB_CONCURRENCY=str(args.workers), PORT=str(args.port))
+    # Workers open a Dialogflow channel at boot; point it at a (lazy, never used) local address
+    env.setdefault('DIALOGFLOW_EMULATOR_HOST', '127.0.0.1:1')
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+               '--bind', f'127.0.0.1:{args.port}']
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(base_url + '/', timeout=60)
+        ready_seconds = time.perf_counter() - started
+        # Give every worker time to boot so the first replies below measure cold workers, not booting ones
+        deadline = time.time() + 30
+        while len(child_pids(server.pid)) < args.workers and time.time() < deadline:
+            time.sleep(0.1)
+        time.sleep(args.settle)
+
+        first = [post_intent(base_url, DISEASES[i % len(DISEASES)]) for i in range(args.workers * 2)]
+        warm = [post_intent(base_url, DISEASES[i % len(DISEASES)]) for i in range(args.requests)]
+
+        workers = [read_memory(pid) for pid in child_pids(server.pid)]
+        master = read_memory(server.pid)
+    finally:
+        stop_process(server)
+
+    count = max(len(workers), 1)
+    return {
+        'preload': preload,
+        'ready_seconds': round(ready_seconds, 3),
+        'first_response_ms': {
+            'max': round(max(first) * 1000, 2),
+            'mean': round(sum(first) / len(first) * 1000, 2)
+        },
+        'warm_response_ms': round(sorted(warm)[len(warm) // 2] * 1000, 2),
+        'master': master,
+        'workers': len(workers),
+        'worker_rss_mb': round(sum(w['rss_mb'] for w in workers) / count, 1),
+        'worker_private_mb': round(sum(w['private_mb'] for w in workers) / count, 1),
+        'pss_total_mb': round(master['pss_mb'] + sum(w['pss_mb'] for w in workers), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--requests', type=int, default=200, help='warm requests after the first ones')
+    parser.add_argument('--settle', type=float, default=1.0, help='seconds to wait after workers have forked')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = [run_server(preload, args) for preload in (False, True)]
+    print(f"{'preload':<8} {'ready s':>8} {'1st max ms':>11} {'1st mean ms':>12} {'warm p50 ms':>12} "
+          f"{'worker RSS':>11} {'worker priv':>12} {'pool PSS':>9}")
+    for result in results:
+        print(f"{str(result['preload']):<8} {result['ready_seconds']:>8} {result['first_response_ms']['max']:>11} "
+              f"{result['first_response_ms']['mean']:>12} {result['warm_response_ms']:>12} "
+              f"{result['worker_rss_mb']:>11} {result['worker_private_mb']:>12} {result['pss_total_mb']:>9}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
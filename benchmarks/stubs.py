@@ -0,0 +1,152 @@
+"""Local stand-ins for external services used by the benchmarks.
+
+Run a stub in its own process so its threads do not compete with the load
+generator for the GIL:
+
+    python -m benchmarks.stubs twilio --port 8766 --latency-ms 150
+    python -m benchmarks.stubs dialogflow --port 8767 --latency-ms 80
+
+The Twilio stub's ``GET /_received`` returns {recipient: [arrival unix
+times]} for reporting. Point the app at the Dialogflow stub with
+DIALOGFLOW_EMULATOR_HOST=127.0.0.1:8767.
+"""
+import argparse
+import concurrent.futures
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+
+class TwilioStub:
+    """Accepts Messages.json POSTs, records arrival time per recipient.
+
+    ``latency`` (seconds) is slept before answering to mimic api.twilio.com.
+    """
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.received = {}  # recipient -> [arrival time.time(), ...]
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; avoid Nagle + delayed-ACK stalls
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                recipient = form.get('To', [''])[0].replace('whatsapp:', '')
+                with stub._lock:
+                    stub.received.setdefault(recipient, []).append(time.time())
+                self._reply(201, {'sid': 'SMstub', 'status': 'queued'})
+
+            def do_GET(self):
+                if self.path != '/_received':
+                    self._reply(404, {})
+                    return
+                with stub._lock:
+                    received = dict(stub.received)
+                self._reply(200, received)
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.request_queue_size = 1024
+        self.url = f'http://{host}:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self):
+        with self._lock:
+            return sum(len(times) for times in self.received.values())
+
+
+class DialogflowStub:
+    """gRPC Sessions.DetectIntent stand-in.
+
+    Intents and parameters come from the app's own local classifier, with an
+    empty fulfillment text so replies go through the webhook logic just as
+    they do against the real agent.
+    """
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0, threads=64):
+        import grpc
+        from google.cloud.dialogflow_v2.types import DetectIntentRequest, DetectIntentResponse
+
+        self.latency = latency
+        self.server = grpc.server(concurrent.futures.ThreadPoolExecutor(max_workers=threads))
+        handler = grpc.method_handlers_generic_handler('google.cloud.dialogflow.v2.Sessions', {
+            'DetectIntent': grpc.unary_unary_rpc_method_handler(
+                self._detect_intent,
+                request_deserializer=DetectIntentRequest.deserialize,
+                response_serializer=DetectIntentResponse.serialize
+            )
+        })
+        self.server.add_generic_rpc_handlers((handler,))
+        self.port = self.server.add_insecure_port(f'{host}:{port}')
+        self.target = f'{host}:{self.port}'
+
+    def _detect_intent(self, request, context):
+        from google.cloud.dialogflow_v2.types import DetectIntentResponse, QueryResult, Intent
+        from utils.intent_classifier import classify_intent
+
+        if self.latency:
+            time.sleep(self.latency)
+        text = request.query_input.text.text
+        local = classify_intent(text)
+        return DetectIntentResponse(query_result=QueryResult(
+            query_text=text,
+            intent=Intent(display_name=local.intent or 'Default Fallback Intent'),
+            parameters=local.parameters,
+            intent_detection_confidence=local.confidence
+        ))
+
+    def start(self):
+        self.server.start()
+        return self
+
+    def stop(self):
+        self.server.stop(grace=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a benchmark stub server')
+    parser.add_argument('service', choices=['twilio', 'dialogflow'])
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    try:
+        if args.service == 'twilio':
+            TwilioStub(latency=args.latency_ms / 1000, port=args.port).server.serve_forever()
+        else:
+            DialogflowStub(latency=args.latency_ms / 1000, port=args.port).start().server.wait_for_termination()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
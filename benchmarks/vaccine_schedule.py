@@ -0,0 +1,72 @@
+"""Due-date evaluation for a register of children: per-child Python loop vs evaluate_batch.
+
+Generates random birth dates (0-17 years old) and a random set of recorded
+doses, evaluates the schedule both ways, checks that the two agree and
+reports children per second:
+
+    python -m benchmarks.vaccine_schedule --children 500000
+"""
+import argparse
+import datetime
+import json
+import time
+
+import numpy as np
+
+from utils.vaccine_schedule import STATUS_NAMES, dose_status, evaluate_batch, get_schedule
+
+
+def loop_statuses(doses, birth_dates, today, given):
+    """The per-child reference: one dose_status call per child and dose"""
+    rows = []
+    for child, date_of_birth in enumerate(birth_dates):
+        age_days = (today - date_of_birth).days
+        rows.append([dose_status(dose, age_days, given[child, column]) for column, dose in enumerate(doses)])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--children', type=int, default=200000)
+    parser.add_argument('--loop-children', type=int, default=20000, help='children for the (slow) Python loop')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    doses = get_schedule()
+    today = datetime.date.today()
+    births = np.datetime64(today, 'D') - rng.integers(0, 17 * 365, args.children).astype('timedelta64[D]')
+    given = rng.random((args.children, len(doses))) < 0.5
+
+    started = time.perf_counter()
+    result = evaluate_batch(births, today=today, given=given, doses=doses)
+    batch_seconds = time.perf_counter() - started
+
+    sample = min(args.loop_children, args.children)
+    sample_dates = births[:sample].astype(datetime.date).tolist()
+    started = time.perf_counter()
+    expected = loop_statuses(doses, sample_dates, today, given)
+    loop_seconds = time.perf_counter() - started
+    if not np.array_equal(np.array(expected, dtype=np.int8), result.status[:sample]):
+        raise SystemExit('evaluate_batch disagrees with dose_status')
+
+    results = {
+        'children': args.children,
+        'doses': len(doses),
+        'batch_seconds': round(batch_seconds, 4),
+        'batch_children_per_second': round(args.children / batch_seconds),
+        'loop_children': sample,
+        'loop_children_per_second': round(sample / loop_seconds),
+        'speedup': round((args.children / batch_seconds) / (sample / loop_seconds), 1),
+        'status_totals': {name: int(result.counts[name].sum()) for name in STATUS_NAMES},
+        'reminders_within_7_days': int(np.count_nonzero((result.next_due_days >= 0) & (result.next_due_days <= 7)))
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
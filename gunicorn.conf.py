@@ -0,0 +1,37 @@
+"""gunicorn settings for the sync (Flask) server.
+
+    gunicorn app:app
+
+preload_app (GUNICORN_PRELOAD, on by default) imports the app once in the
+master and builds the knowledge base, matchers and rendered replies there
+before forking, so workers share those pages instead of each building a
+private copy. Per-process resources are opened in each worker afterwards.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() not in ('0', 'false', 'no')
+
+
+def on_starting(server):
+    from utils.metrics import clear_metrics
+    clear_metrics()
+
+
+def when_ready(server):
+    # Runs in the master after preload and before the first fork
+    if server.cfg.preload_app:
+        from utils.preload import freeze_for_fork, warm_shared_state
+        warm_shared_state()
+        freeze_for_fork()
+
+
+def post_worker_init(worker):
+    from utils.preload import init_worker_resources, warm_shared_state
+    if not worker.cfg.preload_app:
+        warm_shared_state()
+    init_worker_resources()
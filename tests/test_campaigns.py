@@ -0,0 +1,84 @@
+import datetime
+
+import pytest
+
+from utils import campaigns
+from utils.campaigns import CampaignLedger, run_campaign
+
+pytest.importorskip('numpy')
+
+BIRTH = datetime.date(2026, 1, 1)
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Messages "sent" through a stubbed Twilio sender, as (phone, message)"""
+    messages = []
+    monkeypatch.setattr(campaigns, 'send_whatsapp_message', lambda phone, message: messages.append((phone, message)) or True)
+    return messages
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return CampaignLedger(str(tmp_path / 'ledger.sqlite3'))
+
+
+def write_registry(path, children):
+    path.write_text('phone,dob,language\n' + ''.join(f'{phone},{dob.isoformat()},en\n' for phone, dob in children))
+    return str(path)
+
+
+def run(registry, ledger, day, **kwargs):
+    kwargs.setdefault('senders', 1)
+    return run_campaign(registry, 'nightly', today=BIRTH + datetime.timedelta(days=day), ledger=ledger, **kwargs)
+
+
+def test_reused_campaign_name_sends_each_new_group(tmp_path, ledger, sent):
+    registry = write_registry(tmp_path / 'registry.csv', [('+911', BIRTH)])
+    days = {}
+    for day in range(35, 105):
+        before = len(sent)
+        run(registry, ledger, day)
+        if len(sent) > before:
+            days[day] = sent[-1][1]
+    # 6, 10 and 14 weeks, each CAMPAIGN_NOTICE_DAYS ahead; never a group twice
+    notice = campaigns.CAMPAIGN_NOTICE_DAYS
+    assert list(days) == [42 - notice, 70 - notice, 98 - notice]
+    assert '6 weeks' in days[42 - notice] and '10 weeks' in days[70 - notice] and '14 weeks' in days[98 - notice]
+    assert ledger.checkpoint('nightly') == 0
+
+
+def test_resume_after_crash_sends_each_reminder_once(tmp_path, ledger, monkeypatch):
+    children = [(f'+91{i}', BIRTH) for i in range(5)]
+    registry = write_registry(tmp_path / 'registry.csv', children)
+    sent = []
+
+    def crash_on_third(phone, message):
+        if phone == '+912':
+            raise RuntimeError('killed')
+        sent.append(phone)
+        return True
+
+    monkeypatch.setattr(campaigns, 'send_whatsapp_message', crash_on_third)
+    with pytest.raises(RuntimeError):
+        run(registry, ledger, 42, chunk_rows=2)
+    assert ledger.checkpoint('nightly') == 2
+
+    monkeypatch.setattr(campaigns, 'send_whatsapp_message', lambda phone, message: sent.append(phone) or True)
+    stats = run(registry, ledger, 42, chunk_rows=2)
+    # The interrupted send stays claimed rather than risk a duplicate
+    assert sorted(sent) == ['+910', '+911', '+913', '+914']
+    assert stats['read'] == 3
+    assert ledger.status_counts('nightly') == {'sent': 4, 'sending': 1}
+
+
+def test_failed_send_is_retried_by_a_later_run(tmp_path, ledger, monkeypatch):
+    registry = write_registry(tmp_path / 'registry.csv', [('+911', BIRTH)])
+    monkeypatch.setattr(campaigns, 'send_whatsapp_message', lambda phone, message: False)
+    assert run(registry, ledger, 42)['failed'] == 1
+    assert ledger.status_counts('nightly') == {}
+
+    sent = []
+    monkeypatch.setattr(campaigns, 'send_whatsapp_message', lambda phone, message: sent.append(message) or True)
+    assert run(registry, ledger, 43)['sent'] == 1
+    assert '6 weeks' in sent[0]
@@ -0,0 +1,76 @@
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def make_breaker(**kwargs):
+    kwargs.setdefault('window', 4)
+    kwargs.setdefault('min_calls', 4)
+    kwargs.setdefault('failure_ratio', 0.5)
+    kwargs.setdefault('slow_call_seconds', 1.0)
+    kwargs.setdefault('open_seconds', 30.0)
+    return CircuitBreaker('test', **kwargs)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(False, ticket=breaker.allow())
+    assert breaker.state == OPEN
+
+
+def end_open_period(breaker):
+    breaker._opened_at -= breaker.open_seconds
+
+
+def test_opens_once_enough_calls_fail_or_are_slow():
+    breaker = make_breaker()
+    for success, duration in ((True, 0.1), (False, 0.1), (True, 0.1)):
+        breaker.record(success, duration, breaker.allow())
+    assert breaker.state == CLOSED  # fewer than min_calls
+    breaker.record(True, 2.0, breaker.allow())  # slow counts as bad
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_admits_one_probe_and_a_good_one_closes():
+    breaker = make_breaker()
+    trip(breaker)
+    end_open_period(breaker)
+    probe = breaker.allow()
+    assert probe and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True, 0.1, probe)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()['recent_calls'] == 0
+
+
+def test_bad_probe_reopens():
+    breaker = make_breaker()
+    trip(breaker)
+    end_open_period(breaker)
+    breaker.record(False, 0.1, breaker.allow())
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_slow_call_from_before_the_trip_does_not_decide_the_probe():
+    breaker = make_breaker()
+    slow = breaker.allow()
+    trip(breaker)
+    end_open_period(breaker)
+    probe = breaker.allow()
+    # The old call finishes fine while the probe is out: it neither closes the breaker nor frees the probe slot
+    breaker.record(True, 0.1, slow)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(False, 0.1, probe)
+    assert breaker.state == OPEN
+
+
+def test_stale_failure_does_not_reopen_a_closed_breaker():
+    breaker = make_breaker(min_calls=1, window=1)
+    slow = breaker.allow()
+    breaker.record(False, ticket=breaker.allow())
+    end_open_period(breaker)
+    breaker.record(True, 0.1, breaker.allow())
+    assert breaker.state == CLOSED
+    breaker.record(False, 5.0, slow)
+    assert breaker.state == CLOSED
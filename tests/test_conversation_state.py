@@ -0,0 +1,65 @@
+import pytest
+
+from utils import conversation_state
+from utils.conversation_state import (
+    EMPTY_STATE,
+    MemoryConversationStore,
+    SQLiteConversationStore,
+    resolve_language
+)
+
+HINDI = EMPTY_STATE._replace(language='hindi', intent='disease_info', entity='dengue')
+
+
+@pytest.mark.parametrize('text, state, language', [
+    ('what about in hindi', EMPTY_STATE, 'hindi'),
+    ('डेंगू क्या है', EMPTY_STATE, 'hindi'),
+    ('dengue', EMPTY_STATE, 'english'),
+    # A confident English message replaces a remembered Hindi/Odia preference
+    ('my baby is 10 weeks old vaccine', HINDI, 'english'),
+    ('in english please', HINDI, 'english'),
+    # Romanized or wordless messages keep it
+    ('bukhar', HINDI, 'hindi'),
+    ('10', HINDI, 'hindi'),
+    ('kemiti', EMPTY_STATE._replace(language='odia'), 'odia'),
+    ('ଜ୍ୱର', HINDI, 'odia'),
+])
+def test_resolve_language(text, state, language):
+    assert resolve_language(text, state) == language
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store_and_clock(request, tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation_state.time, 'time', clock)
+    monkeypatch.setattr(conversation_state.time, 'monotonic', clock)
+    if request.param == 'memory':
+        return MemoryConversationStore(ttl=100), clock
+    return SQLiteConversationStore(str(tmp_path / 'conversations.sqlite3'), ttl=100), clock
+
+
+def test_entries_expire_after_the_ttl(store_and_clock):
+    store, clock = store_and_clock
+    store.put('+911', HINDI)
+    clock.now += 99
+    assert store.get('+911') == HINDI
+    clock.now += 101
+    assert store.get('+911') is None
+
+
+def test_reads_renew_the_ttl(store_and_clock):
+    # An active conversation whose state never changes is not saved again
+    store, clock = store_and_clock
+    store.put('+911', HINDI)
+    for _ in range(5):
+        clock.now += 60
+        assert store.get('+911') == HINDI
+    assert len(store) == 1
@@ -0,0 +1,55 @@
+import time
+import types
+
+import pytest
+
+from utils import dialogflow_client
+from utils.circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def fresh_client_state(monkeypatch):
+    for name in ('_client', '_client_pid', '_consecutive_failures', '_build_failures', '_next_build_at'):
+        monkeypatch.setattr(dialogflow_client, name, getattr(dialogflow_client, name))
+    monkeypatch.setattr(dialogflow_client, 'dialogflow_breaker', CircuitBreaker('test'))
+    dialogflow_client.reset_dialogflow_client()
+    dialogflow_client._build_succeeded()
+
+
+def test_failed_build_is_not_retried_on_every_message(monkeypatch):
+    builds = []
+
+    def no_credentials():
+        builds.append(None)
+        raise FileNotFoundError('credentials.json')
+
+    monkeypatch.setattr(dialogflow_client, '_build_client', no_credentials)
+    for _ in range(5):
+        assert dialogflow_client.get_dialogflow_client() is None
+    assert len(builds) == 1
+    # Once the backoff has passed the build is tried again
+    dialogflow_client._next_build_at = 0.0
+    assert dialogflow_client.get_dialogflow_client() is None
+    assert len(builds) == 2
+    assert dialogflow_client.dialogflow_health()['build_retry_in_seconds'] > dialogflow_client.DIALOGFLOW_INIT_RETRY_SECONDS
+
+
+def test_replaced_client_is_closed_only_after_in_flight_calls(monkeypatch):
+    closed = []
+
+    def build():
+        built = types.SimpleNamespace()
+        built.transport = types.SimpleNamespace(close=lambda: closed.append(built))
+        return built
+
+    monkeypatch.setattr(dialogflow_client, '_build_client', build)
+    monkeypatch.setattr(dialogflow_client, 'RETIRED_CLIENT_CLOSE_AFTER', 0.1)
+    client = dialogflow_client.get_dialogflow_client()
+    for _ in range(dialogflow_client.MAX_CONSECUTIVE_FAILURES):
+        dialogflow_client.record_failure()
+    # New calls get a fresh client straight away; calls still running on the old one keep their channel
+    replacement = dialogflow_client.get_dialogflow_client()
+    assert replacement is not client
+    assert closed == []
+    time.sleep(0.3)
+    assert closed == [client]
@@ -0,0 +1,44 @@
+import pytest
+
+from benchmarks.emergency import check, load_corpus
+from utils import emergency
+from utils.emergency import EmergencyEngine, assess_emergency, extract_temperature, get_emergency_engine
+
+
+def test_engine_matches_the_labelled_corpus():
+    engine = get_emergency_engine()
+    assert check(load_corpus(), lambda text, disease: engine.assess(text, disease)) == []
+
+
+@pytest.mark.parametrize('text, condition', [
+    ('severe pain in stomach', 'severe_stomach_pain'),
+    ('सांस नहीं आ रही', 'difficulty_breathing'),
+    ('shortness of breath since morning', 'difficulty_breathing'),
+    ('what is dengue', None),
+    ('', None),
+])
+def test_messages_without_digits_only_check_keywords(text, condition):
+    assert assess_emergency(text) == condition
+    assert extract_temperature(text) is None
+
+
+def test_temperature_outranks_keywords():
+    assert assess_emergency('stomach pain and fever 104') == 'fever_above_103'
+    assert assess_emergency('stomach pain and fever 101') == 'severe_stomach_pain'
+
+
+def test_each_threshold_reports_its_own_condition(monkeypatch):
+    monkeypatch.setitem(emergency.TEMPERATURE_CONDITIONS, 'malaria', 'malaria_high_fever')
+    engine = EmergencyEngine({
+        'fever': {'emergency_threshold': 103},
+        'malaria': {'emergency_threshold': 102},
+    })
+    assert engine.assess('malaria fever 102.5', 'malaria').condition == 'malaria_high_fever'
+    assert engine.assess('fever 102.5', 'fever').condition is None
+    assert engine.assess('fever 104', 'dengue').condition == 'fever_above_103'
+
+
+def test_threshold_without_a_condition_key_is_ignored():
+    engine = EmergencyEngine({'typhoid': {'emergency_threshold': 102}})
+    assert engine.threshold_for('typhoid') == (None, None)
+    assert engine.assess('fever 104', 'typhoid') == (None, 104.0)
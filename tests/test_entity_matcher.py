@@ -0,0 +1,82 @@
+import pytest
+
+from utils.entity_matcher import (
+    SCHEDULE_KEY, VACCINE_CONTEXT, EntityMatcher, get_disease_matcher, get_vaccine_matcher, vaccine_synonyms
+)
+from utils.knowledge_base import get_knowledge_base
+
+
+def test_longest_phrase_wins():
+    matcher = EntityMatcher({'dpt': ['dpt'], 'dpt_booster_2': ['dpt booster 2'], 'hep': ['hepatitis'],
+                             'hep_b': ['hepatitis b']})
+    assert matcher.match('when is dpt booster 2 given') == 'dpt_booster_2'
+    assert matcher.match('dpt') == 'dpt'
+    assert matcher.match('hepatitis b vaccine') == 'hep_b'
+    assert matcher.match('hepatitis  b') == 'hep_b'  # extra whitespace between words
+
+
+def test_specific_vaccine_beats_the_schedule():
+    assert get_vaccine_matcher().match('polio vaccine') == 'opv'
+    assert get_vaccine_matcher().match('vaccine schedule') == SCHEDULE_KEY
+    assert get_vaccine_matcher().match('dpt booster 2') == 'dpt_booster_2'
+
+
+@pytest.mark.parametrize('text', ['outbreak', 'routine checkup', 'stb', 'tbs'])
+def test_short_phrases_do_not_match_inside_words(text):
+    assert get_disease_matcher().match(text) is None
+
+
+def test_short_phrases_match_as_whole_words():
+    assert get_disease_matcher().match('tb') == 'tuberculosis'
+    assert get_disease_matcher().match('TB ka ilaj') == 'tuberculosis'
+    assert get_disease_matcher().match('uti.') == 'urinary_tract_infection'
+
+
+@pytest.mark.parametrize('text', ['Mr. Sharma has fever', 'mr sharma ko bukhar hai', 'tell mr patel'])
+def test_short_vaccine_names_need_vaccine_context(text):
+    assert get_vaccine_matcher().match(text) is None
+
+
+@pytest.mark.parametrize('text, vaccine', [
+    ('mr', 'mr_vaccine'),
+    ('MR?', 'mr_vaccine'),
+    ('bcg and opv', 'bcg'),
+    ('mr vaccine', 'mr_vaccine'),
+    ('mr kab lagta hai', 'mr_vaccine'),
+    ('when is mr given', 'mr_vaccine'),
+    ('td injection', 'td_vaccine'),
+    ('je ka टीका', 'je_vaccine'),
+    ('measles', 'mr_vaccine'),
+])
+def test_short_vaccine_names_in_context(text, vaccine):
+    assert get_vaccine_matcher().match(text) == vaccine
+
+
+def test_disease_in_a_sentence_with_mr_is_still_found():
+    assert get_disease_matcher().match('Mr. Sharma has fever') == 'fever'
+
+
+@pytest.mark.parametrize('text, disease, vaccine', [
+    ('पोलियो', None, 'opv'),
+    ('ପୋଲିଓ', None, 'opv'),
+    ('खसरा का टीका', None, 'mr_vaccine'),
+    ('ଡେଙ୍ଗୁ', 'dengue', None),
+    ('मुझे बुखार है', 'fever', None),
+])
+def test_multilingual_synonyms(text, disease, vaccine):
+    assert get_disease_matcher().match(text) == disease
+    assert get_vaccine_matcher().match(text) == vaccine
+
+
+def test_zero_width_joiners_are_ignored():
+    matcher = EntityMatcher({'cancer': ['କ୍ୟାନ୍ସର']})
+    assert matcher.match('କ୍‍ୟାନ୍ସର') == 'cancer'
+    assert matcher.lookup('କ୍ୟାନ୍‌ସର') == 'cancer'
+
+
+def test_matcher_from_index_behaves_like_a_built_one():
+    synonyms = vaccine_synonyms(get_knowledge_base().snapshot().vaccines)
+    built = EntityMatcher(synonyms, fallback_keys=(SCHEDULE_KEY,), context=VACCINE_CONTEXT)
+    loaded = EntityMatcher.from_index(built.to_index(), fallback_keys=(SCHEDULE_KEY,), context=VACCINE_CONTEXT)
+    for text in ['Mr. Sharma has fever', 'mr', 'polio vaccine', 'baby ka schedule', 'पोलियो']:
+        assert loaded.find_all(text) == built.find_all(text)
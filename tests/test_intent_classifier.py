@@ -0,0 +1,98 @@
+import pytest
+
+import app
+from utils import intent_classifier
+from utils.intent_classifier import NaiveBayesIntentModel, classify_intent
+
+
+@pytest.fixture
+def no_model(monkeypatch):
+    monkeypatch.setattr(intent_classifier, '_model', None)
+    monkeypatch.setattr(intent_classifier, '_model_loaded', True)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    trained = NaiveBayesIntentModel.train([
+        ('hello there', 'Default Welcome Intent'),
+        ('hi friend', 'welcome'),
+        ('how to stay healthy', 'health_tips'),
+        ('healthy food tips', 'health_tips'),
+        ('dengue symptoms', 'disease.info'),
+        ('malaria treatment', 'disease.info'),
+    ])
+    monkeypatch.setattr(intent_classifier, '_model', trained)
+    monkeypatch.setattr(intent_classifier, '_model_loaded', True)
+    return trained
+
+
+@pytest.mark.parametrize('text, intent, parameters', [
+    ('dengue', 'disease_info', {'disease': 'dengue'}),
+    ('डेंगू के लक्षण', 'disease_info', {'disease': 'dengue'}),
+    ('bcg vaccine', 'vaccine_info', {'vaccine': 'bcg'}),
+    ('hello', 'greeting', {}),
+])
+def test_clear_messages_reach_the_threshold(no_model, text, intent, parameters):
+    local = classify_intent(text)
+    assert (local.intent, local.parameters) == (intent, parameters)
+    assert local.confidence >= intent_classifier.LOCAL_INTENT_THRESHOLD
+
+
+@pytest.mark.parametrize('text', [
+    'my neighbour said something about dengue yesterday in the market',
+    'dengue and bcg',
+    'hepatitis',
+])
+def test_unclear_messages_stay_below_the_threshold(no_model, text):
+    assert classify_intent(text).confidence < intent_classifier.LOCAL_INTENT_THRESHOLD
+
+
+@pytest.mark.parametrize('text', ['', 'what about in hindi', None])
+def test_nothing_recognised_has_no_intent(no_model, text):
+    assert classify_intent(text) == (None, {}, 0.0)
+
+
+def test_emergency_keyword_decides_the_intent(no_model):
+    local = classify_intent('severe stomach pain with fever')
+    assert local.intent == 'emergency'
+    assert local.parameters == {'disease': 'fever'}
+
+
+def test_model_alone_only_answers_small_talk(model):
+    assert classify_intent('hi friend').intent == 'greeting'
+    assert classify_intent('healthy food').intent == 'general_health'
+    local = classify_intent('malaria')
+    assert local.intent == 'disease_info' and local.confidence >= 0.8
+    # Without an entity the model's disease guess is never confident enough to answer
+    assert classify_intent('treatment symptoms').confidence == 0.0
+
+
+def test_model_disagreement_lowers_confidence(model, monkeypatch):
+    monkeypatch.setattr(model, 'predict', lambda text: ('greeting', 0.9))
+    assert classify_intent('dengue').confidence == pytest.approx(0.1)
+    monkeypatch.setattr(model, 'predict', lambda text: ('disease_info', 0.9))
+    assert classify_intent('my neighbour said something about dengue yesterday in the market').confidence == 0.9
+
+
+def test_broken_model_file_is_ignored(monkeypatch, tmp_path):
+    path = tmp_path / 'intent_model.json'
+    path.write_text('{not json')
+    monkeypatch.setattr(intent_classifier, 'LOCAL_INTENT_MODEL', str(path))
+    monkeypatch.setattr(intent_classifier, '_model', None)
+    monkeypatch.setattr(intent_classifier, '_model_loaded', False)
+    assert intent_classifier.get_intent_model() is None
+    assert classify_intent('dengue').intent == 'disease_info'
+
+
+def test_below_threshold_falls_back_to_dialogflow(no_model, monkeypatch):
+    monkeypatch.setattr(app, 'LOCAL_INTENT_SHADOW_RATE', 0)
+    local, reply = app.try_local_reply('dengue', 'english')
+    assert local.intent == 'disease_info' and reply
+    monkeypatch.setattr(app, 'LOCAL_INTENT_THRESHOLD', 1.01)
+    local, reply = app.try_local_reply('dengue', 'english')
+    assert local.intent == 'disease_info' and reply is None
+
+
+def test_shadowed_messages_go_to_dialogflow(no_model, monkeypatch):
+    monkeypatch.setattr(app, 'LOCAL_INTENT_SHADOW_RATE', 1)
+    assert app.try_local_reply('dengue', 'english')[1] is None
@@ -0,0 +1,58 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from utils import kb_snapshot, knowledge_base
+from utils.kb_snapshot import build_snapshot
+from utils.knowledge_base import DATA_DIR, DATA_FILES, KnowledgeBase
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for filename in DATA_FILES.values():
+        shutil.copy(os.path.join(DATA_DIR, filename), tmp_path / filename)
+    build_snapshot(str(tmp_path), str(tmp_path / 'kb.kbs'))
+    return tmp_path
+
+
+def load(data_dir):
+    return KnowledgeBase(str(data_dir), check_interval=0, snapshot_path=str(data_dir / 'kb.kbs'))
+
+
+def test_fresh_image_is_used_without_hashing_the_json(data_dir, monkeypatch):
+    def no_hashing(*args):
+        raise AssertionError('sources were hashed')
+
+    monkeypatch.setattr(kb_snapshot.hashlib, 'sha1', no_hashing)
+    snapshot = load(data_dir).snapshot()
+    assert snapshot.source == 'snapshot'
+    assert 'malaria' in snapshot.diseases
+
+
+def test_touched_but_unchanged_file_still_matches(data_dir):
+    path = data_dir / 'diseases.json'
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert load(data_dir).snapshot().source == 'snapshot'
+
+
+def test_edited_file_makes_the_image_stale(data_dir):
+    path = data_dir / 'phrases.json'
+    path.write_text(path.read_text(encoding='utf-8') + '\n', encoding='utf-8')
+    assert load(data_dir).snapshot().source == 'json'
+
+
+def test_reload_unmaps_the_replaced_image(data_dir, monkeypatch):
+    monkeypatch.setattr(knowledge_base, 'KB_SNAPSHOT_CLOSE_DELAY', 0)
+    kb = load(data_dir)
+    first = kb.snapshot()
+    assert first.vaccines['bcg']
+    second = kb.reload(force=True)
+    assert second.image is not first.image
+    deadline = time.monotonic() + 5
+    while not first.image.closed:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert not second.image.closed
+    assert second.vaccines['bcg']
@@ -0,0 +1,26 @@
+import pytest
+
+from utils.language_utils import extract_child_age_weeks
+
+
+@pytest.mark.parametrize('text, weeks', [
+    ('my baby is 10 weeks old', 10.0),
+    ('10 weeks old baby, which vaccines?', 10.0),
+    ('my 2 year old son', 104.4),
+    ('मेरा बच्चा 6 महीने का है', 26.1),
+    ('मेरे बच्चे की उम्र १० हफ्ते है', 10.0),
+    ('୬ ମାସର ଶିଶୁ', 26.1),
+])
+def test_child_age(text, weeks):
+    assert extract_child_age_weeks(text) == weeks
+
+
+@pytest.mark.parametrize('text', [
+    'I am 28 years old, which vaccine for my baby?',
+    'fever for 3 weeks',
+    'my baby has had fever for 3 weeks',
+    'my son is 25 years old',
+    '',
+])
+def test_not_a_child_age(text):
+    assert extract_child_age_weeks(text) is None
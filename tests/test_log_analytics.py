@@ -0,0 +1,78 @@
+import json
+import logging
+import time
+
+import pytest
+
+from utils import structured_logging
+from utils.conversation_state import EMPTY_STATE
+from utils.log_analytics import analyze_lines, build_report
+
+
+@pytest.fixture
+def app_log_lines(caplog, monkeypatch):
+    """Format the app's "Message handled" lines the way production writes them"""
+    import app
+
+    monkeypatch.setattr(structured_logging, 'LOG_REDACT', True)
+    monkeypatch.setattr(app, 'save_conversation', lambda *args: None)
+    formatter = structured_logging.JsonFormatter()
+
+    def handle(message, intent=None, parameters=None, language='english'):
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger='app'):
+            app.remember_turn('+919876543210', EMPTY_STATE, language, message, intent, parameters, time.monotonic())
+        record = next(record for record in caplog.records if record.getMessage() == 'Message handled')
+        return formatter.format(record)
+
+    return handle
+
+
+def test_redacted_lines_report_what_the_app_derived(app_log_lines):
+    lines = [
+        app_log_lines('मुझे मलेरिया है', 'disease_info', {'disease': 'मलेरिया'}, 'hindi'),
+        app_log_lines('ମୋର ଜ୍ୱର ୧୦୪', 'disease_info', {'disease': 'ଜ୍ୱର'}, 'odia'),
+        app_log_lines('polio vaccine', 'vaccine_info', {'vaccine': 'polio'}),
+    ]
+    assert all(json.loads(line)['text'].endswith(' chars>') for line in lines)
+
+    report = build_report(analyze_lines(lines))
+    assert report['redacted_texts'] == 3
+    assert report['messages_analyzed'] == 3
+    assert report['diseases'] == {'malaria': 1, 'fever': 1, 'none': 1}
+    assert report['vaccines'] == {'opv': 1}
+    assert report['detected_languages'] == {'hindi': 1, 'odia': 1, 'english': 1}
+    assert report['emergency_conditions'] == {'fever_above_103': 1}
+    assert report['language_mismatch_rate'] == 0.0
+
+
+def test_redacted_text_is_never_analyzed():
+    line = json.dumps({'msg': 'Message handled', 'text': '<17 chars>', 'intent': 'fallback', 'language': 'hindi'})
+    report = build_report(analyze_lines([line]))
+    assert report['messages'] == 1
+    assert report['redacted_texts'] == 1
+    assert report['messages_analyzed'] == 0
+    assert report['diseases'] == {}
+    assert report['language_mismatch_rate'] is None
+
+
+def test_plain_text_is_analyzed():
+    lines = [json.dumps({'text': 'मुझे डेंगू है', 'language': 'hindi', 'latency_ms': 12.5}), 'not json']
+    report = build_report(analyze_lines(lines))
+    assert report['messages_analyzed'] == 1
+    assert report['invalid_lines'] == 1
+    assert report['diseases'] == {'dengue': 1}
+    assert report['latency_ms']['count'] == 1
+
+
+def test_sampled_out_turns_skip_the_derived_fields(caplog, monkeypatch):
+    import app
+
+    monkeypatch.setattr(structured_logging, 'LOG_INFO_SAMPLE_RATE', 0.0)
+    monkeypatch.setattr(app, 'save_conversation', lambda *args: None)
+    assessed = []
+    monkeypatch.setattr(app, 'assess_emergency', lambda text: assessed.append(text))
+    with caplog.at_level(logging.INFO, logger='app'), structured_logging.request_context('SM1'):
+        app.remember_turn('+919876543210', EMPTY_STATE, 'english', 'fever 104', 'disease_info', {'disease': 'fever'})
+    assert assessed == []
+    assert not any(record.getMessage() == 'Message handled' for record in caplog.records)
@@ -0,0 +1,79 @@
+import pytest
+
+import app
+from utils import message_dedup
+from utils.message_dedup import MemoryDedupStore, SQLiteDedupStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(message_dedup.time, 'time', clock)
+    monkeypatch.setattr(message_dedup.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, clock):
+    if request.param == 'memory':
+        return MemoryDedupStore(ttl=60)
+    return SQLiteDedupStore(str(tmp_path / 'dedup.sqlite3'), ttl=60)
+
+
+def test_second_sighting_is_a_duplicate_until_the_ttl_ends(store, clock):
+    assert store.mark_if_new('SM1')
+    assert not store.mark_if_new('SM1')
+    assert store.mark_if_new('SM2')
+    clock.now += 61
+    assert store.mark_if_new('SM1')
+    assert not store.mark_if_new('SM1')
+
+
+def test_forget_lets_the_message_through_again(store):
+    assert store.mark_if_new('SM1')
+    store.forget('SM1')
+    assert store.mark_if_new('SM1')
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path, clock):
+    path = str(tmp_path / 'dedup.sqlite3')
+    first, second = SQLiteDedupStore(path, ttl=60), SQLiteDedupStore(path, ttl=60)
+    assert first.mark_if_new('SM1')
+    assert not second.mark_if_new('SM1')
+
+
+def test_memory_store_keeps_at_most_max_entries(clock):
+    store = MemoryDedupStore(ttl=60, max_entries=2)
+    for message_id in ('SM1', 'SM2', 'SM3'):
+        assert store.mark_if_new(message_id)
+    # The oldest entry was evicted, the newer ones are still remembered
+    assert store.mark_if_new('SM1')
+    assert not store.mark_if_new('SM3')
+
+
+def test_failed_webhook_does_not_swallow_twilios_retry(monkeypatch):
+    monkeypatch.setattr(message_dedup, '_store', MemoryDedupStore(ttl=60))
+    queued = []
+
+    def enqueue(to_number, body):
+        if not queued:
+            queued.append(None)
+            raise RuntimeError('queue broken')
+        queued.append(to_number)
+        return True
+
+    monkeypatch.setattr(app, 'enqueue_whatsapp_message', enqueue)
+    client = app.app.test_client()
+    form = {'MessageSid': 'SM42', 'From': 'whatsapp:+911', 'Body': 'dengue'}
+    assert client.post('/whatsapp', data=form).status_code == 500
+    assert client.post('/whatsapp', data=form).status_code == 200
+    assert client.post('/whatsapp', data=form).status_code == 200
+    assert queued == [None, '+911']
@@ -0,0 +1,103 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    """Metrics enabled with an empty registry writing to a temporary METRICS_DIR"""
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, '_registry', {})
+    monkeypatch.setattr(metrics, '_flusher_pid', os.getpid())  # no background flush thread
+    return tmp_path
+
+
+def exited_pid():
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+def write_worker(directory, pid, data):
+    (directory / f'metrics-{pid}.json').write_text(json.dumps(data))
+
+
+def samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_values_of_all_worker_files_are_merged(registry):
+    requests = metrics.counter('test_requests_total', 'Requests', ['outcome'])
+    latency = metrics.histogram('test_seconds', 'Latency', buckets=(0.1, 1.0))
+    requests.inc('ok')
+    requests.inc('failed', amount=2)
+    latency.observe(0.05)
+    write_worker(registry, 1001, {
+        'test_requests_total': {'["ok"]': 3},
+        'test_seconds': {'[]': [0, 2, 1, 3.5]},
+    })
+    write_worker(registry, 1002, {'test_requests_total': {'["ok"]': 5, '["timeout"]': 1}})
+
+    merged = samples(metrics.render_metrics())
+    assert merged['test_requests_total{outcome="ok"}'] == '9'
+    assert merged['test_requests_total{outcome="failed"}'] == '2'
+    assert merged['test_requests_total{outcome="timeout"}'] == '1'
+    assert merged['test_seconds_bucket{le="0.1"}'] == '1'
+    assert merged['test_seconds_bucket{le="1.0"}'] == '3'
+    assert merged['test_seconds_bucket{le="+Inf"}'] == '4'
+    assert merged['test_seconds_count'] == '4'
+    assert float(merged['test_seconds_sum']) == pytest.approx(3.55)
+
+
+def test_gauges_are_per_live_worker(registry):
+    state = metrics.gauge('test_state', 'State', ['breaker'])
+    state.set(2, 'dialogflow')
+    dead = exited_pid()
+    write_worker(registry, os.getppid(), {'test_state': {'["dialogflow"]': 1}})
+    write_worker(registry, dead, {'test_state': {'["dialogflow"]': 0}})
+
+    merged = samples(metrics.render_metrics())
+    assert merged[f'test_state{{breaker="dialogflow",pid="{os.getpid()}"}}'] == '2'
+    assert merged[f'test_state{{breaker="dialogflow",pid="{os.getppid()}"}}'] == '1'
+    assert not any(f'pid="{dead}"' in key for key in merged)
+
+
+def test_counters_of_exited_workers_still_count(registry):
+    requests = metrics.counter('test_requests_total', 'Requests')
+    requests.inc()
+    write_worker(registry, exited_pid(), {'test_requests_total': {'[]': 4}})
+    assert samples(metrics.render_metrics())['test_requests_total'] == '5'
+
+
+def test_unreadable_and_unknown_files_are_skipped(registry):
+    metrics.counter('test_requests_total', 'Requests').inc()
+    (registry / 'metrics-1003.json').write_text('{truncated')
+    (registry / 'metrics-abc.json').write_text('{}')
+    write_worker(registry, 1004, {'test_removed_metric': {'[]': 7}})
+    text = metrics.render_metrics()
+    assert samples(text)['test_requests_total'] == '1'
+    assert 'test_removed_metric' not in text
+    assert '# TYPE test_requests_total counter' in text
+
+
+def test_clear_metrics_removes_worker_files(registry):
+    write_worker(registry, 1001, {})
+    (registry / 'metrics-1002.json.tmp').write_text('')
+    (registry / 'other.json').write_text('')
+    metrics.clear_metrics()
+    assert sorted(os.listdir(registry)) == ['other.json']
+
+
+def test_disabled_metrics_are_no_ops(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+    metric = metrics.counter('test_requests_total', 'Requests')
+    metric.inc('ok')
+    with metric.time():
+        pass
+    assert metric is metrics.histogram('test_seconds', 'Latency')
@@ -0,0 +1,71 @@
+import re
+import unicodedata
+
+import pytest
+
+from utils.segmentation import graphemes, message_segments, segmented, split_message, text_length, with_segments
+
+
+def squeeze(text):
+    return re.sub(r'\s+', '', text)
+
+
+def test_text_length_counts_utf16_units():
+    assert text_length('abc') == 3
+    assert text_length('ज्वर') == 4
+    assert text_length('🙂') == 2
+    assert text_length('👍🏽') == 4
+
+
+def test_short_text_is_one_segment():
+    assert split_message('hello') == ('hello',)
+    assert split_message('x' * 1600) == ('x' * 1600,)
+
+
+@pytest.mark.parametrize('text', [
+    '\n\n'.join(['Section %d. ' % i + 'word ' * 150 for i in range(6)]),
+    ' '.join(['डेंगू के लक्षण। तेज बुखार और सिरदर्द।'] * 120),
+    ' '.join(['ଡେଙ୍ଗୁ ଜ୍ୱର।'] * 300),
+    '🙂' * 1000,
+])
+def test_segments_fit_the_limit_and_rejoin_without_loss(text):
+    segments = split_message(text)
+    assert len(segments) > 1
+    assert all(text_length(segment) <= 1600 for segment in segments)
+    assert squeeze(''.join(segments)) == squeeze(text)
+
+
+def test_emoji_are_not_split_into_surrogate_halves():
+    segments = split_message('🙂' * 1000)
+    assert [len(segment) for segment in segments] == [800, 200]
+
+
+def test_no_split_inside_a_grapheme_cluster():
+    # No spaces, so the split falls to grapheme clusters; every conjunct,
+    # vowel sign and ZWJ emoji sequence must stay in one segment
+    clusters = ['क्ष', 'ज्ञ', 'ि', 'ଡେ', 'ଙ୍ଗୁ', '👨‍👩‍👧', '👍🏽']
+    text = ''.join(clusters[index % len(clusters)] for index in range(400))
+    segments = split_message(text, limit=37)
+    assert ''.join(segments) == text
+    assert all(text_length(segment) <= 37 for segment in segments)
+    for segment in segments:
+        assert unicodedata.category(segment[0]) not in ('Mn', 'Mc') and segment[0] not in '\u200d\U0001f3fd'
+        assert unicodedata.combining(segment[-1]) != 9 and segment[-1] != '\u200d'
+
+
+def test_graphemes_keep_marks_with_their_letter():
+    assert graphemes('क्षि') == ['क्षि']
+    assert graphemes('ଡେଙ୍ଗୁ') == ['ଡେ', 'ଙ୍ଗୁ']
+    assert graphemes('a👍🏽b') == ['a', '👍🏽', 'b']
+
+
+def test_segmented_renderer_attaches_its_segments():
+    @segmented
+    def render(length):
+        return 'word ' * length
+
+    text = render(500)
+    assert text == 'word ' * 500
+    assert message_segments(text) is text.segments
+    assert message_segments('plain') == ('plain',)
+    assert with_segments('short').segments == ('short',)
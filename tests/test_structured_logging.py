@@ -0,0 +1,94 @@
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+from utils import structured_logging
+from utils.structured_logging import JsonFormatter, NonBlockingQueueHandler, redact_phone, request_context
+
+
+@pytest.fixture
+def redact(monkeypatch):
+    monkeypatch.setattr(structured_logging, 'LOG_REDACT', True)
+
+
+def record(msg, args=(), level=logging.INFO, **extra):
+    entry = logging.LogRecord('app', level, __file__, 1, msg, args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def formatted(entry):
+    return json.loads(JsonFormatter().format(entry))
+
+
+@pytest.mark.parametrize('text, masked', [
+    ('whatsapp:+919876543210', 'whatsapp:+********3210'),
+    ('call 98765-43210 now', 'call ******3210 now'),
+    ('+91 98765 43210', '+********3210'),
+    ('age 104 days, 2024', 'age 104 days, 2024'),
+])
+def test_phone_numbers_keep_only_the_last_four_digits(text, masked):
+    assert redact_phone(text) == masked
+
+
+def test_message_and_fields_are_redacted(redact):
+    entry = formatted(record('Reply to %s', ('whatsapp:+919876543210',),
+                             to='+919876543210', body='I have fever', reply='Drink water', chars=12))
+    assert entry['msg'] == 'Reply to whatsapp:+********3210'
+    assert entry['to'] == '+********3210'
+    assert entry['body'] == '<12 chars>'
+    assert entry['reply'] == '<11 chars>'
+    assert entry['chars'] == 12
+    assert structured_logging.is_redacted(entry['body'])
+
+
+def test_nothing_is_redacted_when_turned_off(monkeypatch):
+    monkeypatch.setattr(structured_logging, 'LOG_REDACT', False)
+    entry = formatted(record('From %s', ('+919876543210',), body='I have fever'))
+    assert entry['msg'] == 'From +919876543210'
+    assert entry['body'] == 'I have fever'
+
+
+def test_exceptions_are_redacted(redact):
+    try:
+        raise ValueError('bad number +919876543210')
+    except ValueError:
+        entry = record('Send failed', level=logging.ERROR)
+        entry.exc_info = sys.exc_info()
+    assert '9876543210' not in formatted(entry)['exc']
+
+
+def test_queue_handler_merges_arguments_on_the_calling_thread(redact):
+    log_queue = queue.Queue()
+    handler = NonBlockingQueueHandler(log_queue)
+    recipients = ['+919876543210']
+    with request_context('SM1'):
+        handler.emit(record('Sending to %s', (recipients,), body='hello'))
+    recipients.append('+911111111111')  # changed after logging, before the listener formats it
+    queued = log_queue.get_nowait()
+    assert queued.args is None
+    assert queued.request_id == 'SM1'
+    # Redaction is left to the listener
+    assert queued.msg == "Sending to ['+919876543210']"
+    assert queued.body == 'hello'
+    entry = formatted(queued)
+    assert entry['msg'] == "Sending to ['+********3210']"
+    assert entry['request_id'] == 'SM1' and entry['body'] == '<5 chars>'
+
+
+def test_queue_handler_drops_records_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    dropped = structured_logging._dropped
+    handler.emit(record('one'))
+    handler.emit(record('two'))
+    assert structured_logging._dropped == dropped + 1
+
+
+def test_bad_format_arguments_do_not_raise(monkeypatch):
+    monkeypatch.setattr(logging, 'raiseExceptions', False)
+    log_queue = queue.Queue()
+    NonBlockingQueueHandler(log_queue).emit(record('%d items', ('many',)))
+    assert log_queue.empty()
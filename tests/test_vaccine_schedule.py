@@ -0,0 +1,78 @@
+import pytest
+
+from utils.kb_snapshot import build_snapshot
+from utils.knowledge_base import DATA_DIR, KnowledgeBase
+from utils.vaccine_schedule import DOSE_GRACE_DAYS, DUE, GIVEN, OVERDUE, UPCOMING, build_schedule, dose_status, evaluate_batch
+
+
+@pytest.fixture(params=['json', 'snapshot'])
+def schedule(request, tmp_path):
+    """The schedule built from plain dicts and from a memory-mapped snapshot"""
+    snapshot_path = None
+    if request.param == 'snapshot':
+        snapshot_path = str(tmp_path / 'knowledge_base.kbs')
+        build_snapshot(DATA_DIR, snapshot_path)
+    snapshot = KnowledgeBase(DATA_DIR, snapshot_path=snapshot_path).snapshot()
+    assert snapshot.source == request.param
+    return build_schedule(snapshot.vaccines)
+
+
+def by_id(schedule):
+    return {dose.id: dose for dose in schedule}
+
+
+def test_schedule_is_not_empty(schedule):
+    doses = by_id(schedule)
+    assert {'bcg-1', 'opv-0', 'opv-3', 'dpt-1', 'dpt-3', 'mr_vaccine-2'} <= set(doses)
+    assert [dose.start_day for dose in schedule] == sorted(dose.start_day for dose in schedule)
+
+
+def test_birth_dose_numbered_from_zero(schedule):
+    opv = [dose for dose in schedule if dose.vaccine == 'opv']
+    assert [(dose.number, dose.start_day) for dose in opv] == [(0, 0), (1, 42), (2, 70), (3, 98)]
+    assert [dose.number for dose in schedule if dose.vaccine == 'dpt'] == [1, 2, 3]
+
+
+def test_due_windows_of_one_vaccine_do_not_overlap(schedule):
+    for vaccine in {dose.vaccine for dose in schedule}:
+        doses = [dose for dose in schedule if dose.vaccine == vaccine]
+        for earlier, later in zip(doses, doses[1:]):
+            assert earlier.due_until < later.start_day
+
+
+@pytest.mark.parametrize('weeks, expected', [(10, 2), (14, 3)])
+def test_one_due_dose_per_vaccine(schedule, weeks, expected):
+    for vaccine in ('opv', 'dpt', 'pentavalent', 'rotavirus'):
+        due = [dose.number for dose in schedule if dose.vaccine == vaccine and dose_status(dose, weeks * 7) == DUE]
+        assert due == [expected], vaccine
+
+
+def test_dose_status(schedule):
+    bcg = by_id(schedule)['bcg-1']
+    assert dose_status(bcg, 0) == DUE
+    assert dose_status(bcg, bcg.end_day + DOSE_GRACE_DAYS) == DUE
+    assert dose_status(bcg, bcg.end_day + DOSE_GRACE_DAYS + 1) == OVERDUE
+    assert dose_status(bcg, 400, given=True) == GIVEN
+    mr = by_id(schedule)['mr_vaccine-1']
+    assert dose_status(mr, mr.start_day - 1) == UPCOMING
+    opv_1 = by_id(schedule)['opv-1']
+    assert dose_status(opv_1, 69) == DUE
+    assert dose_status(opv_1, 70) == OVERDUE
+
+
+def test_batch_matches_dose_status(schedule):
+    np = pytest.importorskip('numpy')
+    ages = np.arange(0, 6000, 7)
+    today = np.datetime64('2026-10-17', 'D')
+    result = evaluate_batch(today - ages.astype('timedelta64[D]'), today=today.item(), doses=schedule)
+    expected = [[dose_status(dose, int(age)) for dose in schedule] for age in ages]
+    assert result.status.tolist() == expected
+
+
+def test_due_reply_lists_one_dose_per_vaccine():
+    from utils.vaccine_handler import get_due_vaccines_info
+
+    due_now = get_due_vaccines_info(10, 'english').split('\n')[1]
+    assert 'OPV (Polio)-2' in due_now and 'DPT-2' in due_now
+    assert 'OPV (Polio)-1' not in due_now and 'DPT-1' not in due_now
+    assert 'OPV (Polio)-0' in get_due_vaccines_info(0, 'english')
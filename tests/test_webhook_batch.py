@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def test_results_keep_item_order_and_ids(client):
+    response = client.post('/webhook/batch', json=[
+        {'id': 'a', 'queryResult': {'queryText': 'dengue', 'intent': {'displayName': 'disease_info'},
+                                    'parameters': {'disease': 'dengue'}}},
+        'bcg vaccine',
+        {'id': 'c', 'queryText': 'hello', 'intent': {'displayName': 'greeting'}},
+    ])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 3
+    assert [result['index'] for result in body['results']] == [0, 1, 2]
+    assert [result.get('id') for result in body['results']] == ['a', None, 'c']
+    assert 'dengue' in body['results'][0]['fulfillmentText'].lower()
+    assert 'bcg' in body['results'][1]['fulfillmentText'].lower()
+    assert body['results'][2]['fulfillmentText'] == app.get_greeting_response('english')
+
+
+def test_a_bad_item_gets_its_own_error(client):
+    body = client.post('/webhook/batch', json={'items': ['dengue', 42, {'id': 'x'}, 'hello']}).get_json()
+    errors = [result.get('error') for result in body['results']]
+    assert errors == [None, 'expected a queryResult object or text', 'expected a queryResult object or text', None]
+    assert body['results'][2]['id'] == 'x'
+    assert body['results'][3]['fulfillmentText']
+
+
+def test_a_failing_item_does_not_fail_the_batch(client, monkeypatch):
+    real = app.process_intent
+
+    def process_intent(intent_name, parameters, query_text, language):
+        if query_text == 'boom':
+            raise RuntimeError('handler bug')
+        return real(intent_name, parameters, query_text, language)
+
+    monkeypatch.setattr(app, 'process_intent', process_intent)
+    body = client.post('/webhook/batch', json=['boom', 'hello']).get_json()
+    assert body['results'][0]['fulfillmentText'] == 'Sorry, something went wrong. Please try again.'
+    assert body['results'][1]['fulfillmentText'] == app.get_greeting_response('english')
+
+
+def test_identical_queries_are_answered_once(client, monkeypatch):
+    calls = []
+    real = app.process_webhook_request
+    monkeypatch.setattr(app, 'process_webhook_request', lambda request: calls.append(request) or real(request))
+    body = client.post('/webhook/batch', json=['dengue', 'dengue', 'malaria']).get_json()
+    assert len(calls) == 2
+    assert body['results'][0]['fulfillmentText'] == body['results'][1]['fulfillmentText']
+
+
+@pytest.mark.parametrize('payload', [
+    {'json': {'items': 'dengue'}},
+    {'json': {'query': 'dengue'}},
+    {'json': 'dengue'},
+    {'data': 'not json', 'content_type': 'application/json'},
+])
+def test_a_body_that_is_not_a_list_is_rejected(client, payload):
+    response = client.post('/webhook/batch', **payload)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_too_many_items_are_rejected(client, monkeypatch):
+    monkeypatch.setattr(app, 'WEBHOOK_BATCH_MAX_ITEMS', 2)
+    assert client.post('/webhook/batch', json=['a', 'b', 'c']).status_code == 400
+
+
+@pytest.mark.parametrize('request_options', [
+    {'json': {'items': ['dengue', 7], 'stream': True}},
+    {'json': ['dengue', 7], 'query_string': {'stream': '1'}},
+    {'json': ['dengue', 7], 'headers': {'Accept': 'application/x-ndjson'}},
+])
+def test_ndjson_streams_one_line_per_item_then_a_summary(client, request_options):
+    response = client.post('/webhook/batch', **request_options)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 3
+    assert lines[0]['index'] == 0 and lines[0]['fulfillmentText']
+    assert lines[1]['index'] == 1 and 'error' in lines[1]
+    assert lines[2]['done'] is True and lines[2]['count'] == 2
+
+
+def test_ndjson_lines_are_produced_as_items_are_answered():
+    lines = app.iter_batch_ndjson(['dengue', 'hello'])
+    first = json.loads(next(lines))
+    assert first['index'] == 0 and 'dengue' in first['fulfillmentText'].lower()
+    assert json.loads(next(lines))['index'] == 1
+    assert json.loads(next(lines))['done'] is True
+
+
+def test_asgi_batch_matches_the_flask_endpoint():
+    from starlette.testclient import TestClient
+
+    import asgi_app
+
+    client = TestClient(asgi_app.app)
+    assert client.post('/webhook/batch', content=b'not json').status_code == 400
+    assert client.post('/webhook/batch', json={'items': 'dengue'}).status_code == 400
+    body = client.post('/webhook/batch', json=['hello', 7]).json()
+    assert body['results'][0]['fulfillmentText'] == app.get_greeting_response('english')
+    assert 'error' in body['results'][1]
+    response = client.post('/webhook/batch?stream=1', json=['hello'])
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    assert [json.loads(line).get('done') for line in response.text.splitlines()] == [None, True]
@@ -0,0 +1,137 @@
+import collections
+import threading
+import time
+import types
+
+import pytest
+
+from utils import whatsapp_delivery
+from utils.rate_limiter import TokenBucketRegistry
+from utils.whatsapp_delivery import coalesce_messages, enqueue_whatsapp_message, get_delivery_stats
+
+
+class FakeTwilio:
+    """Stub for the per-thread requests session; replies 201 unless a response is scripted"""
+
+    def __init__(self):
+        self.posts = []  # (to, body, monotonic time)
+        self.scripted = collections.defaultdict(list)  # body -> [(status, headers), ...]
+
+    def post(self, url, data, auth, timeout):
+        self.posts.append((data['To'].replace('whatsapp:', ''), data['Body'], time.monotonic()))
+        status, headers = self.scripted[data['Body']].pop(0) if self.scripted[data['Body']] else (201, {})
+        return types.SimpleNamespace(status_code=status, text='', headers=headers)
+
+    def delivered(self, to=None):
+        return [body for recipient, body, _ in self.posts if to in (None, recipient)]
+
+
+@pytest.fixture
+def twilio(monkeypatch):
+    """A fresh single-shard delivery pool sending through FakeTwilio"""
+    fake = FakeTwilio()
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'AC123')
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'token')
+    monkeypatch.setattr(whatsapp_delivery, '_get_session', lambda: fake)
+    monkeypatch.setattr(whatsapp_delivery, 'DELIVERY_WORKERS', 1)
+    monkeypatch.setattr(whatsapp_delivery, 'DELIVERY_COALESCE_WINDOW', 0.05)
+    monkeypatch.setattr(whatsapp_delivery, 'DELIVERY_BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(whatsapp_delivery, '_rate_limits', TokenBucketRegistry(1000, 1000))
+    monkeypatch.setattr(whatsapp_delivery, '_stats', collections.Counter())
+    for name in ('_shards', '_workers', '_builders', '_workers_pid'):
+        monkeypatch.setattr(whatsapp_delivery, name, getattr(whatsapp_delivery, name))
+    whatsapp_delivery._workers_pid = None
+    return fake
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_coalesce_joins_up_to_the_segment_limit():
+    assert coalesce_messages(['a', 'b', 'b', 'c']) == ['a\n\nb\n\nc']
+    assert coalesce_messages(['x' * 1000, 'y' * 598]) == ['x' * 1000 + '\n\n' + 'y' * 598]
+    assert coalesce_messages(['x' * 1000, 'y' * 599]) == ['x' * 1000, 'y' * 599]
+    # Twilio counts UTF-16 code units, so an emoji takes two
+    assert len(coalesce_messages(['x' * 1000, '🙂' * 299])) == 1
+    assert len(coalesce_messages(['x' * 1000, '🙂' * 300])) == 2
+
+
+def test_replies_within_the_window_go_out_as_one_message(twilio):
+    assert enqueue_whatsapp_message('+911', 'first')
+    assert enqueue_whatsapp_message('+911', lambda: 'second')
+    wait_until(lambda: get_delivery_stats()['sent'] == 1)
+    assert twilio.delivered() == ['first\n\nsecond']
+    assert get_delivery_stats()['coalesced'] == 1
+
+
+def test_retried_send_keeps_the_recipient_order(twilio):
+    twilio.scripted['one'] = [(503, {})]
+    enqueue_whatsapp_message('+911', 'one')
+    time.sleep(0.1)
+    enqueue_whatsapp_message('+911', 'two')
+    enqueue_whatsapp_message('+912', 'other')
+    wait_until(lambda: get_delivery_stats()['sent'] == 3)
+    assert twilio.delivered('+911') == ['one', 'one', 'two']
+    assert twilio.delivered('+912') == ['other']
+    stats = get_delivery_stats()
+    assert stats['retries'] == 1 and stats['failed'] == 0 and stats['queue_depth'] == 0
+
+
+def test_429_with_retry_after_is_requeued_not_dropped(twilio):
+    twilio.scripted['hello'] = [(429, {'Retry-After': '0.3'})]
+    enqueue_whatsapp_message('+911', 'hello')
+    wait_until(lambda: get_delivery_stats()['sent'] == 1)
+    (_, _, throttled_at), (_, body, sent_at) = twilio.posts
+    assert body == 'hello'
+    assert sent_at - throttled_at >= 0.3
+    stats = get_delivery_stats()
+    assert stats['throttled'] == 1 and stats['failed'] == 0
+
+
+def test_long_reply_segments_stop_at_a_failed_segment(twilio, monkeypatch):
+    monkeypatch.setattr(whatsapp_delivery, 'DELIVERY_MAX_ATTEMPTS', 1)
+    reply = ('word ' * 400).strip()  # two segments
+    first, second = whatsapp_delivery.message_segments(reply)
+    twilio.scripted[first] = [(400, {})]
+    enqueue_whatsapp_message('+911', reply)
+    wait_until(lambda: get_delivery_stats()['failed'] == 1)
+    assert twilio.delivered() == [first]
+
+
+def test_enqueue_fails_when_the_queue_is_full(twilio, monkeypatch):
+    monkeypatch.setattr(whatsapp_delivery, 'DELIVERY_QUEUE_SIZE', 2)
+    release = threading.Event()
+
+    def blocked_reply():
+        release.wait(5)
+        return 'reply'
+
+    assert enqueue_whatsapp_message('+911', blocked_reply)
+    assert enqueue_whatsapp_message('+912', blocked_reply)
+    assert not enqueue_whatsapp_message('+913', 'no room')
+    assert get_delivery_stats()['rejected'] == 1
+    release.set()
+    wait_until(lambda: get_delivery_stats()['sent'] == 2)
+    assert enqueue_whatsapp_message('+913', 'room again')
+
+
+def test_one_recipients_replies_are_built_in_order(twilio):
+    events = []
+
+    def build(name, delay):
+        def reply():
+            events.append(('start', name))
+            time.sleep(delay)
+            events.append(('end', name))
+            return name
+        return reply
+
+    enqueue_whatsapp_message('+911', build('dengue', 0.2))
+    enqueue_whatsapp_message('+911', build('what about in hindi', 0))
+    wait_until(lambda: get_delivery_stats()['sent'] >= 1 and twilio.delivered()[-1].endswith('hindi'))
+    assert events == [('start', 'dengue'), ('end', 'dengue'),
+                      ('start', 'what about in hindi'), ('end', 'what about in hindi')]
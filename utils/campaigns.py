@@ -0,0 +1,276 @@
+"""Proactive vaccination reminder campaigns.
+
+Streams a registry of children (phone, date of birth, language) from a
+CSV file or a SQLite table in chunks, works out from the NIS schedule
+which doses each child is due for (or will be within CAMPAIGN_NOTICE_DAYS)
+and sends one WhatsApp reminder per child and dose group through the
+rate-limited Twilio sender on CAMPAIGN_SENDERS threads:
+
+    python -m utils.campaigns run registry.csv --campaign 2026-10-17
+    python -m utils.campaigns run registry.sqlite3 --table children --campaign nightly
+    python -m utils.campaigns status --campaign nightly
+
+A SQLite ledger (CAMPAIGN_LEDGER_PATH) records every reminder and how far
+the current run of each campaign has read. Reminders are keyed by child
+and dose group and claimed in the ledger before they are sent, so no
+reminder is ever sent twice. Each child gets the first dose group, due
+now or within the notice period, that has not been claimed yet. So a
+nightly run moves on to the next group once the last one was sent,
+without waiting for its grace period to pass.
+
+A run that crashes can simply be started again with the same campaign
+name: it resumes after the last finished chunk. A run that completes
+clears its checkpoint, so the next run reads the whole registry again
+and the ledger keys decide what is new. A failed send releases its claim
+so a later run retries it. A send interrupted mid-request is left as
+'sending' rather than risk a duplicate.
+
+Each process has its own rate limiter; give campaign runs a share of the
+account with TWILIO_RATE_PER_SECOND so they leave room for live replies.
+"""
+import argparse
+import collections
+import concurrent.futures
+import csv
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from utils.knowledge_base import get_knowledge_base
+from utils.vaccine_handler import render_reminder
+from utils.vaccine_schedule import DUE, UPCOMING, evaluate_batch, get_schedule
+from utils.whatsapp_delivery import send_whatsapp_message
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_CHUNK_ROWS = int(os.environ.get('CAMPAIGN_CHUNK_ROWS', '10000'))
+CAMPAIGN_SENDERS = int(os.environ.get('CAMPAIGN_SENDERS', '8'))
+# Remind about doses that fall due within this many days, not only those already due
+CAMPAIGN_NOTICE_DAYS = int(os.environ.get('CAMPAIGN_NOTICE_DAYS', '3'))
+CAMPAIGN_LEDGER_PATH = os.environ.get('CAMPAIGN_LEDGER_PATH', 'data/campaign_ledger.sqlite3')
+
+# Registry language values -> reply language
+LANGUAGE_CODES = {
+    'en': 'english', 'english': 'english',
+    'hi': 'hindi', 'hindi': 'hindi', 'हिंदी': 'hindi',
+    'or': 'odia', 'od': 'odia', 'odia': 'odia', 'oriya': 'odia', 'ଓଡ଼ିଆ': 'odia'
+}
+
+Child = collections.namedtuple('Child', ['phone', 'dob', 'language'])
+
+
+def _parse_child(phone, dob, language):
+    """Child from raw registry values, or None if the row is unusable"""
+    phone = (phone or '').strip()
+    try:
+        dob = datetime.date.fromisoformat(str(dob).strip())
+    except ValueError:
+        return None
+    if not phone:
+        return None
+    return Child(phone, dob, LANGUAGE_CODES.get(str(language or '').strip().lower(), 'english'))
+
+
+def read_csv_registry(path, after=0, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Yield (position of the last row, [Child or None]) for data rows after row number ``after``"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        chunk = []
+        for position, row in enumerate(csv.DictReader(f), 1):
+            if position <= after:
+                continue
+            chunk.append(_parse_child(row.get('phone'), row.get('dob'), row.get('language')))
+            if len(chunk) >= chunk_rows:
+                yield position, chunk
+                chunk = []
+        if chunk:
+            yield position, chunk
+
+
+def read_sqlite_registry(path, table, after=0, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Yield (last rowid, [Child or None]) for rows with rowid > ``after``, by keyset pagination"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        query = f'SELECT rowid, phone, dob, language FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?'
+        while True:
+            rows = conn.execute(query, (after, chunk_rows)).fetchall()
+            if not rows:
+                return
+            after = rows[-1][0]
+            yield after, [_parse_child(*row[1:]) for row in rows]
+    finally:
+        conn.close()
+
+
+def read_registry(source, table=None, after=0, chunk_rows=CAMPAIGN_CHUNK_ROWS):
+    """Chunks of the registry at ``source``: a SQLite table when ``table`` is given, else CSV"""
+    if table:
+        return read_sqlite_registry(source, table, after, chunk_rows)
+    return read_csv_registry(source, after, chunk_rows)
+
+
+def reminder_days(children, today, notice_days=CAMPAIGN_NOTICE_DAYS):
+    """Per child, the start days of the dose groups due now or within ``notice_days``, earliest first"""
+    import numpy as np
+
+    births = np.array([child.dob for child in children], dtype='datetime64[D]')
+    result = evaluate_batch(births, today=today)
+    starts = np.array([dose.start_day for dose in result.doses], dtype=np.int32)
+    ages = (np.datetime64(today, 'D') - births).astype(np.int32)
+    wanted = (result.status == DUE) | ((result.status == UPCOMING) & (starts <= ages[:, None] + notice_days))
+    # The schedule is ordered by start day, so each row's groups come out sorted
+    return [list(dict.fromkeys(starts[row].tolist())) for row in wanted]
+
+
+class CampaignLedger:
+    """Reminder claims and read checkpoints in one SQLite file"""
+
+    def __init__(self, path=CAMPAIGN_LEDGER_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS reminders '
+            '(key TEXT PRIMARY KEY, campaign TEXT NOT NULL, status TEXT NOT NULL, updated REAL NOT NULL) WITHOUT ROWID'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoints '
+            '(campaign TEXT PRIMARY KEY, position INTEGER NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key, campaign):
+        """Record ``key`` as being sent; False if it was claimed before (by any run)"""
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO reminders (key, campaign, status, updated) VALUES (?, ?, 'sending', ?)",
+            (key, campaign, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def finish(self, key, status):
+        self._connection().execute('UPDATE reminders SET status = ?, updated = ? WHERE key = ?', (status, time.time(), key))
+
+    def release(self, key):
+        """Drop the claim on ``key`` so a later run can send it again"""
+        self._connection().execute('DELETE FROM reminders WHERE key = ?', (key,))
+
+    def checkpoint(self, campaign):
+        row = self._connection().execute('SELECT position FROM checkpoints WHERE campaign = ?', (campaign,)).fetchone()
+        return row[0] if row else 0
+
+    def save_checkpoint(self, campaign, position):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO checkpoints (campaign, position, updated) VALUES (?, ?, ?)',
+            (campaign, position, time.time())
+        )
+
+    def clear_checkpoint(self, campaign):
+        self._connection().execute('DELETE FROM checkpoints WHERE campaign = ?', (campaign,))
+
+    def status_counts(self, campaign):
+        rows = self._connection().execute(
+            'SELECT status, COUNT(*) FROM reminders WHERE campaign = ? GROUP BY status', (campaign,)
+        ).fetchall()
+        return dict(rows)
+
+
+def _send_reminder(ledger, campaign, phone, candidates):
+    """Send the first (key, message) in ``candidates`` that no run has claimed yet"""
+    for key, message in candidates:
+        if ledger.claim(key, campaign):
+            break
+    else:
+        return 'skipped'
+    if send_whatsapp_message(phone, message):
+        ledger.finish(key, 'sent')
+        return 'sent'
+    ledger.release(key)
+    return 'failed'
+
+
+def run_campaign(source, campaign, table=None, today=None, ledger=None, dry_run=False,
+                 notice_days=CAMPAIGN_NOTICE_DAYS, chunk_rows=CAMPAIGN_CHUNK_ROWS, senders=CAMPAIGN_SENDERS):
+    """Send the reminders due in ``source``; resumes from the campaign's checkpoint. Returns counters."""
+    today = today or datetime.date.today()
+    ledger = ledger or CampaignLedger()
+    version = get_knowledge_base().snapshot().version
+    get_schedule()
+    stats = collections.Counter()
+    started = time.monotonic()
+    after = 0 if dry_run else ledger.checkpoint(campaign)
+    if after:
+        logger.info("Resuming campaign", extra={'campaign': campaign, 'position': after})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=senders, thread_name_prefix='campaign') as pool:
+        for position, chunk in read_registry(source, table, after, chunk_rows):
+            stats['chunks'] += 1
+            stats['read'] += len(chunk)
+            children = [child for child in chunk if child is not None]
+            stats['invalid'] += len(chunk) - len(children)
+            futures = []
+            for child, start_days in zip(children, reminder_days(children, today, notice_days) if children else []):
+                if not start_days:
+                    continue
+                stats['selected'] += 1
+                candidates = [
+                    (f'{child.phone}:{child.dob.isoformat()}:{start_day}', render_reminder(version, start_day, child.language))
+                    for start_day in start_days
+                ]
+                if dry_run:
+                    continue
+                futures.append(pool.submit(_send_reminder, ledger, campaign, child.phone, candidates))
+            for future in concurrent.futures.as_completed(futures):
+                stats[future.result()] += 1
+            # Every reminder in the chunk is claimed and settled; a restart starts after it
+            if not dry_run:
+                ledger.save_checkpoint(campaign, position)
+            logger.info("Campaign chunk done", extra=dict(stats, campaign=campaign))
+
+    # The whole registry was read: the next run with this name starts from the top
+    if not dry_run:
+        ledger.clear_checkpoint(campaign)
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    return dict(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help='send the reminders due in a registry')
+    run.add_argument('source', help='registry CSV (phone,dob,language) or SQLite file with --table')
+    run.add_argument('--campaign', required=True, help='campaign name; its checkpoint is resumed')
+    run.add_argument('--table', help='read this SQLite table instead of a CSV file')
+    run.add_argument('--date', type=datetime.date.fromisoformat, help='evaluate as of this date (default today)')
+    run.add_argument('--notice-days', type=int, default=CAMPAIGN_NOTICE_DAYS)
+    run.add_argument('--chunk-rows', type=int, default=CAMPAIGN_CHUNK_ROWS)
+    run.add_argument('--senders', type=int, default=CAMPAIGN_SENDERS)
+    run.add_argument('--dry-run', action='store_true', help='count and render the reminders without sending')
+    status = subparsers.add_parser('status', help="show a campaign's checkpoint and reminder counts")
+    status.add_argument('--campaign', required=True)
+    for subparser in (run, status):
+        subparser.add_argument('--ledger', default=CAMPAIGN_LEDGER_PATH)
+    args = parser.parse_args()
+
+    ledger = CampaignLedger(args.ledger)
+    if args.command == 'status':
+        result = {'position': ledger.checkpoint(args.campaign), 'reminders': ledger.status_counts(args.campaign)}
+    else:
+        result = run_campaign(args.source, args.campaign, table=args.table, today=args.date, ledger=ledger,
+                              dry_run=args.dry_run, notice_days=args.notice_days,
+                              chunk_rows=args.chunk_rows, senders=args.senders)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
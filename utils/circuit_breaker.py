@@ -0,0 +1,133 @@
+import collections
+import logging
+import os
+import threading
+import time
+import weakref
+
+from utils.metrics import BREAKER_TRANSITIONS, BREAKER_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers = weakref.WeakSet()
+
+
+class CircuitBreaker:
+    """Stop calling a dependency that keeps failing or answering slowly.
+
+    The last ``window`` calls are kept; once at least ``min_calls`` of them
+    exist and the share that failed or took longer than ``slow_call_seconds``
+    reaches ``failure_ratio``, the breaker opens and allow() returns False
+    for ``open_seconds``. After that it lets ``half_open_probes`` calls
+    through: a good probe closes it again, a bad one reopens it.
+
+    allow() hands out a ticket naming the state it admitted the call under;
+    passed back to record(), it makes a call that finishes after the state
+    has changed (e.g. a slow call from before a trip) count for nothing.
+    """
+
+    def __init__(self, name, failure_ratio=0.5, window=20, min_calls=5,
+                 slow_call_seconds=2.0, open_seconds=30.0, half_open_probes=1):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._outcomes = collections.deque(maxlen=window)  # True = failed or slow
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._generation = 1  # bumped on every state change
+        self._lock = threading.Lock()
+        self._gauge_reported = False
+        _breakers.add(self)
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """Return a ticket (truthy) if a call may go ahead now, else False"""
+        if self._state == CLOSED:
+            return self._generation
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    return False
+                self._probes_in_flight += 1
+            return self._generation
+
+    def record(self, success, duration=0.0, ticket=None):
+        """Report the outcome of a call that allow() let through (with its ticket)"""
+        bad = not success or duration > self.slow_call_seconds
+        if not self._gauge_reported:
+            # Report the initial state once per worker process
+            self._gauge_reported = True
+            BREAKER_STATE.set(STATE_VALUES[self._state], self.name)
+        with self._lock:
+            if ticket is not None and ticket != self._generation:
+                # Admitted under an earlier state; it must not decide this one
+                return
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if bad:
+                    self._open()
+                else:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                return
+            if self._state == OPEN:
+                # A call admitted before the breaker opened; the decision is already made
+                return
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) >= self.failure_ratio * len(self._outcomes):
+                self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self._transition(OPEN)
+
+    def _transition(self, state):
+        if state == self._state:
+            return
+        logger.warning("Circuit breaker state change", extra={
+            'breaker': self.name, 'from_state': self._state, 'to_state': state
+        })
+        BREAKER_TRANSITIONS.inc(self.name, self._state, state)
+        BREAKER_STATE.set(STATE_VALUES[state], self.name)
+        self._state = state
+        self._generation += 1
+
+    def snapshot(self):
+        """Return a small status dict for health checks"""
+        outcomes = list(self._outcomes)
+        return {
+            'state': self._state,
+            'recent_calls': len(outcomes),
+            'recent_failures': sum(outcomes)
+        }
+
+
+def _reset_locks_after_fork():
+    """A lock held by another thread at fork time would never be released in the child"""
+    for breaker in list(_breakers):
+        breaker._lock = threading.Lock()
+        breaker._probes_in_flight = 0
+        breaker._gauge_reported = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
@@ -0,0 +1,271 @@
+"""Per-sender conversation state: preferred language, last topic, child's age.
+
+Lets follow-up turns be answered without Dialogflow contexts: "what about
+in Hindi?" re-answers the last topic in Hindi, "and its treatment?" stays
+on the last disease, and a romanized message from someone who wrote in
+Odia before is answered in Odia.
+
+The default backend is an in-process LRU with a sliding TTL (one per
+worker, a small tuple per sender); CONVERSATION_BACKEND=sqlite shares the
+state between the workers on one host, like the dedup store.
+"""
+import collections
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from utils.language_utils import classify_language, common_word_language, explicit_language
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_BACKEND = os.environ.get('CONVERSATION_BACKEND', 'memory')  # 'memory' or 'sqlite'
+CONVERSATION_TTL_SECONDS = float(os.environ.get('CONVERSATION_TTL_SECONDS', '1800'))
+CONVERSATION_MAX_SESSIONS = int(os.environ.get('CONVERSATION_MAX_SESSIONS', '50000'))
+CONVERSATION_SQLITE_PATH = os.environ.get('CONVERSATION_SQLITE_PATH', '/tmp/whatsapp_conversations.sqlite3')
+
+# Intent -> the parameter holding its entity
+ENTITY_PARAMETERS = {'disease_info': 'disease', 'vaccine_info': 'vaccine'}
+
+# Phrases asking about the previous topic ("its treatment", "इसका इलाज")
+SAME_TOPIC_CUES = frozenset([
+    'it', 'its', 'this', 'that', 'more', 'symptoms', 'treatment', 'prevention', 'cure', 'precautions',
+    'इसके', 'इसका', 'इसकी', 'लक्षण', 'इलाज', 'बचाव', 'ଏହାର', 'ଏହା', 'ଲକ୍ଷଣ', 'ଚିକିତ୍ସା', 'ପ୍ରତିକାର'
+])
+NEXT_DOSE_CUES = ('next dose', 'next vaccine', 'next one', 'next shot', 'agla tika', 'agla teeka',
+                  'अगला टीका', 'अगली खुराक', 'ପରବର୍ତ୍ତୀ ଟିକା')
+# Longer messages are new questions, not follow-ups
+FOLLOWUP_MAX_WORDS = 8
+
+_WORD_PATTERN = re.compile(r"[^\s.,!?;:()\"'।]+")
+
+
+class ConversationState(collections.namedtuple('ConversationState', ['language', 'intent', 'entity', 'child_age_weeks'])):
+    """What we know about one sender; any field may be None"""
+    __slots__ = ()
+
+
+EMPTY_STATE = ConversationState(None, None, None, None)
+
+
+class MemoryConversationStore:
+    """In-process LRU of sender -> (state, expiry); touching a sender renews its TTL"""
+
+    def __init__(self, ttl=CONVERSATION_TTL_SECONDS, max_sessions=CONVERSATION_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()  # sender -> (state, expiry), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, sender):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(sender)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._sessions[sender]
+                return None
+            self._sessions[sender] = (entry[0], now + self.ttl)
+            self._sessions.move_to_end(sender)
+            return entry[0]
+
+    def put(self, sender, state):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[sender] = (state, now + self.ttl)
+            self._sessions.move_to_end(sender)
+            # One sliding TTL for all, so the least recently used entry expires first
+            while self._sessions:
+                oldest, (_, expiry) = next(iter(self._sessions.items()))
+                if expiry > now and len(self._sessions) <= self.max_sessions:
+                    break
+                del self._sessions[oldest]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteConversationStore:
+    """Conversation state in a SQLite file shared by every worker on the host; reads renew the TTL"""
+
+    def __init__(self, path=CONVERSATION_SQLITE_PATH, ttl=CONVERSATION_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversations '
+                '(sender TEXT PRIMARY KEY, language TEXT, intent TEXT, entity TEXT, '
+                'child_age_weeks REAL, expires REAL NOT NULL) WITHOUT ROWID'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sender):
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT language, intent, entity, child_age_weeks, expires FROM conversations WHERE sender = ? AND expires > ?',
+            (sender, now)
+        ).fetchone()
+        if row is None:
+            return None
+        # Sliding TTL like the memory backend; renewed at most once per tenth of the TTL to spare writes
+        if row[4] - now < self.ttl * 0.9:
+            conn.execute('UPDATE conversations SET expires = ? WHERE sender = ?', (now + self.ttl, sender))
+        return ConversationState(*row[:4])
+
+    def put(self, sender, state):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO conversations (sender, language, intent, entity, child_age_weeks, expires) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (sender,) + tuple(state) + (now + self.ttl,)
+        )
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % 1000 == 0
+        if prune:
+            conn.execute('DELETE FROM conversations WHERE expires <= ?', (now,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM conversations WHERE expires > ?', (time.time(),)).fetchone()[0]
+
+
+CONVERSATION_BACKENDS = {
+    'memory': MemoryConversationStore,
+    'sqlite': SQLiteConversationStore
+}
+
+_store = None
+_store_lock = threading.Lock()
+_stats = collections.Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_conversation_store():
+    """Return the configured conversation store, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CONVERSATION_BACKENDS[CONVERSATION_BACKEND]()
+    return _store
+
+
+def get_conversation(sender):
+    """Return the sender's state (EMPTY_STATE when unknown or expired)"""
+    if not sender:
+        return EMPTY_STATE
+    try:
+        state = get_conversation_store().get(sender)
+    except Exception as e:
+        # Losing context must never stop a reply
+        logger.error("Conversation store error", extra={'error': str(e)})
+        _count('errors')
+        return EMPTY_STATE
+    _count('hits' if state is not None else 'misses')
+    return state or EMPTY_STATE
+
+
+def save_conversation(sender, state, previous=EMPTY_STATE):
+    """Store ``state`` for ``sender``; unchanged state is only re-touched by the read"""
+    if not sender or (state == previous and previous is not EMPTY_STATE):
+        return
+    if state.entity is not None:
+        # Entities come from a small fixed set; share one string object per key
+        state = state._replace(entity=sys.intern(state.entity))
+    try:
+        get_conversation_store().put(sender, state)
+    except Exception as e:
+        logger.error("Conversation store error", extra={'error': str(e)})
+        _count('errors')
+
+
+def resolve_language(text, state):
+    """Language to answer in: named > written in Odia/Hindi > English words > remembered preference > English.
+
+    Latin-only text skips script detection; it can only keep a remembered
+    Odia/Hindi preference when it has no English (or other) common words,
+    e.g. romanized "bukhar" or a bare "ok".
+    """
+    named = explicit_language(text)
+    if named:
+        return named
+    if text and not text.isascii():
+        detected = classify_language(text).language
+        if detected != 'english':
+            return detected
+    if state.language in (None, 'english'):
+        return 'english'
+    return common_word_language(text) or state.language
+
+
+def detect_followup(text, state):
+    """Classify a message the local classifier found no topic in.
+
+    Returns 'next_dose', 'language' or 'same_topic' when it refers back to
+    the previous turn, else None.
+    """
+    if not state.intent:
+        return None
+    lowered = text.lower()
+    words = _WORD_PATTERN.findall(lowered)
+    if not words or len(words) > FOLLOWUP_MAX_WORDS:
+        return None
+    if state.intent == 'vaccine_info' and any(cue in lowered for cue in NEXT_DOSE_CUES):
+        kind = 'next_dose'
+    elif explicit_language(text):
+        kind = 'language'
+    elif any(word in SAME_TOPIC_CUES for word in words):
+        kind = 'same_topic'
+    else:
+        return None
+    _count('followups')
+    return kind
+
+
+def followup_parameters(state):
+    """Dialogflow-style parameters re-asking the previous turn's question"""
+    parameter = ENTITY_PARAMETERS.get(state.intent)
+    if parameter and state.entity:
+        return {parameter: state.entity}
+    return {}
+
+
+def get_conversation_stats():
+    """Return store size and hit counters"""
+    try:
+        sessions = len(get_conversation_store())
+    except Exception:
+        sessions = None
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        'backend': CONVERSATION_BACKEND,
+        'sessions': sessions,
+        'hits': stats.get('hits', 0),
+        'misses': stats.get('misses', 0),
+        'followups': stats.get('followups', 0),
+        'errors': stats.get('errors', 0)
+    }
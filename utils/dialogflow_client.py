@@ -0,0 +1,276 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+from utils.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_PATH = "credentials.json"  # Path to your JSON credentials file
+
+# host:port of a plaintext local stand-in for the Sessions API (see benchmarks/stubs.py);
+# when set, no credentials are loaded
+DIALOGFLOW_EMULATOR_HOST = os.environ.get('DIALOGFLOW_EMULATOR_HOST')
+
+# Deadline (seconds) for one detectIntent call; there are no client-side
+# retries, a failed call falls back to the local answer instead
+DIALOGFLOW_TIMEOUT = float(os.environ.get('DIALOGFLOW_TIMEOUT', '3'))
+# Answer locally when Dialogflow has not replied within this many seconds (0 disables)
+DIALOGFLOW_HEDGE_AFTER = float(os.environ.get('DIALOGFLOW_HEDGE_AFTER', '0'))
+DIALOGFLOW_HEDGE_WORKERS = int(os.environ.get('DIALOGFLOW_HEDGE_WORKERS', '8'))
+
+# Consecutive failed calls after which the client (and its gRPC channel) is rebuilt
+MAX_CONSECUTIVE_FAILURES = int(os.environ.get('DIALOGFLOW_MAX_FAILURES', '3'))
+# After a failed client build (e.g. missing credentials) wait this long before
+# the next attempt, doubling up to the max, instead of retrying on every message
+DIALOGFLOW_INIT_RETRY_SECONDS = float(os.environ.get('DIALOGFLOW_INIT_RETRY_SECONDS', '5'))
+DIALOGFLOW_INIT_RETRY_MAX_SECONDS = float(os.environ.get('DIALOGFLOW_INIT_RETRY_MAX_SECONDS', '300'))
+# A replaced client is closed once calls already running on it have hit their deadline
+RETIRED_CLIENT_CLOSE_AFTER = DIALOGFLOW_TIMEOUT + 1
+
+dialogflow_breaker = CircuitBreaker(
+    'dialogflow',
+    failure_ratio=float(os.environ.get('DIALOGFLOW_BREAKER_FAILURE_RATIO', '0.5')),
+    window=int(os.environ.get('DIALOGFLOW_BREAKER_WINDOW', '20')),
+    min_calls=int(os.environ.get('DIALOGFLOW_BREAKER_MIN_CALLS', '5')),
+    slow_call_seconds=float(os.environ.get('DIALOGFLOW_BREAKER_SLOW_SECONDS', '1.5')),
+    open_seconds=float(os.environ.get('DIALOGFLOW_BREAKER_OPEN_SECONDS', '30'))
+)
+
+_client = None
+_client_pid = None
+_consecutive_failures = 0
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> SessionsAsyncClient
+_build_failures = 0
+_next_build_at = 0.0  # monotonic time before which a failed client build is not retried
+_retiring = set()  # close tasks of replaced async clients
+_hedge_executor = None
+_hedge_pid = None
+
+
+def _build_credentials():
+    """Load service-account credentials"""
+    from google.oauth2 import service_account
+
+    # Try environment variable first (for Render deployment)
+    credentials_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+    if credentials_json:
+        credentials_info = json.loads(credentials_json)
+        return service_account.Credentials.from_service_account_info(credentials_info)
+    # Fallback to file (for local development)
+    return service_account.Credentials.from_service_account_file(CREDENTIALS_PATH)
+
+
+def _build_client():
+    """Create credentials and a new SessionsClient"""
+    # Imported on first use: google-cloud-dialogflow pulls in gRPC, protobuf and
+    # every Dialogflow service (~0.5s and tens of MB), which health checks and
+    # locally answered messages never need
+    from google.cloud import dialogflow
+    if DIALOGFLOW_EMULATOR_HOST:
+        import grpc
+        from google.cloud.dialogflow_v2.services.sessions.transports import SessionsGrpcTransport
+        channel = grpc.insecure_channel(DIALOGFLOW_EMULATOR_HOST)
+        return dialogflow.SessionsClient(transport=SessionsGrpcTransport(channel=channel))
+    return dialogflow.SessionsClient(credentials=_build_credentials())
+
+
+def _build_async_client():
+    """Create a SessionsAsyncClient bound to the running event loop"""
+    from google.cloud import dialogflow
+    if DIALOGFLOW_EMULATOR_HOST:
+        import grpc
+        from google.cloud.dialogflow_v2.services.sessions.transports import SessionsGrpcAsyncIOTransport
+        channel = grpc.aio.insecure_channel(DIALOGFLOW_EMULATOR_HOST)
+        return dialogflow.SessionsAsyncClient(transport=SessionsGrpcAsyncIOTransport(channel=channel))
+    return dialogflow.SessionsAsyncClient(credentials=_build_credentials())
+
+
+def _build_allowed():
+    """False while backing off after a failed client build"""
+    return time.monotonic() >= _next_build_at
+
+
+def _build_failed(message, error):
+    global _build_failures, _next_build_at
+    delay = min(DIALOGFLOW_INIT_RETRY_MAX_SECONDS, DIALOGFLOW_INIT_RETRY_SECONDS * (2 ** _build_failures))
+    _build_failures += 1
+    _next_build_at = time.monotonic() + delay
+    logger.error(message, extra={'error': str(error), 'retry_in_seconds': delay})
+
+
+def _build_succeeded():
+    global _build_failures, _next_build_at
+    _build_failures = 0
+    _next_build_at = 0.0
+
+
+def get_dialogflow_client():
+    """Return this worker's shared Dialogflow client, creating it on first use.
+
+    The client is tied to the process that created it: a gRPC channel must
+    never cross a fork, so a forked worker that inherits a client from the
+    gunicorn master builds its own instead of reusing it. Returns None while
+    backing off after a failed build.
+    """
+    global _client, _client_pid, _consecutive_failures
+
+    client = _client
+    if client is not None and _client_pid == os.getpid():
+        return client
+    if not _build_allowed():
+        return None
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+        if not _build_allowed():
+            return None
+        try:
+            _client = _build_client()
+            _client_pid = os.getpid()
+            _consecutive_failures = 0
+            _build_succeeded()
+            return _client
+        except Exception as e:
+            _build_failed("Error initializing Dialogflow client", e)
+            _client = None
+            _client_pid = None
+            return None
+
+
+def record_success(duration=0.0, ticket=None):
+    """Mark the last Dialogflow call as healthy (a slow one still counts against the breaker)"""
+    global _consecutive_failures
+    _consecutive_failures = 0
+    dialogflow_breaker.record(True, duration, ticket)
+
+
+def record_failure(duration=0.0, ticket=None):
+    """Count a failed call and replace the client after too many in a row"""
+    global _consecutive_failures
+    dialogflow_breaker.record(False, duration, ticket)
+    with _client_lock:
+        _consecutive_failures += 1
+        if _consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+            logger.warning("Dialogflow failed repeatedly, recreating client", extra={'consecutive_failures': _consecutive_failures})
+            _retire_client()
+            _retire_async_clients()
+
+
+def reset_dialogflow_client():
+    """Drop the shared client so the next call builds a fresh channel"""
+    with _client_lock:
+        _retire_client()
+
+
+def _retire_client():
+    """Swap out the shared client; its channel is closed once in-flight calls are done"""
+    global _client, _client_pid, _consecutive_failures
+    client, owner_pid = _client, _client_pid
+    _client = None
+    _client_pid = None
+    _consecutive_failures = 0
+    # Only close a channel this process owns; the parent's is not ours to touch
+    if client is not None and owner_pid == os.getpid():
+        timer = threading.Timer(RETIRED_CLIENT_CLOSE_AFTER, _close_client, args=(client,))
+        timer.daemon = True
+        timer.start()
+
+
+def _close_client(client):
+    try:
+        client.transport.close()
+    except Exception as e:
+        logger.warning("Error closing Dialogflow client", extra={'error': str(e)})
+
+
+def _retire_async_clients():
+    """Swap out every loop's async client and close each on its own loop later"""
+    for loop, client in list(_async_clients.items()):
+        del _async_clients[loop]
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(_schedule_async_close, client)
+
+
+def _schedule_async_close(client):
+    task = asyncio.ensure_future(_close_async_client(client))
+    _retiring.add(task)
+    task.add_done_callback(_retiring.discard)
+
+
+async def _close_async_client(client):
+    await asyncio.sleep(RETIRED_CLIENT_CLOSE_AFTER)
+    try:
+        await client.transport.close()
+    except Exception as e:
+        logger.warning("Error closing async Dialogflow client", extra={'error': str(e)})
+
+
+def get_async_dialogflow_client():
+    """Return the SessionsAsyncClient for the running event loop (async serving mode).
+
+    grpc.aio channels are bound to the loop that created them, so there is
+    one client per loop, created on first use inside that loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        if not _build_allowed():
+            return None
+        try:
+            client = _build_async_client()
+        except Exception as e:
+            _build_failed("Error initializing async Dialogflow client", e)
+            return None
+        _build_succeeded()
+        _async_clients[loop] = client
+    return client
+
+
+def get_hedge_executor():
+    """Return this process's thread pool for Dialogflow calls raced against the hedge budget"""
+    global _hedge_executor, _hedge_pid
+    if _hedge_pid != os.getpid():
+        with _client_lock:
+            if _hedge_pid != os.getpid():
+                _hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=DIALOGFLOW_HEDGE_WORKERS, thread_name_prefix='dialogflow-hedge'
+                )
+                _hedge_pid = os.getpid()
+    return _hedge_executor
+
+
+def _forget_parent_client():
+    """Drop state inherited across fork without touching the parent's channel"""
+    global _client, _client_pid, _consecutive_failures, _client_lock
+    # The parent's aio channels belong to its event loops, not to anything running here
+    _async_clients.clear()
+    _retiring.clear()
+    _client = None
+    _client_pid = None
+    _consecutive_failures = 0
+    _client_lock = threading.Lock()
+    _build_succeeded()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_parent_client)
+
+
+def dialogflow_health():
+    """Return a small status dict for health checks"""
+    return {
+        'client_ready': _client is not None and _client_pid == os.getpid(),
+        'consecutive_failures': _consecutive_failures,
+        'build_retry_in_seconds': round(max(0.0, _next_build_at - time.monotonic()), 1),
+        'breaker': dialogflow_breaker.snapshot(),
+        'timeout_seconds': DIALOGFLOW_TIMEOUT,
+        'hedge_after_seconds': DIALOGFLOW_HEDGE_AFTER
+    }
@@ -0,0 +1,217 @@
+"""Emergency detection: dangerous temperatures and red-flag symptoms in one regex pass.
+
+The engine is compiled once per knowledge base version. Temperature limits
+come from ``emergency_threshold`` (°F) in diseases.json. The symptom keys
+listed in EMERGENCY_SYMPTOMS are matched as phrases ("shortness of
+breath") next to the multilingual keywords below. A single compiled
+alternation finds both in one scan of the message:
+
+    "fever 104", "39.5°C", "१०४ डिग्री", "୧୦୪ ଡିଗ୍ରୀ", "temp 103.5 F"
+
+A number only counts as a temperature when it falls in the body-temperature
+range and either carries a unit (°F, °C, degree, डिग्री, ଡିଗ୍ରୀ) or comes with
+a temperature word (fever, temp, बुखार, ଜ୍ୱର). Bare numbers in the °C range
+(34-43.5, taken as °C) must sit right next to that word ("temperature is
+39.5", "३९ बुखार"); bare °F readings ("fever since 2 days, now 104") may be
+anywhere in the message. A bare number followed by a duration or count is
+never a temperature, so "fever for 40 days" or "3 tablets" are not read
+as one. Most messages contain no digit at all; for those only the keywords
+are searched.
+"""
+import collections
+import collections.abc
+import logging
+import re
+import threading
+
+from utils.knowledge_base import get_knowledge_base
+
+logger = logging.getLogger(__name__)
+
+# Condition -> phrases that signal it (substring match, case-insensitive)
+EMERGENCY_KEYWORDS = {
+    'severe_stomach_pain': ['severe pain', 'गंभीर दर्द', 'ଗଭୀର ଯନ୍ତ୍ରଣା', 'stomach pain', 'पेट दर्द', 'ପେଟ ଯନ୍ତ୍ରଣା'],
+    'difficulty_breathing': ["can't breathe", 'cant breathe', 'सांस नहीं', 'ଦମ ନେବାରେ କଷ୍ଟ', 'breathing problem'],
+    'blood_vomiting': ['blood vomit', 'vomiting blood', 'खून की उल्टी', 'ରକ୍ତ ବାନ୍ତି']
+}
+# Condition -> diseases.json symptom keys that signal it ("shortness_of_breath" -> "shortness of breath")
+EMERGENCY_SYMPTOMS = {
+    'difficulty_breathing': ['shortness_of_breath']
+}
+# Disease -> condition reported when its emergency_threshold is reached
+TEMPERATURE_CONDITIONS = {
+    'fever': 'fever_above_103'
+}
+# Words that make a bare number a temperature reading
+TEMPERATURE_CUES = ['temperature', 'temp', 'fever', 'bukhar', 'bukhaar', 'बुखार', 'तापमान', 'ज्वर', 'ଜ୍ୱର', 'ଜ୍ବର', 'ତାପମାତ୍ରା']
+# Plausible body temperatures
+FAHRENHEIT_RANGE = (93.0, 110.0)
+CELSIUS_RANGE = (34.0, 43.5)
+# Threshold used when the disease has none of its own (and for messages without a disease)
+DEFAULT_THRESHOLD_DISEASE = 'fever'
+
+_FAHRENHEIT_UNITS = r'°\s*f|degrees?\s*(?:f\b|fahrenheit)|deg\s*f\b|fahrenheit|f\b|फ\b|ଫ'
+_CELSIUS_UNITS = r'°\s*c|degrees?\s*(?:c\b|celsius|centigrade)|deg\s*c\b|celsius|centigrade|c\b'
+_DEGREE_UNITS = r'°|degrees?|deg\b|डिग्री|ଡିଗ୍ରୀ'
+# What may separate a temperature word from its bare number ("fever: 104", "temp is 39.5", "बुखार 104")
+_CUE_GAP = re.compile(r'[\s:=,-]*(?:(?:is|of|was|at|hai|है|ହେଉଛି)[\s:=,-]*)?')
+_DIGIT = re.compile(r'\d')
+# A bare number followed by one of these counts something else ("40 days", "100 tablets")
+_NOT_TEMPERATURE = re.compile(
+    r'\s*(?:(?:days?|weeks?|months?|years?|hours?|hrs?|minutes?|mins?|times|tablets?|din)(?![a-z])'
+    r'|दिन|घंटे|सप्ताह|हफ्ते|महीने|साल|बार|ଦିନ|ଘଣ୍ଟା|ସପ୍ତାହ|ମାସ|ବର୍ଷ|ଥର)'
+)
+
+Assessment = collections.namedtuple('Assessment', ['condition', 'temperature_f'])
+
+
+def _alternation(phrases):
+    return '|'.join(re.escape(phrase) for phrase in sorted(set(phrases), key=len, reverse=True))
+
+
+class EmergencyEngine:
+    """Compiled emergency patterns and per-disease temperature thresholds"""
+
+    def __init__(self, diseases):
+        # Disease -> (threshold °F, condition key)
+        self.thresholds = {}
+        for key, info in diseases.items():
+            if not isinstance(info, collections.abc.Mapping) or info.get('emergency_threshold') is None:
+                continue
+            if key not in TEMPERATURE_CONDITIONS:
+                logger.warning("Emergency threshold without a condition key", extra={'disease': key})
+                continue
+            self.thresholds[key] = (float(info['emergency_threshold']), TEMPERATURE_CONDITIONS[key])
+        self.default_disease = DEFAULT_THRESHOLD_DISEASE if DEFAULT_THRESHOLD_DISEASE in self.thresholds else None
+
+        known_symptoms = {symptom for info in diseases.values() if isinstance(info, collections.abc.Mapping) for symptom in info.get('symptoms', ())}
+        self.keywords = {}
+        for condition, phrases in EMERGENCY_KEYWORDS.items():
+            for phrase in phrases:
+                self.keywords.setdefault(phrase.lower(), condition)
+        for condition, symptoms in EMERGENCY_SYMPTOMS.items():
+            for symptom in symptoms:
+                if symptom in known_symptoms:
+                    self.keywords.setdefault(symptom.replace('_', ' '), condition)
+
+        self.keyword_pattern = re.compile(_alternation(self.keywords))
+        # The lookahead lets the scan skip, in C, every position that cannot start a match
+        first_characters = {phrase[0] for phrase in list(self.keywords) + TEMPERATURE_CUES}
+        self.pattern = re.compile(
+            r'(?=[\d' + ''.join(re.escape(character) for character in sorted(first_characters)) + r'])(?:'
+            r'(?P<number>(?<![\d.])\d{2,3}(?:\.\d+)?(?![\d.]))\s*'
+            r'(?:(?P<fahrenheit>' + _FAHRENHEIT_UNITS + r')|(?P<celsius>' + _CELSIUS_UNITS + r')|(?P<degree>' + _DEGREE_UNITS + r'))?'
+            r'|(?P<keyword>' + _alternation(self.keywords) + r')'
+            r'|(?P<cue>' + _alternation(TEMPERATURE_CUES) + r'))'
+        )
+
+    def scan(self, text):
+        """Return (first keyword condition, highest temperature in °F) found in ``text``"""
+        text = text.lower()
+        if _DIGIT.search(text) is None:
+            found = self.keyword_pattern.search(text)
+            return (self.keywords[found.group()] if found else None), None
+        condition = None
+        highest = None
+        cue_end = None
+        bare_numbers = []
+        # \d and float() accept Devanagari and Odia digits as they are
+        for found in self.pattern.finditer(text):
+            kind = found.lastgroup
+            if kind == 'keyword':
+                condition = condition or self.keywords[found.group('keyword')]
+                continue
+            if kind == 'cue':
+                cue_end = found.end()
+                # A bare number just before the cue ("१०४ बुखार")
+                if bare_numbers and _CUE_GAP.fullmatch(text, bare_numbers[-1][1], found.start()):
+                    highest = _higher(highest, _to_fahrenheit(bare_numbers.pop()[0]))
+                continue
+            # A number's last group is its unit, or the number itself when it has none
+            value = float(found.group('number'))
+            if kind == 'fahrenheit':
+                reading = value if FAHRENHEIT_RANGE[0] <= value <= FAHRENHEIT_RANGE[1] else None
+            elif kind == 'celsius':
+                reading = value * 9 / 5 + 32 if CELSIUS_RANGE[0] <= value <= CELSIUS_RANGE[1] else None
+            elif kind == 'degree':
+                reading = _to_fahrenheit(value)
+            else:
+                # Unit-less numbers only count right next to a temperature word
+                if _NOT_TEMPERATURE.match(text, found.end()):
+                    continue
+                if cue_end is not None and _CUE_GAP.fullmatch(text, cue_end, found.start()):
+                    reading = _to_fahrenheit(value)
+                else:
+                    bare_numbers.append((value, found.end()))
+                    continue
+            highest = _higher(highest, reading)
+        if cue_end is not None:
+            for value, _ in bare_numbers:
+                if FAHRENHEIT_RANGE[0] <= value <= FAHRENHEIT_RANGE[1]:
+                    highest = _higher(highest, value)
+        return condition, highest
+
+    def threshold_for(self, disease=None):
+        """(threshold °F, condition key) that applies to ``disease``, or (None, None)"""
+        if disease in self.thresholds:
+            return self.thresholds[disease]
+        if self.default_disease:
+            return self.thresholds[self.default_disease]
+        return None, None
+
+    def assess(self, text, disease=None):
+        """Assessment(condition or None, temperature °F or None) for a message"""
+        if not text:
+            return Assessment(None, None)
+        condition, temperature = self.scan(text)
+        if temperature is not None:
+            threshold, temperature_condition = self.threshold_for(disease)
+            if threshold is not None and temperature >= threshold:
+                # Temperature outranks keywords, as before
+                condition = temperature_condition
+        return Assessment(condition, temperature)
+
+
+def _higher(highest, reading):
+    if reading is None:
+        return highest
+    return reading if highest is None else max(highest, reading)
+
+
+def _to_fahrenheit(value):
+    """A reading without F/C: °C if it fits the Celsius range, °F if that range, else None"""
+    if CELSIUS_RANGE[0] <= value <= CELSIUS_RANGE[1]:
+        return value * 9 / 5 + 32
+    if FAHRENHEIT_RANGE[0] <= value <= FAHRENHEIT_RANGE[1]:
+        return value
+    return None
+
+
+_engine = None
+_engine_version = None
+_engine_lock = threading.Lock()
+
+
+def get_emergency_engine():
+    """Return the engine compiled for the current knowledge base"""
+    global _engine, _engine_version
+    snapshot = get_knowledge_base().snapshot()
+    if _engine_version == snapshot.version:
+        return _engine
+    with _engine_lock:
+        if _engine_version != snapshot.version:
+            _engine = EmergencyEngine(snapshot.diseases)
+            _engine_version = snapshot.version
+    return _engine
+
+
+def assess_emergency(text, disease=None):
+    """Emergency condition key in ``text`` (as in phrases.json emergency_responses), or None"""
+    return get_emergency_engine().assess(text, disease).condition
+
+
+def extract_temperature(text):
+    """Highest body temperature mentioned in ``text``, in °F, or None"""
+    if not text:
+        return None
+    return get_emergency_engine().scan(text)[1]
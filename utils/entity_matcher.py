@@ -0,0 +1,248 @@
+import collections.abc
+import functools
+import hashlib
+import json
+import re
+import threading
+
+from utils.knowledge_base import get_knowledge_base
+
+# Synonyms live with the data: a "synonyms" list (English, romanized and
+# native script) on each entry of diseases.json and vaccines.json. Every
+# entry is also addressable by its own key ("kidney_stone", "kidney stone").
+# The complete_schedule entry's phrases map to SCHEDULE_KEY, which only wins
+# when no specific vaccine is named.
+SCHEDULE_ENTRY = 'complete_schedule'
+SCHEDULE_KEY = 'complete'
+
+# Short Latin phrases ('tb', 'mr', 'je', ...) must stand alone as words
+SHORT_PHRASE_LENGTH = 4
+
+# Short vaccine names are also everyday words ('Mr. Sharma', 'je' in Hinglish),
+# so they only count in a message that talks about vaccination
+VACCINE_CONTEXT = re.compile(
+    r'vaccin|vax|immuni|टीक|ଟିକା|खुराक'
+    r'|(?<![a-z])(?:tika|teeka|doses?|shots?|jabs?|injections?|drops|booster|given|due|schedule|lag(?:ta|ti|te|ega|egi|wa[a-z]*))(?![a-z])'
+)
+
+# What may surround bare vaccine names ('bcg', 'MR?', 'opv and bcg') in a message
+_CONNECTORS = frozenset(['and', 'or', 'aur', 'ya', 'और', 'या', 'ଓ', 'ଏବଂ'])
+_WORD_PATTERN = re.compile(r'''[^\s.,!?;:()"'।/&+-]+''')
+
+# Bump when the pattern generation below changes so stored indexes are rebuilt
+SYNONYM_INDEX_VERSION = 2
+
+# Joiners are optional in typed Odia/Hindi, so they are ignored when matching
+_STRIP_JOINERS = {0x200c: None, 0x200d: None}
+
+
+def normalize_text(text):
+    """Lowercase and drop zero-width joiners so phrases compare consistently"""
+    text = text.lower()
+    if '\u200c' in text or '\u200d' in text:
+        text = text.translate(_STRIP_JOINERS)
+    return text.strip()
+
+
+def _is_latin(phrase):
+    return all(ord(char) < 0x80 for char in phrase)
+
+
+def _build_trie(phrases):
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = phrase
+    return trie
+
+
+def _trie_pattern(node, at_start=False):
+    """Emit a regex for a phrase trie, trying longer continuations first.
+
+    Sharing prefixes keeps the engine from re-testing every synonym at
+    every position. Latin phrases may not start inside a Latin word ('uti'
+    in 'routine', 'tb' in 'outbreak'), and short ones ('tb', 'mr', 'je')
+    must also end at a word boundary.
+    """
+    alternatives = []
+    for char in sorted(key for key in node if key):
+        piece = r'\s+' if char == ' ' else re.escape(char)
+        if at_start and 'a' <= char <= 'z':
+            piece += r'(?<![a-z]' + re.escape(char) + ')'
+        alternatives.append(piece + _trie_pattern(node[char]))
+    if '' in node:
+        phrase = node['']
+        short_latin = _is_latin(phrase) and len(phrase) <= SHORT_PHRASE_LENGTH
+        alternatives.append(r'(?![a-z])' if short_latin else '')
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
+
+
+class EntityMatcher:
+    """All synonyms of one entity type compiled into a single regex.
+
+    ``lookup`` is an exact dict lookup; ``match`` scans the text once and
+    returns the entity of the longest phrase found. Phrases mapping to a
+    key in ``fallback_keys`` only win when nothing more specific matched.
+    With a ``context`` regex, short Latin phrases only count when the
+    context is found, another specific phrase matched, or the message is
+    nothing but matched phrases.
+    """
+
+    def __init__(self, synonyms, fallback_keys=(), context=None):
+        self.fallback_keys = frozenset(fallback_keys)
+        self.context = context
+        self.phrases = {}
+        for key, phrases in synonyms.items():
+            for phrase in phrases:
+                self.phrases.setdefault(normalize_text(phrase), key)
+        self.pattern = re.compile(_trie_pattern(_build_trie(self.phrases), at_start=True))
+
+    @classmethod
+    def from_index(cls, index, fallback_keys=(), context=None):
+        """Rebuild a matcher from ``to_index()`` output without regenerating its pattern"""
+        matcher = cls.__new__(cls)
+        matcher.fallback_keys = frozenset(fallback_keys)
+        matcher.context = context
+        matcher.phrases = dict(index['phrases'])
+        matcher.pattern = re.compile(index['pattern'])
+        return matcher
+
+    def to_index(self):
+        """Normalized phrase table and pattern source, for storing in the KB snapshot"""
+        return {'phrases': dict(self.phrases), 'pattern': self.pattern.pattern}
+
+    def lookup(self, phrase):
+        """Exact lookup of an already isolated phrase"""
+        if not phrase:
+            return None
+        return self.phrases.get(normalize_text(phrase))
+
+    def find_all(self, text):
+        """Return (key, phrase, start, end) for every match in one pass"""
+        if not text:
+            return []
+        normalized = normalize_text(text)
+        results = []
+        for found in self.pattern.finditer(normalized):
+            phrase = found.group()
+            if phrase not in self.phrases:
+                # Matched with extra whitespace between words
+                phrase = ' '.join(phrase.split())
+            results.append((self.phrases[phrase], phrase, found.start(), found.end()))
+        if self.context is not None and results:
+            results = self._in_context(normalized, results)
+        return results
+
+    def _in_context(self, normalized, results):
+        """Drop short Latin matches unless the message gives them context"""
+        short = [_is_latin(phrase) and len(phrase) <= SHORT_PHRASE_LENGTH for _, phrase, _, _ in results]
+        if not any(short):
+            return results
+        if any(not is_short and key not in self.fallback_keys
+               for (key, _, _, _), is_short in zip(results, short)):
+            return results
+        if self.context.search(normalized):
+            return results
+        # A message of bare names ('bcg', 'MR?', 'opv and bcg') is a question about them
+        rest = list(normalized)
+        for _, _, start, end in results:
+            rest[start:end] = ' ' * (end - start)
+        if all(word in _CONNECTORS for word in _WORD_PATTERN.findall(''.join(rest))):
+            return results
+        return [match for match, is_short in zip(results, short) if not is_short]
+
+    def match(self, text):
+        """Return the entity key of the best (longest, specific) match or None"""
+        best = None
+        best_rank = None
+        for key, phrase, start, end in self.find_all(text):
+            rank = (key not in self.fallback_keys, end - start)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = key, rank
+        return best
+
+
+def _entry_synonyms(entries, rename=None):
+    """Entity key -> phrases from the "synonyms" lists of a data file"""
+    synonyms = {}
+    for key, info in entries.items():
+        if not isinstance(info, collections.abc.Mapping):
+            continue
+        phrases = synonyms.setdefault((rename or {}).get(key, key), [])
+        phrases.extend(info.get('synonyms', ()))
+        phrases.extend([key, key.replace('_', ' ')])
+    return synonyms
+
+
+def disease_synonyms(diseases):
+    """Disease key -> phrases, from diseases.json"""
+    return _entry_synonyms(diseases)
+
+
+def vaccine_synonyms(vaccines):
+    """Vaccine key -> phrases, from vaccines.json; schedule phrases map to SCHEDULE_KEY"""
+    return _entry_synonyms(vaccines, rename={SCHEDULE_ENTRY: SCHEDULE_KEY})
+
+
+def _build_matchers(diseases, vaccines):
+    return {
+        'disease': EntityMatcher(disease_synonyms(diseases)),
+        'vaccine': EntityMatcher(vaccine_synonyms(vaccines), fallback_keys=(SCHEDULE_KEY,), context=VACCINE_CONTEXT)
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def synonym_fingerprint():
+    """Hash of the pattern generation; a stored index is only used if it matches.
+
+    The synonyms themselves come from the data files, whose digests the
+    snapshot already checks before it is used.
+    """
+    settings = [SYNONYM_INDEX_VERSION, SHORT_PHRASE_LENGTH, SCHEDULE_ENTRY, SCHEDULE_KEY]
+    return hashlib.sha1(json.dumps(settings).encode('utf-8')).hexdigest()
+
+
+def build_synonym_index(diseases, vaccines):
+    """Precompute both matchers for the data (stored in the KB snapshot)"""
+    index = {name: matcher.to_index() for name, matcher in _build_matchers(diseases, vaccines).items()}
+    index['fingerprint'] = synonym_fingerprint()
+    return index
+
+
+_matchers = {}
+_matchers_version = None
+_matchers_lock = threading.Lock()
+
+
+def _get_matchers():
+    global _matchers, _matchers_version
+    snapshot = get_knowledge_base().snapshot()
+    if _matchers_version == snapshot.version:
+        return _matchers
+    with _matchers_lock:
+        if _matchers_version != snapshot.version:
+            index = snapshot.synonyms
+            if index is not None and index.get('fingerprint') == synonym_fingerprint():
+                _matchers = {
+                    'disease': EntityMatcher.from_index(index['disease']),
+                    'vaccine': EntityMatcher.from_index(index['vaccine'], fallback_keys=(SCHEDULE_KEY,),
+                                                        context=VACCINE_CONTEXT)
+                }
+            else:
+                _matchers = _build_matchers(snapshot.diseases, snapshot.vaccines)
+            _matchers_version = snapshot.version
+    return _matchers
+
+
+def get_disease_matcher():
+    """Return the compiled disease matcher for the current data"""
+    return _get_matchers()['disease']
+
+
+def get_vaccine_matcher():
+    """Return the compiled vaccine matcher for the current data"""
+    return _get_matchers()['vaccine']
@@ -0,0 +1,288 @@
+"""On-box intent and entity classifier used to skip Dialogflow for clear messages.
+
+The rule layer reuses the compiled entity matchers plus a few keyword
+tables and scores a message by how much of it those matches explain. An
+optional naive Bayes token model (trained from labelled messages, e.g.
+past Dialogflow results) can be layered on top:
+
+    python -m utils.intent_classifier train labelled.jsonl data/intent_model.json
+"""
+import collections
+import json
+import logging
+import math
+import os
+import re
+import sys
+
+from utils.entity_matcher import SCHEDULE_KEY, EntityMatcher, get_disease_matcher, get_vaccine_matcher, normalize_text
+from utils.knowledge_base import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Answer locally when confidence reaches this value
+LOCAL_INTENT_THRESHOLD = float(os.environ.get('LOCAL_INTENT_THRESHOLD', '0.8'))
+# Optional trained model; ignored when the file does not exist
+LOCAL_INTENT_MODEL = os.environ.get('LOCAL_INTENT_MODEL', os.path.join(DATA_DIR, 'intent_model.json'))
+
+# Canonical intent names understood by app.process_intent
+INTENT_ALIASES = {
+    'Default Welcome Intent': 'greeting',
+    'welcome': 'greeting',
+    'greeting': 'greeting',
+    'disease_info': 'disease_info',
+    'disease.info': 'disease_info',
+    'get_disease_info': 'disease_info',
+    'vaccine_info': 'vaccine_info',
+    'vaccination': 'vaccine_info',
+    'get_vaccine_info': 'vaccine_info',
+    'emergency': 'emergency',
+    'urgent_help': 'emergency',
+    'emergency_help': 'emergency',
+    'general_health': 'general_health',
+    'health_tips': 'general_health'
+}
+
+INTENT_KEYWORDS = {
+    'greeting': ['hi', 'hello', 'hey', 'namaste', 'namaskar', 'नमस्ते', 'नमस्कार', 'ନମସ୍କାର', 'good morning'],
+    'general_health': ['health tips', 'healthy', 'stay healthy', 'स्वस्थ', 'ସୁସ୍ଥ'],
+    'emergency': [
+        'emergency', 'urgent', 'ambulance', 'आपातकाल', 'ଜରୁରୀ',
+        'severe pain', 'गंभीर दर्द', 'ଗଭୀର ଯନ୍ତ୍ରଣା', 'stomach pain', 'पेट दर्द', 'ପେଟ ଯନ୍ତ୍ରଣା',
+        "can't breathe", 'सांस नहीं', 'ଦମ ନେବାରେ କଷ୍ଟ', 'breathing problem',
+        'blood vomit', 'खून की उल्टी', 'ରକ୍ତ ବାନ୍ତି'
+    ]
+}
+
+# Question words and glue that do not change what the user is asking for
+FILLER_WORDS = frozenset([
+    'what', 'is', 'are', 'the', 'a', 'an', 'of', 'for', 'about', 'tell', 'me', 'my', 'i', 'have',
+    'info', 'information', 'symptoms', 'symptom', 'treatment', 'details', 'please', 'pls', 'vaccine',
+    'vaccination', 'age', 'when', 'how', 'to', 'and', 'in', 'disease', 'hai', 'kya', 'ke', 'bare', 'mein',
+    'severe', 'very', 'high', 'mujhe', 'mera', 'meri',
+    'क्या', 'है', 'हैं', 'के', 'बारे', 'में', 'का', 'की', 'लक्षण', 'इलाज', 'टीका', 'मुझे', 'मेरे', 'मेरा', 'मेरी', 'तेज',
+    'କଣ', 'ବିଷୟରେ', 'ର', 'ଲକ୍ଷଣ', 'ଚିକିତ୍ସା', 'ଟିକା', 'ମୋର', 'ମୋ', 'ମୋତେ', 'ଅଛି', 'ହୋଇଛି'
+])
+
+_TOKEN_PATTERN = re.compile(r'''[^\s.,!?;:()"'।]+''')
+# Numbers such as a temperature ('104', '103.5f') add detail, not a new intent
+_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?°?[fc]?$')
+
+LocalIntent = collections.namedtuple('LocalIntent', ['intent', 'parameters', 'confidence'])
+
+_keyword_matcher = EntityMatcher(INTENT_KEYWORDS)
+
+
+def _tokens(text):
+    return [(found.start(), found.end(), found.group()) for found in _TOKEN_PATTERN.finditer(text)]
+
+
+def _rule_classify(text):
+    """Return (intent, parameters, confidence) from entity and keyword matches"""
+    normalized = normalize_text(text)
+    tokens = _tokens(normalized)
+    if not tokens:
+        return None, {}, 0.0
+
+    spans = []
+    candidates = collections.OrderedDict()
+    parameters = {}
+
+    for key, phrase, start, end in _keyword_matcher.find_all(normalized):
+        spans.append((start, end))
+        candidates.setdefault(key, True)
+
+    disease_matches = get_disease_matcher().find_all(normalized)
+    if disease_matches:
+        spans.extend((start, end) for _, _, start, end in disease_matches)
+        key, _, start, end = max(disease_matches, key=lambda match: match[3] - match[2])
+        parameters['disease'] = key
+        candidates.setdefault('disease_info', True)
+
+    vaccine_matches = get_vaccine_matcher().find_all(normalized)
+    if vaccine_matches:
+        spans.extend((start, end) for _, _, start, end in vaccine_matches)
+        specific = [match for match in vaccine_matches if match[0] != SCHEDULE_KEY]
+        if specific:
+            parameters['vaccine'] = max(specific, key=lambda match: match[3] - match[2])[0]
+        candidates.setdefault('vaccine_info', True)
+
+    if not candidates:
+        return None, {}, 0.0
+
+    if 'disease_info' in candidates and 'vaccine' in parameters:
+        # 'hepatitis' is both a disease and a vaccine: vaccine wording ('hepatitis b',
+        # 'vaccine', 'टीका') settles it; otherwise both stay as competing readings
+        if len(vaccine_matches) > 1 or any(
+            match[3] - match[2] > max(end - start for _, _, start, end in disease_matches)
+            for match in vaccine_matches
+        ):
+            del candidates['disease_info']
+            parameters.pop('disease', None)
+
+    # An emergency keyword decides the intent; a disease alongside it stays a parameter
+    if 'emergency' in candidates:
+        intent = 'emergency'
+    else:
+        intent = next(iter(candidates))
+
+    covered = 0
+    for start, end, token in tokens:
+        if token in FILLER_WORDS or _NUMBER_PATTERN.match(token) or any(span_start < end and start < span_end for span_start, span_end in spans):
+            covered += 1
+    confidence = covered / len(tokens)
+
+    # Several competing intents in one message is exactly what Dialogflow is for
+    competing = len([name for name in candidates if name != intent and not (intent == 'emergency' and name == 'disease_info')])
+    if competing:
+        confidence /= (1 + competing)
+    return intent, parameters, confidence
+
+
+class NaiveBayesIntentModel:
+    """Multinomial naive Bayes over message tokens"""
+
+    def __init__(self, priors, token_log_probs, unknown_log_probs):
+        self.priors = priors
+        self.token_log_probs = token_log_probs
+        self.unknown_log_probs = unknown_log_probs
+
+    @classmethod
+    def train(cls, examples, alpha=1.0):
+        """Train from an iterable of (text, intent) pairs"""
+        intent_counts = collections.Counter()
+        token_counts = collections.defaultdict(collections.Counter)
+        vocabulary = set()
+        for text, intent in examples:
+            intent = INTENT_ALIASES.get(intent, intent)
+            intent_counts[intent] += 1
+            for _, _, token in _tokens(normalize_text(text)):
+                token_counts[intent][token] += 1
+                vocabulary.add(token)
+        total = sum(intent_counts.values())
+        priors = {intent: math.log(count / total) for intent, count in intent_counts.items()}
+        token_log_probs = {}
+        unknown_log_probs = {}
+        for intent in intent_counts:
+            denominator = sum(token_counts[intent].values()) + alpha * (len(vocabulary) + 1)
+            token_log_probs[intent] = {
+                token: math.log((count + alpha) / denominator) for token, count in token_counts[intent].items()
+            }
+            unknown_log_probs[intent] = math.log(alpha / denominator)
+        return cls(priors, token_log_probs, unknown_log_probs)
+
+    def predict(self, text):
+        """Return (intent, probability) for the most likely intent"""
+        tokens = [token for _, _, token in _tokens(normalize_text(text))]
+        scores = {}
+        for intent, prior in self.priors.items():
+            log_probs = self.token_log_probs[intent]
+            unknown = self.unknown_log_probs[intent]
+            scores[intent] = prior + sum(log_probs.get(token, unknown) for token in tokens)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        normalizer = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def to_dict(self):
+        return {
+            'priors': self.priors,
+            'token_log_probs': self.token_log_probs,
+            'unknown_log_probs': self.unknown_log_probs
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['priors'], data['token_log_probs'], data['unknown_log_probs'])
+
+
+_model = None
+_model_loaded = False
+
+
+def get_intent_model():
+    """Load the optional trained model once; None when it is not configured"""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if LOCAL_INTENT_MODEL and os.path.exists(LOCAL_INTENT_MODEL):
+            try:
+                with open(LOCAL_INTENT_MODEL, 'r', encoding='utf-8') as f:
+                    _model = NaiveBayesIntentModel.from_dict(json.load(f))
+            except Exception as e:
+                logger.error("Error loading intent model", extra={'path': LOCAL_INTENT_MODEL, 'error': str(e)})
+    return _model
+
+
+def classify_intent(text):
+    """Classify a message locally and return LocalIntent(intent, parameters, confidence)"""
+    if not text or not isinstance(text, str):
+        return LocalIntent(None, {}, 0.0)
+
+    intent, parameters, confidence = _rule_classify(text)
+
+    model = get_intent_model()
+    if model is not None:
+        model_intent, probability = model.predict(text)
+        if intent is None:
+            # The model alone never answers without an entity to answer about
+            confidence = probability if model_intent in ('greeting', 'general_health') else 0.0
+            intent = model_intent
+        elif model_intent == intent:
+            confidence = max(confidence, probability)
+        else:
+            confidence = min(confidence, 1.0 - probability)
+
+    return LocalIntent(intent, parameters, confidence)
+
+
+# Agreement with Dialogflow ----------------------------------------------------
+
+_agreement = collections.defaultdict(lambda: [0, 0])  # confidence bucket -> [agreed, total]
+
+
+def record_dialogflow_agreement(local, dialogflow_intent):
+    """Log how the local prediction compares with Dialogflow's intent"""
+    dialogflow_canonical = INTENT_ALIASES.get(dialogflow_intent, dialogflow_intent or None)
+    agreed = local.intent is not None and local.intent == dialogflow_canonical
+    bucket = round(math.floor(local.confidence * 10) / 10, 1)
+    stats = _agreement[bucket]
+    stats[0] += int(agreed)
+    stats[1] += 1
+    logger.info("Intent agreement", extra={
+        'local_intent': local.intent,
+        'local_confidence': round(local.confidence, 2),
+        'dialogflow_intent': dialogflow_intent,
+        'agreed': agreed,
+        'sample': True
+    })
+    return agreed
+
+
+def get_agreement_stats():
+    """Return agreement rate per confidence bucket, for tuning the threshold"""
+    return {
+        f'{bucket:.1f}': {'agreed': agreed, 'total': total, 'rate': round(agreed / total, 3) if total else None}
+        for bucket, (agreed, total) in sorted(_agreement.items())
+    }
+
+
+def _train_command(source_path, model_path):
+    examples = []
+    with open(source_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                examples.append((record['text'], record['intent']))
+    model = NaiveBayesIntentModel.train(examples)
+    with open(model_path, 'w', encoding='utf-8') as f:
+        json.dump(model.to_dict(), f, ensure_ascii=False)
+    print(f"Trained intent model on {len(examples)} examples -> {model_path}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'train':
+        print("Usage: python -m utils.intent_classifier train <labelled.jsonl> <model.json>")
+        sys.exit(1)
+    _train_command(sys.argv[2], sys.argv[3])
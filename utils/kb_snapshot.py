@@ -0,0 +1,329 @@
+"""Compact binary image of the knowledge base data files.
+
+Parsing the JSON data in every gunicorn worker costs startup time and a
+private copy of every string per worker. The build step below compiles
+diseases.json, vaccines.json and phrases.json (plus the entity synonym
+index) into one file that workers memory-map read-only, so the kernel
+shares its pages between all of them:
+
+    python -m utils.kb_snapshot build [data/knowledge_base.kbs]
+
+Layout (little-endian, 4-byte aligned):
+
+    header     magic, format version, counts and section sizes
+    sources    JSON {file name: {sha1, size, mtime_ns}} of the files it was built from
+    offsets    uint32 start offset of each string (+ one end offset)
+    nodes      uint32 triples (type, a, b) describing the JSON tree
+    links      uint32 dict entries (key string, value node) / list items
+    blob       every distinct string, UTF-8, stored once
+
+Dicts and lists are exposed as read-only Mapping/Sequence views whose
+strings are decoded from the mapped pages on access. Keys are interned.
+The knowledge base only uses an image whose sources match the current
+data files (same size and mtime, or failing that the same sha1); a stale
+or unreadable image falls back to the JSON files.
+"""
+import array
+import collections.abc
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'HBKB'
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct('<4sHHIIIII')
+
+DICT, LIST, STR, NUMBER, TRUE, FALSE, NULL = range(7)
+_CONSTANTS = {TRUE: True, FALSE: False, NULL: None}
+
+
+class SnapshotError(Exception):
+    """The snapshot file is missing, truncated or of another format"""
+
+
+def source_record(raw, stat):
+    """What an image records about one source file"""
+    return {'sha1': hashlib.sha1(raw).hexdigest(), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def sources_match(sources, paths):
+    """True if the files at ``paths`` ({file name: path}) are the ones ``sources`` records.
+
+    Sizes and mtimes are compared first; only a file whose mtime changed
+    (e.g. after a fresh checkout) is read and hashed.
+    """
+    if set(sources) != set(paths):
+        return False
+    for filename, path in paths.items():
+        record = sources[filename]
+        stat = os.stat(path)
+        if stat.st_size != record['size']:
+            return False
+        if stat.st_mtime_ns != record['mtime_ns']:
+            with open(path, 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != record['sha1']:
+                    return False
+    return True
+
+
+# Building ---------------------------------------------------------------------
+
+class _Builder:
+    def __init__(self):
+        self.strings = {}  # str -> id
+        self.nodes = array.array('I')
+        self.links = array.array('I')
+
+    def intern(self, text):
+        string_id = self.strings.get(text)
+        if string_id is None:
+            string_id = self.strings[text] = len(self.strings)
+        return string_id
+
+    def _node(self, kind, a=0, b=0):
+        self.nodes.extend((kind, a, b))
+        return len(self.nodes) // 3 - 1
+
+    def add(self, value):
+        if isinstance(value, dict):
+            # Children first so this dict's links are contiguous
+            entries = [(self.intern(key), self.add(item)) for key, item in value.items()]
+            first = len(self.links)
+            for entry in entries:
+                self.links.extend(entry)
+            return self._node(DICT, first, len(entries))
+        if isinstance(value, list):
+            items = [self.add(item) for item in value]
+            first = len(self.links)
+            self.links.extend(items)
+            return self._node(LIST, first, len(items))
+        if isinstance(value, str):
+            return self._node(STR, self.intern(value))
+        if value is True:
+            return self._node(TRUE)
+        if value is False:
+            return self._node(FALSE)
+        if value is None:
+            return self._node(NULL)
+        if isinstance(value, (int, float)):
+            return self._node(NUMBER, self.intern(json.dumps(value)))
+        raise TypeError(f'cannot store {type(value).__name__} in a snapshot')
+
+
+def _pad(data):
+    return data + b'\0' * (-len(data) % 4)
+
+
+def encode_snapshot(root, sources):
+    """Serialize ``root`` (JSON-like data) and its source digests to bytes"""
+    builder = _Builder()
+    root_id = builder.add(root)
+
+    blob = bytearray()
+    offsets = array.array('I')
+    for text in builder.strings:  # insertion order == string id
+        offsets.append(len(blob))
+        blob += text.encode('utf-8')
+    offsets.append(len(blob))
+
+    for table in (offsets, builder.nodes, builder.links):
+        if sys.byteorder != 'little':
+            table.byteswap()
+
+    sources_json = _pad(json.dumps(sources, sort_keys=True).encode('utf-8'))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(sources_json), len(offsets),
+                         len(builder.nodes) // 3, len(builder.links), root_id)
+    return b''.join([header, sources_json, offsets.tobytes(), builder.nodes.tobytes(),
+                     builder.links.tobytes(), bytes(blob)])
+
+
+def build_snapshot(data_dir, output_path):
+    """Compile the data files in ``data_dir`` into a snapshot at ``output_path``"""
+    from utils.entity_matcher import build_synonym_index
+    from utils.knowledge_base import DATA_FILES
+
+    sources = {}
+    loaded = {}
+    for name, filename in DATA_FILES.items():
+        with open(os.path.join(data_dir, filename), 'rb') as f:
+            raw = f.read()
+            sources[filename] = source_record(raw, os.fstat(f.fileno()))
+        loaded[name] = json.loads(raw)
+    loaded['synonyms'] = build_synonym_index(loaded['diseases'], loaded['vaccines'])
+
+    data = encode_snapshot(loaded, sources)
+    # Replace atomically: running workers keep their mapping of the old file
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+    return len(data)
+
+
+# Reading ----------------------------------------------------------------------
+
+class SnapshotImage:
+    """A memory-mapped snapshot file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = self._offsets = self._nodes = self._links = self._blob = None
+        try:
+            self._map(path)
+        except Exception:
+            self.close()
+            raise
+
+    def _map(self, path):
+        view = self._view = memoryview(self._mmap)
+        if len(view) < HEADER.size:
+            raise SnapshotError(f'{path}: truncated header')
+        magic, version, _, sources_size, n_offsets, n_nodes, n_links, self.root_id = HEADER.unpack_from(view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(f'{path}: not a format {FORMAT_VERSION} knowledge base snapshot')
+        if sys.byteorder != 'little':
+            raise SnapshotError('snapshots can only be mapped on little-endian hosts')
+
+        position = HEADER.size
+        self.sources = json.loads(bytes(view[position:position + sources_size]).rstrip(b'\0'))
+        position += sources_size
+        self._offsets = view[position:position + 4 * n_offsets].cast('I')
+        position += 4 * n_offsets
+        self._nodes = view[position:position + 12 * n_nodes].cast('I')
+        position += 12 * n_nodes
+        self._links = view[position:position + 4 * n_links].cast('I')
+        position += 4 * n_links
+        self._blob = view[position:]
+        if len(self._blob) != self._offsets[-1]:
+            raise SnapshotError(f'{path}: truncated string table')
+        self._views = {}  # node id -> MappedDict/MappedList
+
+    def close(self):
+        """Unmap the file; views of this image must not be used afterwards"""
+        self._views = {}
+        for name in ('_offsets', '_nodes', '_links', '_blob', '_view'):
+            view = getattr(self, name)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A string slice is still being decoded somewhere; the mapping goes with the last reference
+            pass
+
+    @property
+    def closed(self):
+        return self._mmap.closed
+
+    def string(self, string_id):
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], 'utf-8')
+
+    def value(self, node_id):
+        """Python value of a node (containers as cached read-only views)"""
+        kind = self._nodes[3 * node_id]
+        if kind == STR:
+            return self.string(self._nodes[3 * node_id + 1])
+        if kind in _CONSTANTS:
+            return _CONSTANTS[kind]
+        if kind == NUMBER:
+            return json.loads(self.string(self._nodes[3 * node_id + 1]))
+        view = self._views.get(node_id)
+        if view is None:
+            first, count = self._nodes[3 * node_id + 1], self._nodes[3 * node_id + 2]
+            view = MappedDict(self, first, count) if kind == DICT else MappedList(self, first, count)
+            self._views[node_id] = view
+        return view
+
+    def root(self):
+        return self.value(self.root_id)
+
+
+class MappedDict(collections.abc.Mapping):
+    """Read-only dict view over a snapshot; values are decoded on access"""
+    __slots__ = ('_image', '_first', '_count', '_index')
+
+    def __init__(self, image, first, count):
+        self._image = image
+        self._first = first
+        self._count = count
+        self._index = None
+
+    def _key_index(self):
+        index = self._index
+        if index is None:
+            links, image = self._image._links, self._image
+            index = {}
+            for i in range(self._first, self._first + 2 * self._count, 2):
+                index[sys.intern(image.string(links[i]))] = links[i + 1]
+            self._index = index
+        return index
+
+    def __getitem__(self, key):
+        return self._image.value(self._key_index()[key])
+
+    def __contains__(self, key):
+        return key in self._key_index()
+
+    def __iter__(self):
+        return iter(self._key_index())
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return f'MappedDict({dict(self.items())!r})'
+
+
+class MappedList(collections.abc.Sequence):
+    """Read-only list view over a snapshot"""
+    __slots__ = ('_image', '_first', '_count')
+
+    def __init__(self, image, first, count):
+        self._image = image
+        self._first = first
+        self._count = count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('snapshot list index out of range')
+        return self._image.value(self._image._links[self._first + index])
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return f'MappedList({list(self)!r})'
+
+
+def open_snapshot(path, source_paths):
+    """Map the image at ``path`` if it was built from the files at ``source_paths``, else None"""
+    image = SnapshotImage(path)
+    try:
+        if sources_match(image.sources, source_paths):
+            return image
+    except (OSError, KeyError, TypeError):
+        image.close()
+        raise
+    image.close()
+    return None
+
+
+if __name__ == '__main__':
+    from utils.knowledge_base import DATA_DIR, KB_SNAPSHOT_PATH
+
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != 'build':
+        print("Usage: python -m utils.kb_snapshot build [output.kbs]")
+        sys.exit(1)
+    output = sys.argv[2] if len(sys.argv) == 3 else KB_SNAPSHOT_PATH
+    size = build_snapshot(DATA_DIR, output)
+    print(f"Wrote knowledge base snapshot ({size} bytes) -> {output}")
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from utils.kb_snapshot import SnapshotError, open_snapshot
+from utils.metrics import STAGE_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+DATA_FILES = {
+    'diseases': 'diseases.json',
+    'vaccines': 'vaccines.json',
+    'phrases': 'phrases.json'
+}
+
+# How often (seconds) readers may stat the data files to look for changes
+RELOAD_CHECK_INTERVAL = float(os.environ.get('KB_RELOAD_CHECK_INTERVAL', '2'))
+# Memory-mapped image of the data files (python -m utils.kb_snapshot build);
+# used only while it matches the JSON files, which stay the source of truth
+KB_SNAPSHOT_PATH = os.environ.get('KB_SNAPSHOT_PATH', os.path.join(DATA_DIR, 'knowledge_base.kbs'))
+# A replaced image is unmapped this many seconds after a reload, once requests reading it are done
+KB_SNAPSHOT_CLOSE_DELAY = float(os.environ.get('KB_SNAPSHOT_CLOSE_DELAY', '60'))
+
+
+class KnowledgeSnapshot:
+    """Immutable view of all data files loaded at one point in time.
+
+    ``source`` is 'snapshot' when the data is served from the mapped binary
+    image (read-only Mapping views, plus the precomputed ``synonyms``
+    index) and 'json' when the files were parsed; ``image`` is then the
+    mapped file.
+    """
+    __slots__ = ('diseases', 'vaccines', 'phrases', 'mtimes', 'version', 'source', 'synonyms', 'image')
+
+    def __init__(self, diseases, vaccines, phrases, mtimes, version, source='json', synonyms=None, image=None):
+        self.diseases = diseases
+        self.vaccines = vaccines
+        self.phrases = phrases
+        self.mtimes = mtimes
+        self.version = version
+        self.source = source
+        self.synonyms = synonyms
+        self.image = image
+
+
+class KnowledgeBase:
+    """Process-wide in-memory copy of the JSON data files.
+
+    Readers only dereference ``self._snapshot``, which is replaced as a whole
+    when a reload happens, so the read path never takes a lock. Callers must
+    treat the returned dicts as read-only.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, check_interval=RELOAD_CHECK_INTERVAL, snapshot_path=KB_SNAPSHOT_PATH):
+        self.data_dir = data_dir
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+
+    def _paths(self):
+        return {name: os.path.join(self.data_dir, filename) for name, filename in DATA_FILES.items()}
+
+    def _current_mtimes(self):
+        mtimes = {}
+        for name, path in self._paths().items():
+            try:
+                mtimes[name] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[name] = None
+        return mtimes
+
+    def _load_image(self, mtimes, version):
+        """Snapshot backed by the binary image, or None if it is absent or stale"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        source_paths = {DATA_FILES[name]: path for name, path in self._paths().items()}
+        try:
+            image = open_snapshot(self.snapshot_path, source_paths)
+            if image is None:
+                logger.info("Knowledge base snapshot is stale, using JSON", extra={'path': self.snapshot_path})
+                return None
+            root = image.root()
+            return KnowledgeSnapshot(root['diseases'], root['vaccines'], root['phrases'], mtimes, version,
+                                     source='snapshot', synonyms=root.get('synonyms'), image=image)
+        except (OSError, ValueError, KeyError, TypeError, SnapshotError) as e:
+            logger.warning("Unreadable knowledge base snapshot, using JSON", extra={'path': self.snapshot_path, 'error': str(e)})
+            return None
+
+    @timed(STAGE_SECONDS, 'kb_load')
+    def _load(self, mtimes, version):
+        # The image is checked against file sizes and mtimes, so a fresh one spares reading the JSON at all
+        snapshot = self._load_image(mtimes, version)
+        if snapshot is not None:
+            return snapshot
+
+        raw_files = {}
+        read_errors = {}
+        for name, path in self._paths().items():
+            try:
+                with open(path, 'rb') as f:
+                    raw_files[name] = f.read()
+            except OSError as e:
+                read_errors[name] = e
+
+        loaded = {}
+        mtimes = dict(mtimes)
+        for name, path in self._paths().items():
+            try:
+                if name in read_errors:
+                    raise read_errors[name]
+                loaded[name] = json.loads(raw_files[name])
+            except Exception as e:
+                logger.error("Error loading data file", extra={'path': path, 'error': str(e)})
+                # Forget the mtime so the next check retries this file
+                mtimes[name] = None
+                if self._snapshot is None:
+                    loaded[name] = {}
+                else:
+                    # Keep serving the last good copy of a file that is mid-write or broken
+                    loaded[name] = getattr(self._snapshot, name)
+        return KnowledgeSnapshot(loaded['diseases'], loaded['vaccines'], loaded['phrases'], mtimes, version)
+
+    def reload(self, force=False):
+        """Reload the data files if their mtimes changed (or always when forced)"""
+        with self._reload_lock:
+            mtimes = self._current_mtimes()
+            current = self._snapshot
+            if current is not None and not force and current.mtimes == mtimes:
+                return current
+            version = current.version + 1 if current is not None else 1
+            snapshot = self._load(mtimes, version)
+            self._snapshot = snapshot
+            self._next_check = time.monotonic() + self.check_interval
+            if current is not None and current.image is not None:
+                self._retire_image(current.image)
+        for listener in list(self._listeners):
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Error in knowledge base reload listener")
+        return snapshot
+
+    def _retire_image(self, image):
+        """Unmap a replaced image once requests still reading it have finished"""
+        timer = threading.Timer(KB_SNAPSHOT_CLOSE_DELAY, image.close)
+        timer.daemon = True
+        timer.start()
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the files changed"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.reload()
+        if time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.check_interval
+            if self._current_mtimes() != snapshot.mtimes:
+                return self.reload()
+        return snapshot
+
+    def add_reload_listener(self, listener):
+        """Register ``listener(snapshot)`` to be called after every (re)load"""
+        self._listeners.append(listener)
+
+    @property
+    def diseases(self):
+        return self.snapshot().diseases
+
+    @property
+    def vaccines(self):
+        return self.snapshot().vaccines
+
+    @property
+    def phrases(self):
+        return self.snapshot().phrases
+
+
+knowledge_base = KnowledgeBase()
+
+
+def get_knowledge_base():
+    """Return the process-wide knowledge base"""
+    return knowledge_base
+
+
+def get_knowledge_base_stats():
+    """Return the loaded data version and whether it came from the snapshot or JSON"""
+    snapshot = knowledge_base.snapshot()
+    return {'version': snapshot.version, 'source': snapshot.source, 'snapshot_path': knowledge_base.snapshot_path}
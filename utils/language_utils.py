@@ -1,60 +1,93 @@
 import re
+from collections import namedtuple
 
-def detect_language(text):
+from utils.entity_matcher import get_disease_matcher, get_vaccine_matcher
+
+# Explicit language names, checked in priority order before script detection
+LANGUAGE_INDICATORS = {
+    'odia': ['odia', 'ଓଡ଼ିଆ', 'oriya'],
+    'hindi': ['hindi', 'हिंदी', 'devanagari'],
+    'english': ['english', 'angrezi']
+}
+
+_INDICATOR_LANGUAGES = {
+    indicator: lang for lang, indicators in LANGUAGE_INDICATORS.items() for indicator in indicators
+}
+_INDICATOR_PATTERN = re.compile('|'.join(
+    re.escape(indicator) for indicator in sorted(_INDICATOR_LANGUAGES, key=len, reverse=True)
+))
+
+# UTF-8 lead/second byte pairs of the Odia (U+0B00-0B7F) and Devanagari
+# (U+0900-097F) blocks. 0xE0 is never a continuation byte, so each pair
+# occurrence is exactly one character of that script.
+_ODIA_PREFIXES = (b'\xe0\xac', b'\xe0\xad')
+_DEVANAGARI_PREFIXES = (b'\xe0\xa4', b'\xe0\xa5')
+# bytes.translate deletion table keeping only ASCII letters
+_NON_LATIN_LETTERS = bytes(b for b in range(256) if not (0x41 <= b <= 0x5A or 0x61 <= b <= 0x7A))
+
+LanguageResult = namedtuple('LanguageResult', ['language', 'confidence', 'mixed_script', 'script_counts'])
+
+
+def classify_language(text):
     """
-    Detect language from user input text
-    Returns: 'odia', 'hindi', or 'english'
+    Classify text language from one UTF-8 encoding of the message
+    Returns: LanguageResult(language, confidence, mixed_script, script_counts)
     """
     if not text or not isinstance(text, str):
-        return 'english'
+        return LanguageResult('english', 0.0, False, {'odia': 0, 'hindi': 0, 'english': 0})
     
-    # Clean text
-    text = text.strip()
+    # Explicit language names win, in LANGUAGE_INDICATORS order
+    indicator_langs = {_INDICATOR_LANGUAGES[found] for found in _INDICATOR_PATTERN.findall(text.lower())}
     
-    # Check for explicit language indicators
-    language_indicators = {
-        'odia': ['odia', 'ଓଡ଼ିଆ', 'oriya'],
-        'hindi': ['hindi', 'हिंदी', 'devanagari'],
-        'english': ['english', 'angrezi']
+    # One encode, then byte counting in C instead of a Python loop per script
+    encoded = text.encode('utf-8', 'surrogatepass')
+    counts = {
+        'odia': encoded.count(_ODIA_PREFIXES[0]) + encoded.count(_ODIA_PREFIXES[1]),
+        'hindi': encoded.count(_DEVANAGARI_PREFIXES[0]) + encoded.count(_DEVANAGARI_PREFIXES[1]),
+        'english': len(encoded.translate(None, _NON_LATIN_LETTERS))
     }
+    total = counts['odia'] + counts['hindi'] + counts['english']
+    mixed_script = sum(1 for count in counts.values() if count) > 1
     
-    text_lower = text.lower()
-    for lang, indicators in language_indicators.items():
-        for indicator in indicators:
-            if indicator in text_lower:
-                return lang
-    
-    # Unicode script detection
-    odia_count = count_script_chars(text, 'odia')
-    hindi_count = count_script_chars(text, 'hindi')
-    english_count = count_script_chars(text, 'english')
+    for lang in LANGUAGE_INDICATORS:
+        if lang in indicator_langs:
+            return LanguageResult(lang, 1.0, mixed_script, counts)
     
     # If any Indic script is present, prioritize it
-    if odia_count > 0:
-        return 'odia'
-    elif hindi_count > 0:
-        return 'hindi'
-    elif english_count > 0:
-        return 'english'
+    for lang in ('odia', 'hindi', 'english'):
+        if counts[lang]:
+            return LanguageResult(lang, counts[lang] / total, mixed_script, counts)
     
     # Fallback: check for common words in each language
-    return detect_by_common_words(text)
+    return LanguageResult(detect_by_common_words(text), 0.0, False, counts)
+
+def detect_language(text):
+    """
+    Detect language from user input text
+    Returns: 'odia', 'hindi', or 'english'
+    """
+    return classify_language(text).language
+
+def explicit_language(text):
+    """Return the language the user named ("in hindi", "ଓଡ଼ିଆ"), or None"""
+    if not text:
+        return None
+    named = {_INDICATOR_LANGUAGES[found] for found in _INDICATOR_PATTERN.findall(text.lower())}
+    for lang in LANGUAGE_INDICATORS:
+        if lang in named:
+            return lang
+    return None
 
 def count_script_chars(text, script):
     """Count characters belonging to a specific script"""
-    if script == 'odia':
-        # Odia Unicode range: U+0B00–U+0B7F
-        return sum(1 for char in text if '\u0B00' <= char <= '\u0B7F')
-    elif script == 'hindi':
-        # Devanagari Unicode range: U+0900–U+097F
-        return sum(1 for char in text if '\u0900' <= char <= '\u097F')
-    elif script == 'english':
-        # Basic Latin: U+0000–U+007F
-        return sum(1 for char in text if '\u0000' <= char <= '\u007F' and char.isalpha())
-    return 0
+    return classify_language(text).script_counts.get(script, 0)
 
 def detect_by_common_words(text):
     """Detect language by common words"""
+    return common_word_language(text) or 'english'
+
+def common_word_language(text):
+    """Language whose common words the text has most of, or None if it has none"""
     text_lower = text.lower()
     
     # Common Odia words
@@ -82,6 +115,9 @@ def detect_by_common_words(text):
     hindi_matches = sum(1 for word in hindi_words if word in text_lower)
     english_matches = sum(1 for word in english_words if word in text_lower)
     
+    if not (odia_matches or hindi_matches or english_matches):
+        return None
+
     # Return language with most matches
     if odia_matches > hindi_matches and odia_matches > english_matches:
         return 'odia'
@@ -109,295 +145,83 @@ def get_language_from_dialogflow(parameters):
 
 def normalize_disease_name(disease_input):
     """Normalize disease name from different languages to English key"""
-    disease_mapping = {
-        # Fever mappings
-        'fever': 'fever',
-        'ଜ୍ୱର': 'fever',
-        'jwara': 'fever',
-        'बुखार': 'fever',
-        'bukhar': 'fever',
-        
-        # Cold mappings
-        'cold': 'cold',
-        'common cold': 'cold',
-        'ଶର୍ଦି': 'cold',
-        'sardi': 'cold',
-        'सर्दी': 'cold',
-        
-        # Malaria mappings
-        'malaria': 'malaria',
-        'ମଲେରିଆ': 'malaria',
-        'मलेरिया': 'malaria',
-        
-        # Dengue mappings
-        'dengue': 'dengue',
-        'dengue fever': 'dengue',
-        'ଡେଙ୍ଗୁ': 'dengue',
-        'डेंगू': 'dengue',
-        
-        # Asthma mappings
-        'asthma': 'asthma',
-        'ଆଜମା': 'asthma',
-        'अस्थमा': 'asthma',
-        
-        # Diabetes mappings
-        'diabetes': 'diabetes',
-        'diabetes mellitus': 'diabetes',
-        'ଡାଏବେଟିସ୍': 'diabetes',
-        'ଡାଏବେଟିସ': 'diabetes',
-        'डायबिटीज': 'diabetes',
-        'मधुमेह': 'diabetes',
-        
-        # Hypertension mappings
-        'hypertension': 'hypertension',
-        'high blood pressure': 'hypertension',
-        'ଉଚ୍ଚ ରକ୍ତଚାପ': 'hypertension',
-        'उच्च रक्तचाप': 'hypertension',
-        
-        # Diarrhea mappings
-        'diarrhea': 'diarrhea',
-        'diarrhoea': 'diarrhea',
-        'loose motion': 'diarrhea',
-        'ଝାଡ଼ା': 'diarrhea',
-        'jhada': 'diarrhea',
-        'दस्त': 'diarrhea',
-        'लूज मोशन': 'diarrhea',
-        
-        # Typhoid mappings
-        'typhoid': 'typhoid',
-        'typhoid fever': 'typhoid',
-        'ଟାଇଫଏଡ୍': 'typhoid',
-        'ଟାଇଫଏଡ': 'typhoid',
-        'टाइफाइड': 'typhoid',
-        
-        # Tuberculosis mappings
-        'tuberculosis': 'tuberculosis',
-        'tb': 'tuberculosis',
-        'ଯକ୍ଷ୍ମା': 'tuberculosis',
-        'yakshma': 'tuberculosis',
-        'तपेदिक': 'tuberculosis',
-        'क्षय रोग': 'tuberculosis',
-        
-        # Jaundice mappings
-        'jaundice': 'jaundice',
-        'ଜଣ୍ଡିସ୍': 'jaundice',
-        'ଜଣ୍ଡିସ': 'jaundice',
-        'jandis': 'jaundice',
-        'पीलिया': 'jaundice',
-        
-        # Chickenpox mappings
-        'chickenpox': 'chickenpox',
-        'chicken pox': 'chickenpox',
-        'varicella': 'chickenpox',
-        'ଚିକେନ୍‌ପକ୍ସ': 'chickenpox',
-        'चिकनपॉक्स': 'chickenpox',
-        
-        # Migraine mappings
-        'migraine': 'migraine',
-        'migraine headache': 'migraine',
-        'ମାଇଗ୍ରେନ୍': 'migraine',
-        'माइग्रेन': 'migraine',
-        
-        # Gastritis mappings
-        'gastritis': 'gastritis',
-        'ଗ୍ୟାଷ୍ଟ୍ରାଇଟିସ୍': 'gastritis',
-        'गैस्ट्राइटिस': 'gastritis',
-        
-        # Anemia mappings
-        'anemia': 'anemia',
-        'anaemia': 'anemia',
-        'ରକ୍ତହୀନତା': 'anemia',
-        'एनीमिया': 'anemia',
-        'खून की कमी': 'anemia',
-        
-        # Pneumonia mappings
-        'pneumonia': 'pneumonia',
-        'ନିମୋନିଆ': 'pneumonia',
-        'निमोनिया': 'pneumonia',
-        
-        # Kidney stone mappings
-        'kidney stone': 'kidney_stone',
-        'kidney stones': 'kidney_stone',
-        'renal stone': 'kidney_stone',
-        'renal calculi': 'kidney_stone',
-        'କିଡନୀ ପଥର': 'kidney_stone',
-        'किडनी स्टोन': 'kidney_stone',
-        'पथरी': 'kidney_stone',
-        
-        # Hepatitis mappings
-        'hepatitis': 'hepatitis',
-        'ହେପାଟାଇଟିସ୍': 'hepatitis',
-        'हेपेटाइटिस': 'hepatitis',
-        
-        # Arthritis mappings
-        'arthritis': 'arthritis',
-        'ଆର୍ଥ୍ରାଇଟିସ୍': 'arthritis',
-        'गठिया': 'arthritis',
-        
-        # Ulcer mappings
-        'ulcer': 'ulcer',
-        'stomach ulcer': 'ulcer',
-        'peptic ulcer': 'ulcer',
-        'gastric ulcer': 'ulcer',
-        'ଅଲସର୍': 'ulcer',
-        'अल्सर': 'ulcer',
-        
-        # Thyroid mappings
-        'thyroid': 'thyroid',
-        'thyroid disorder': 'thyroid',
-        'ଥାଇରଏଡ୍': 'thyroid',
-        'थायराइड': 'thyroid',
-        'hypothyroidism': 'thyroid',
-        'hyperthyroidism': 'thyroid',
-        
-        # Bronchitis mappings
-        'bronchitis': 'bronchitis',
-        'ବ୍ରୋଙ୍କାଇଟିସ୍': 'bronchitis',
-        'ब्रोंकाइटिस': 'bronchitis',
-        
-        # Scabies mappings
-        'scabies': 'scabies',
-        'ସ୍କାବିଜ୍': 'scabies',
-        'स्केबीज': 'scabies',
-        'खुजली': 'scabies',
-        
-        # UTI mappings
-        'urinary tract infection': 'urinary_tract_infection',
-        'uti': 'urinary_tract_infection',
-        'urine infection': 'urinary_tract_infection',
-        'ମୂତ୍ରନଳୀ ସଂକ୍ରମଣ': 'urinary_tract_infection',
-        'मूत्र पथ संक्रमण': 'urinary_tract_infection',
-        
-        # Conjunctivitis mappings
-        'conjunctivitis': 'conjunctivitis',
-        'pink eye': 'conjunctivitis',
-        'କଞ୍ଜଙ୍କଟିଭାଇଟିସ୍': 'conjunctivitis',
-        'कंजंक्टिवाइटिस': 'conjunctivitis',
-        'आंख आना': 'conjunctivitis'
-    }
-    
     if not disease_input:
         return None
     
-    disease_lower = disease_input.lower().strip()
+    matcher = get_disease_matcher()
     
-    # Direct mapping
-    if disease_lower in disease_mapping:
-        return disease_mapping[disease_lower]
+    # Direct mapping, then the longest synonym found inside the input
+    disease = matcher.lookup(disease_input) or matcher.match(disease_input)
+    if disease:
+        return disease
     
-    # Partial matching
-    for key, value in disease_mapping.items():
-        if key in disease_lower or disease_lower in key:
-            return value
-    
-    return disease_lower
+    return disease_input.lower().strip()
 
 def normalize_vaccine_name(vaccine_input):
     """Normalize vaccine name from different languages"""
-    vaccine_mapping = {
-    'bcg': 'bcg',
-    'polio': 'opv',
-    'opv': 'opv',
-    'ପୋଲିଓ': 'opv',
-    'पोलियो': 'opv',
-    
-    'dpt': 'dpt',
-    'diphtheria': 'dpt',
-    'pertussis': 'dpt',
-    'tetanus': 'dpt',
-    
-    'measles': 'mr_vaccine',
-    'ହମ୍ପ': 'mr_vaccine',
-    'खसरा': 'mr_vaccine',
-    'mr': 'mr_vaccine',
-    'measles rubella': 'mr_vaccine',
-    
-    'hepatitis': 'hepatitis_b',
-    'hepatitis b': 'hepatitis_b',
-    'ହେପାଟାଇଟିସ': 'hepatitis_b',
-    'हेपेटाइटिस': 'hepatitis_b',
-    
-    'pentavalent': 'pentavalent',
-    'penta': 'pentavalent',
-    'rotavirus': 'rotavirus',
-    'rota': 'rotavirus',
-    'pcv': 'pcv',
-    'pneumococcal': 'pcv',
-    'ipv': 'ipv',
-    'fipv': 'ipv',
-    'inactivated polio': 'ipv',
-    'fractional ipv': 'ipv',
-
-    'je': 'je_vaccine',
-    'japanese encephalitis': 'je_vaccine',
-    'জাপানীজ୍ ଏନସେଫାଲାଇଟିସ୍': 'je_vaccine',
-    'जापानी इंसेफेलाइटिस': 'je_vaccine',
-
-    'dpt booster': 'dpt_booster_1',
-    'dpt booster 1': 'dpt_booster_1',
-    'dpt booster 2': 'dpt_booster_2',
-
-    'opv booster': 'opv_booster',
-    'polio booster': 'opv_booster',
-
-    'td': 'td_vaccine',
-    'tetanus diphtheria': 'td_vaccine',
-    'ଟିଟାନସ୍': 'td_vaccine',
-    'टिटनस': 'td_vaccine',
-    
-    'vaccine': 'complete',
-    'vaccination': 'complete',
-    'टीका': 'complete',
-    'ଟିକା': 'complete',
-    'baby': 'complete',
-    'schedule': 'complete'
-    }
-    
     if not vaccine_input:
         return None
     
-    vaccine_lower = vaccine_input.lower().strip()
+    matcher = get_vaccine_matcher()
     
-    # Direct mapping
-    if vaccine_lower in vaccine_mapping:
-        return vaccine_mapping[vaccine_lower]
+    # Direct mapping, then the longest synonym found inside the input
+    vaccine = matcher.lookup(vaccine_input) or matcher.match(vaccine_input)
+    if vaccine:
+        return vaccine
     
-    # Partial matching
-    for key, value in vaccine_mapping.items():
-        if key in vaccine_lower:
-            return value
-    
-    return vaccine_lower
+    return vaccine_input.lower().strip()
+
+GREETING_RESPONSES = {
+    'odia': "ନମସ୍କାର! ମୁଁ ଆପଣଙ୍କର ସ୍ୱାସ୍ଥ୍ୟ ସହାୟକ। ମୁଁ ରୋଗ ଓ ଟିକା ବିଷୟରେ ସାହାଯ୍ୟ କରିପାରିବି। କେମିତି ସାହାଯ୍ୟ କରିବି?",
+    'english': "Hello! I'm your health assistant. I can help with diseases and vaccination information. How can I help you?",
+    'hindi': "नमस्ते! मैं आपका स्वास्थ्य सहायक हूं। मैं बीमारी और टीकाकरण की जानकारी में मदद कर सकता हूं। मैं कैसे मदद कर सकता हूं?"
+}
 
 def get_greeting_response(language):
     """Get greeting response in specified language"""
-    greetings = {
-        'odia': "ନମସ୍କାର! ମୁଁ ଆପଣଙ୍କର ସ୍ୱାସ୍ଥ୍ୟ ସହାୟକ। ମୁଁ ରୋଗ ଓ ଟିକା ବିଷୟରେ ସାହାଯ୍ୟ କରିପାରିବି। କେମିତି ସାହାଯ୍ୟ କରିବି?",
-        'english': "Hello! I'm your health assistant. I can help with diseases and vaccination information. How can I help you?",
-        'hindi': "नमस्ते! मैं आपका स्वास्थ्य सहायक हूं। मैं बीमारी और टीकाकरण की जानकारी में मदद कर सकता हूं। मैं कैसे मदद कर सकता हूं?"
-    }
-    return greetings.get(language, greetings['english'])
+    return GREETING_RESPONSES.get(language, GREETING_RESPONSES['english'])
 
-def extract_temperature(text):
-    """Extract temperature value from user input"""
+# Age units in English, Hindi and Odia (singular/plural/romanized) -> weeks per unit
+AGE_UNITS = {
+    'week': 1, 'weeks': 1, 'wk': 1, 'wks': 1, 'हफ्ते': 1, 'हफ़्ते': 1, 'सप्ताह': 1, 'ସପ୍ତାହ': 1, 'hafte': 1,
+    'month': 4.345, 'months': 4.345, 'mahine': 4.345, 'महीने': 4.345, 'महीना': 4.345, 'माह': 4.345, 'ମାସ': 4.345,
+    'year': 52.18, 'years': 52.18, 'yr': 52.18, 'yrs': 52.18, 'saal': 52.18, 'साल': 52.18, 'वर्ष': 52.18, 'ବର୍ଷ': 52.18
+}
+
+# Devanagari and Odia digits as typed on Indic keyboards
+_INDIC_DIGITS = str.maketrans('०१२३४५६७८९୦୧୨୩୪୫୬୭୮୯', '01234567890123456789')
+
+# Words for the child; Hindi/Odia case endings may follow ("बच्चे", "ଶିଶୁର")
+CHILD_WORDS = [
+    'baby', 'babies', 'child', 'kid', 'son', 'daughter', 'infant', 'newborn', 'toddler',
+    'bachcha', 'bacha', 'beta', 'beti', 'बच्च', 'बेटा', 'बेटी', 'शिशु', 'ଶିଶୁ', 'ପିଲା', 'ବାଚ୍ଚା', 'ପୁଅ', 'ଝିଅ'
+]
+# Oldest age still treated as a child's (the schedule ends with the 16-year Td dose)
+MAX_CHILD_AGE_WEEKS = 18 * 52.18
+
+_UNITS = '|'.join(sorted((re.escape(unit) for unit in AGE_UNITS), key=len, reverse=True))
+_CHILD = r'(?<![a-z])(?:' + '|'.join(re.escape(word) for word in CHILD_WORDS) + r')'
+# Up to three words between, and no punctuation: "my baby is 10 weeks old", "10 weeks old baby", "6 महीने का बच्चा"
+_WORD = r'[^\s,.;:!?।]*'
+_AGE_PATTERN = re.compile(
+    _CHILD + _WORD + r'(?:\s+' + _WORD + r'){0,3}?\s+(?P<after>\d+(?:\.\d+)?)\s*(?P<after_unit>' + _UNITS + r')(?![a-z])'
+    + r'|(?P<before>\d+(?:\.\d+)?)\s*(?P<before_unit>' + _UNITS + r')(?![a-z])' + _WORD + r'(?:\s+' + _WORD + r'){0,2}?\s+' + _CHILD
+)
+
+def extract_child_age_weeks(text):
+    """Extract a child's age ("my baby is 6 weeks old", "9 महीने का बच्चा", "୨ ବର୍ଷର ଶିଶୁ") in weeks, or None.
+
+    The age must be next to a word for the child, so "I am 28 years old" or
+    "fever for 3 weeks" are not taken for one.
+    """
     if not text:
         return None
-    
-    # Look for temperature patterns
-    temp_patterns = [
-        r'(\d+(?:\.\d+)?)\s*(?:degree|°|deg)?\s*(?:f|fahrenheit|फ|ଫ)?',
-        r'(\d+(?:\.\d+)?)\s*(?:ଡିଗ୍ରୀ|डिग्री)',
-        r'temperature\s+(\d+(?:\.\d+)?)',
-        r'temp\s+(\d+(?:\.\d+)?)'
-    ]
-    
-    text_lower = text.lower()
-    for pattern in temp_patterns:
-        matches = re.findall(pattern, text_lower)
-        if matches:
-            try:
-                return float(matches[0])
-            except ValueError:
-                continue
-    
-    return None
+    found = _AGE_PATTERN.search(text.lower().translate(_INDIC_DIGITS))
+    if not found:
+        return None
+    if found.group('after'):
+        number, unit = found.group('after', 'after_unit')
+    else:
+        number, unit = found.group('before', 'before_unit')
+    weeks = round(float(number) * AGE_UNITS[unit], 1)
+    return weeks if weeks <= MAX_CHILD_AGE_WEEKS else None
@@ -0,0 +1,272 @@
+"""Offline analytics over message logs: diseases, languages, emergencies, fallbacks, latency.
+
+Reads JSONL message logs (plain or .gz, or - for stdin), re-runs disease
+extraction, language detection and the emergency check over each
+message's text on a pool of processes, and writes a summary report:
+
+    python -m utils.log_analytics logs/*.jsonl.gz --output report.json
+    python -m utils.log_analytics app.log --workers 4 --top 20
+
+A record is either a "Message handled" line from the app's JSON logs or
+any JSON object with a text/message/Body field and optional intent,
+language and latency_ms. Other log lines are skipped. The app logs what
+it derived from each message (detected_language, disease, vaccine,
+emergency) next to the text. With LOG_REDACT on (the default) the text is
+only a "<N chars>" placeholder, so those fields are aggregated instead.
+Records with real text and no derived fields (LOG_REDACT=0, or other
+sources) have them worked out again here.
+
+Files are streamed in chunks of lines with a bounded number of chunks in
+flight, and every worker returns counters plus a fixed-size latency
+histogram, so memory stays constant however large the logs are.
+Percentiles are accurate to LATENCY_BUCKET_GROWTH (about 2%).
+"""
+import argparse
+import collections
+import concurrent.futures
+import gzip
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+from utils.disease_handler import check_emergency_condition
+from utils.entity_matcher import get_disease_matcher
+from utils.language_utils import detect_language
+from utils.structured_logging import is_redacted
+
+ANALYTICS_CHUNK_LINES = int(os.environ.get('ANALYTICS_CHUNK_LINES', '5000'))
+
+# Log-spaced latency buckets: each is this much wider than the one before
+LATENCY_BUCKET_GROWTH = 1.02
+LATENCY_MIN_MS = 0.01
+PERCENTILES = (50, 90, 95, 99)
+
+TEXT_FIELDS = ('text', 'message', 'message_body', 'Body', 'query_text', 'queryText')
+FALLBACK_INTENTS = frozenset(['', 'fallback', 'Default Fallback Intent'])
+MESSAGE_LOG_LINE = 'Message handled'
+
+
+class LatencyHistogram:
+    """Mergeable log-bucket histogram: constant memory, relative-error percentiles"""
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        value_ms = max(value_ms, LATENCY_MIN_MS)
+        self.buckets[int(math.log(value_ms / LATENCY_MIN_MS, LATENCY_BUCKET_GROWTH))] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric middle of the bucket, clamped to what was actually observed
+                middle = LATENCY_MIN_MS * LATENCY_BUCKET_GROWTH ** (index + 0.5)
+                return min(max(middle, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        result = {'count': self.count, 'mean': round(self.total / self.count, 3),
+                  'min': round(self.min, 3), 'max': round(self.max, 3)}
+        result.update({f'p{percent}': round(self.percentile(percent), 3) for percent in PERCENTILES})
+        return result
+
+
+class Summary:
+    """Counters for one chunk of log lines; partial summaries merge into the report"""
+
+    def __init__(self):
+        self.totals = collections.Counter()
+        self.counters = collections.defaultdict(collections.Counter)
+        self.latency = LatencyHistogram()
+        self.latency_by_intent = collections.defaultdict(LatencyHistogram)
+
+    def merge(self, other):
+        self.totals.update(other.totals)
+        for name, counter in other.counters.items():
+            self.counters[name].update(counter)
+        self.latency.merge(other.latency)
+        for intent, histogram in other.latency_by_intent.items():
+            self.latency_by_intent[intent].merge(histogram)
+
+    def add(self, record):
+        totals = self.totals
+        totals['messages'] += 1
+        text = next((record[field] for field in TEXT_FIELDS if isinstance(record.get(field), str)), None)
+        if is_redacted(text):
+            totals['redacted'] += 1
+            text = None
+        if 'detected_language' in record:
+            # Derived by the app when it handled the message
+            detected = record['detected_language']
+            disease = record.get('disease')
+            emergency = record.get('emergency')
+            if record.get('vaccine'):
+                self.counters['vaccines'][record['vaccine']] += 1
+        elif text is not None:
+            detected = detect_language(text)
+            disease = get_disease_matcher().match(text)
+            emergency = check_emergency_condition(disease or '', text)
+        else:
+            detected = None
+        if detected is not None:
+            totals['analyzed'] += 1
+            self.counters['detected_languages'][detected] += 1
+            self.counters['diseases'][disease or 'none'] += 1
+            if emergency:
+                totals['emergencies'] += 1
+                self.counters['emergency_conditions'][emergency] += 1
+            logged_language = record.get('language')
+            if logged_language and logged_language != detected:
+                totals['language_mismatches'] += 1
+
+        if record.get('language'):
+            self.counters['languages'][record['language']] += 1
+        if 'intent' in record:
+            intent = record['intent'] or ''
+            totals['with_intent'] += 1
+            self.counters['intents'][intent or 'fallback'] += 1
+            if intent in FALLBACK_INTENTS:
+                totals['fallbacks'] += 1
+
+        latency_ms = record.get('latency_ms')
+        if latency_ms is None and isinstance(record.get('latency'), (int, float)):
+            latency_ms = record['latency'] * 1000
+        if isinstance(latency_ms, (int, float)) and latency_ms >= 0:
+            self.latency.observe(latency_ms)
+            self.latency_by_intent[record.get('intent') or 'fallback'].observe(latency_ms)
+
+
+def analyze_lines(lines):
+    """Summarize one chunk of raw log lines (runs in a worker process)"""
+    summary = Summary()
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            summary.totals['invalid_lines'] += 1
+            continue
+        if not isinstance(record, dict) or ('msg' in record and record['msg'] != MESSAGE_LOG_LINE):
+            summary.totals['skipped_lines'] += 1
+            continue
+        summary.add(record)
+    return summary
+
+
+def read_lines(paths):
+    """Yield raw lines from every file in turn ('-' is stdin, .gz is decompressed)"""
+    for path in paths:
+        if path == '-':
+            yield from sys.stdin.buffer
+            continue
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            yield from f
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def analyze(paths, workers=None, chunk_lines=ANALYTICS_CHUNK_LINES):
+    """Merge the summaries of every chunk; at most two chunks per worker are in memory at once"""
+    workers = workers or os.cpu_count() or 1
+    total = Summary()
+    chunks = chunked(read_lines(paths), chunk_lines)
+    if workers == 1:
+        for chunk in chunks:
+            total.merge(analyze_lines(chunk))
+        return total
+
+    get_disease_matcher()  # built once here and inherited by forked workers
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(analyze_lines, chunk))
+            if len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    total.merge(future.result())
+        for future in concurrent.futures.as_completed(pending):
+            total.merge(future.result())
+    return total
+
+
+def build_report(summary, top=10, seconds=None):
+    """JSON-serializable report from a merged Summary"""
+    totals = summary.totals
+    messages = totals['messages']
+
+    def rate(count, base):
+        return round(count / base, 4) if base else None
+
+    report = {
+        'messages': messages,
+        'messages_analyzed': totals['analyzed'],
+        'redacted_texts': totals['redacted'],
+        'invalid_lines': totals['invalid_lines'],
+        'skipped_lines': totals['skipped_lines'],
+        'emergency_rate': rate(totals['emergencies'], totals['analyzed']),
+        'fallback_rate': rate(totals['fallbacks'], totals['with_intent']),
+        'language_mismatch_rate': rate(totals['language_mismatches'], totals['analyzed']),
+        'latency_ms': summary.latency.summary(),
+        'latency_ms_by_intent': {intent: histogram.summary() for intent, histogram in sorted(summary.latency_by_intent.items())}
+    }
+    for name in ('diseases', 'vaccines', 'languages', 'detected_languages', 'intents', 'emergency_conditions'):
+        report[name] = dict(summary.counters[name].most_common(top))
+    if seconds is not None:
+        report['seconds'] = round(seconds, 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help="JSONL log files (.gz ok), or - for stdin")
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per CPU)')
+    parser.add_argument('--chunk-lines', type=int, default=ANALYTICS_CHUNK_LINES)
+    parser.add_argument('--top', type=int, default=10, help='entries per ranking')
+    parser.add_argument('--output', help='write the report as JSON to this file (default: stdout)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = analyze(args.paths, workers=args.workers, chunk_lines=args.chunk_lines)
+    report = build_report(summary, top=args.top, seconds=time.perf_counter() - started)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"{report['messages']} messages in {report['seconds']} s -> {args.output}")
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEDUP_BACKEND = os.environ.get('DEDUP_BACKEND', 'memory')  # 'memory' or 'sqlite'
+DEDUP_TTL_SECONDS = float(os.environ.get('DEDUP_TTL_SECONDS', '3600'))
+DEDUP_MAX_ENTRIES = int(os.environ.get('DEDUP_MAX_ENTRIES', '100000'))
+DEDUP_SQLITE_PATH = os.environ.get('DEDUP_SQLITE_PATH', '/tmp/whatsapp_dedup.sqlite3')
+
+
+class MemoryDedupStore:
+    """In-process TTL set of message IDs (one per worker)"""
+
+    def __init__(self, ttl=DEDUP_TTL_SECONDS, max_entries=DEDUP_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._expiry = collections.OrderedDict()  # message id -> expiry, oldest first
+        self._lock = threading.Lock()
+
+    def mark_if_new(self, message_id):
+        """Record ``message_id``; return False if it was already seen"""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._expiry.get(message_id)
+            if expires is not None and expires > now:
+                return False
+            self._expiry[message_id] = now + self.ttl
+            self._expiry.move_to_end(message_id)
+            # Entries share one TTL, so expired ones are always at the front
+            while self._expiry:
+                oldest_id, oldest_expiry = next(iter(self._expiry.items()))
+                if oldest_expiry > now and len(self._expiry) <= self.max_entries:
+                    break
+                del self._expiry[oldest_id]
+            return True
+
+    def forget(self, message_id):
+        with self._lock:
+            self._expiry.pop(message_id, None)
+
+
+class SQLiteDedupStore:
+    """Dedup set in a SQLite file shared by every worker on the host"""
+
+    def __init__(self, path=DEDUP_SQLITE_PATH, ttl=DEDUP_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._inserts = 0
+        self._inserts_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS processed_messages '
+                '(message_id TEXT PRIMARY KEY, expires REAL NOT NULL)'
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def mark_if_new(self, message_id):
+        """Record ``message_id``; return False if it was already seen"""
+        now = time.time()
+        conn = self._connection()
+        # Insert, or take over a row whose TTL ran out; rowcount is 0 for a live duplicate
+        cursor = conn.execute(
+            'INSERT INTO processed_messages (message_id, expires) VALUES (?, ?) '
+            'ON CONFLICT(message_id) DO UPDATE SET expires = excluded.expires '
+            'WHERE processed_messages.expires <= ?',
+            (message_id, now + self.ttl, now)
+        )
+        with self._inserts_lock:
+            self._inserts += 1
+            prune = self._inserts % 1000 == 0
+        if prune:
+            conn.execute('DELETE FROM processed_messages WHERE expires <= ?', (now,))
+        return cursor.rowcount == 1
+
+    def forget(self, message_id):
+        self._connection().execute('DELETE FROM processed_messages WHERE message_id = ?', (message_id,))
+
+
+DEDUP_BACKENDS = {
+    'memory': MemoryDedupStore,
+    'sqlite': SQLiteDedupStore
+}
+
+_store = None
+_store_lock = threading.Lock()
+_stats = collections.Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_dedup_store():
+    """Return the configured dedup store, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DEDUP_BACKENDS[DEDUP_BACKEND]()
+    return _store
+
+
+def is_duplicate_message(message_id):
+    """Return True if this Twilio MessageSid was already processed"""
+    if not message_id:
+        return False
+    try:
+        first_time = get_dedup_store().mark_if_new(message_id)
+    except Exception as e:
+        # A broken dedup backend must not stop replies
+        logger.error("Dedup store error", extra={'error': str(e)})
+        _count('errors')
+        return False
+    if first_time:
+        _count('misses')
+        return False
+    _count('hits')
+    return True
+
+
+def forget_message(message_id):
+    """Un-mark a message that could not be handled so Twilio's retry is processed"""
+    if not message_id:
+        return
+    try:
+        get_dedup_store().forget(message_id)
+    except Exception as e:
+        logger.error("Dedup store error", extra={'error': str(e)})
+        _count('errors')
+
+
+def get_dedup_stats():
+    """Return dedup hit counters"""
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        'backend': DEDUP_BACKEND,
+        'hits': stats.get('hits', 0),
+        'misses': stats.get('misses', 0),
+        'errors': stats.get('errors', 0)
+    }
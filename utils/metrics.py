@@ -0,0 +1,368 @@
+"""Counters and latency histograms exported in Prometheus text format.
+
+Enable with METRICS_ENABLED=1. Every worker process keeps its own values in
+memory and a background thread writes them to METRICS_DIR/metrics-<pid>.json;
+a scrape of /metrics on any worker merges the files of all workers, so the
+numbers cover the whole gunicorn pool. Files left by a previous run are
+removed by clear_metrics() (gunicorn.conf.py calls it when the server starts).
+
+When metrics are disabled every metric is a shared no-op object and
+``timed`` returns the decorated function unchanged.
+"""
+import atexit
+import bisect
+import contextlib
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/healthbot-metrics')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# Seconds; covers cache hits (~10us) up to a slow Dialogflow or Twilio call
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}  # name -> metric, in registration order
+_lock = threading.Lock()
+_flusher_pid = None
+
+
+class _NullMetric:
+    """Stands in for every metric when metrics are disabled"""
+
+    def inc(self, *labels, amount=1):
+        pass
+
+    def observe(self, value, *labels):
+        pass
+
+    def set(self, value, *labels):
+        pass
+
+    def time(self, *labels):
+        return _NULL_TIMER
+
+
+_NULL_METRIC = _NullMetric()
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Counter:
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> total
+
+    def inc(self, *labels, amount=1):
+        if _flusher_pid is None:
+            _ensure_flusher()
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dump(self):
+        return {json.dumps(labels): value for labels, value in self.values.items()}
+
+    @staticmethod
+    def merge(into, dumped):
+        for key, value in dumped.items():
+            into[key] = into.get(key, 0) + value
+
+    def render(self, merged):
+        for key, value in sorted(merged.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, json.loads(key))} {_format_value(value)}'
+
+
+class Gauge(Counter):
+    """Last value set per worker; exported with a ``pid`` label"""
+    type_name = 'gauge'
+
+    def set(self, value, *labels):
+        if _flusher_pid is None:
+            _ensure_flusher()
+        with _lock:
+            self.values[labels] = value
+
+    @staticmethod
+    def merge(into, dumped, pid=None):
+        for key, value in dumped.items():
+            into[json.dumps(json.loads(key) + [str(pid)])] = value
+
+    def render(self, merged):
+        labelnames = self.labelnames + ('pid',)
+        for key, value in sorted(merged.items()):
+            yield f'{self.name}{_format_labels(labelnames, json.loads(key))} {_format_value(value)}'
+
+
+class Histogram:
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        if _flusher_pid is None:
+            _ensure_flusher()
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def dump(self):
+        return {json.dumps(labels): list(counts) for labels, counts in self.values.items()}
+
+    @staticmethod
+    def merge(into, dumped):
+        for key, counts in dumped.items():
+            current = into.get(key)
+            if current is None:
+                into[key] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    current[i] += count
+
+    def render(self, merged):
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for key, counts in sorted(merged.items()):
+            labels = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(self.labelnames + ("le",), labels + [bound])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+def _register(metric):
+    if not METRICS_ENABLED:
+        return _NULL_METRIC
+    _registry[metric.name] = metric
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """Register a counter (a no-op object when metrics are disabled)"""
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    """Register a per-worker gauge (a no-op object when metrics are disabled)"""
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Register a histogram (a no-op object when metrics are disabled)"""
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def timed(metric, *labels):
+    """Decorator recording each call's duration in ``metric``"""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started, *labels)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Per-worker files -------------------------------------------------------------
+
+def _worker_path(pid):
+    return os.path.join(METRICS_DIR, f'metrics-{pid}.json')
+
+
+def flush():
+    """Write this worker's values to its file in METRICS_DIR"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        data = {name: metric.dump() for name, metric in _registry.items()}
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _worker_path(os.getpid())
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def clear_metrics():
+    """Delete every worker file in METRICS_DIR (call once before workers start)"""
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json*')):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning("Error removing metrics file", extra={'path': path, 'error': str(e)})
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            logger.warning("Error writing metrics", extra={'error': str(e)})
+
+
+def _ensure_flusher():
+    """Start this process's flush thread on its first recorded value"""
+    global _flusher_pid
+    if _flusher_pid is not None:
+        return
+    with _lock:
+        if _flusher_pid is not None:
+            return
+        threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+        _flusher_pid = os.getpid()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def render_metrics():
+    """Return all workers' metrics in the Prometheus text exposition format"""
+    flush()
+    merged = {name: {} for name in _registry}
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+        try:
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (ValueError, OSError) as e:
+            logger.warning("Skipping unreadable metrics file", extra={'path': path, 'error': str(e)})
+            continue
+        for name, dumped in data.items():
+            metric = _registry.get(name)
+            if metric is None:
+                continue
+            if isinstance(metric, Gauge):
+                # A gauge of an exited worker is meaningless; its counters still count
+                if _pid_alive(pid):
+                    metric.merge(merged[name], dumped, pid)
+            else:
+                metric.merge(merged[name], dumped)
+
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type_name}')
+        lines.extend(metric.render(merged[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def _reset_after_fork():
+    """A forked worker starts from zero; the parent's values are in the parent's file"""
+    global _flusher_pid, _lock
+    _lock = threading.Lock()
+    _flusher_pid = None
+    for metric in _registry.values():
+        metric.values = {}
+
+
+if METRICS_ENABLED:
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_reset_after_fork)
+    atexit.register(flush)
+
+
+# Metrics shared by the app ------------------------------------------------------
+
+STAGE_SECONDS = histogram(
+    'healthbot_stage_seconds',
+    'Time spent in each stage of building and sending a reply',
+    ['stage']
+)
+INTENT_SECONDS = histogram(
+    'healthbot_process_intent_seconds',
+    'Time spent in process_intent per intent',
+    ['intent']
+)
+DIALOGFLOW_REQUESTS = counter(
+    'healthbot_dialogflow_requests_total',
+    'detectIntent calls by outcome',
+    ['outcome']
+)
+DELIVERIES = counter(
+    'healthbot_whatsapp_deliveries_total',
+    'WhatsApp replies by outcome (sent/failed per reply body, retry per Twilio attempt)',
+    ['outcome']
+)
+REPLY_PATHS = counter(
+    'healthbot_replies_total',
+    'WhatsApp replies by how they were produced',
+    ['path']
+)
+BREAKER_TRANSITIONS = counter(
+    'healthbot_circuit_breaker_transitions_total',
+    'Circuit breaker state changes',
+    ['breaker', 'from_state', 'to_state']
+)
+BREAKER_STATE = gauge(
+    'healthbot_circuit_breaker_state',
+    'Circuit breaker state per worker (0 closed, 1 half-open, 2 open)',
+    ['breaker']
+)
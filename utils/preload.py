@@ -0,0 +1,92 @@
+"""Build shared state before forking and per-process resources after.
+
+With gunicorn's preload_app (see gunicorn.conf.py) the master imports the
+app, calls warm_shared_state() and freezes the garbage collector, so every
+worker starts with the knowledge base, the compiled matchers and the
+rendered replies already in (copy-on-write shared) memory. Each worker
+then calls init_worker_resources() to open what must never cross a fork:
+the dedup and conversation stores and the delivery threads with their
+Twilio sessions. The Dialogflow client library (gRPC, protobuf) is slow to
+import and is only loaded on first use; set DIALOGFLOW_WARM_ON_BOOT=1 to
+load it on a background thread at boot instead, while the worker already
+serves health checks and locally answered messages.
+"""
+import gc
+import logging
+import os
+import threading
+import time
+
+from utils.conversation_state import get_conversation_store
+from utils.dialogflow_client import DIALOGFLOW_HEDGE_AFTER, get_dialogflow_client, get_hedge_executor
+from utils.disease_handler import render_disease_info
+from utils.emergency import get_emergency_engine
+from utils.entity_matcher import SCHEDULE_ENTRY, SCHEDULE_KEY, get_disease_matcher, get_vaccine_matcher
+from utils.intent_classifier import classify_intent, get_intent_model
+from utils.knowledge_base import get_knowledge_base
+from utils.language_utils import LANGUAGE_INDICATORS, classify_language
+from utils.message_dedup import get_dedup_store
+from utils.vaccine_handler import render_vaccine_info
+from utils.vaccine_schedule import get_schedule
+from utils.whatsapp_delivery import start_delivery_workers
+
+logger = logging.getLogger(__name__)
+
+# Off by default: the Dialogflow client is built on the first message that needs it.
+# Set to 1 to build it right after a worker boots instead.
+DIALOGFLOW_WARM_ON_BOOT = os.environ.get('DIALOGFLOW_WARM_ON_BOOT', '0').lower() in ('1', 'true', 'yes')
+
+
+def warm_shared_state():
+    """Load and render everything immutable; returns counts for logging"""
+    started = time.monotonic()
+    snapshot = get_knowledge_base().snapshot()
+    get_disease_matcher()
+    get_vaccine_matcher()
+    get_intent_model()
+    get_schedule()
+    get_emergency_engine()
+    classify_intent('warm up')
+    classify_language('warm up')
+
+    rendered = 0
+    # Keys as the handlers pass them: data keys, lowercased, and 'complete' for the schedule
+    vaccine_keys = [key for key in snapshot.vaccines if key != SCHEDULE_ENTRY] + [SCHEDULE_KEY]
+    for language in LANGUAGE_INDICATORS:
+        for disease in snapshot.diseases:
+            render_disease_info(snapshot.version, disease.lower(), language, None)
+            rendered += 1
+        for vaccine in vaccine_keys:
+            render_vaccine_info(snapshot.version, vaccine.lower(), language)
+            rendered += 1
+
+    stats = {
+        'kb_version': snapshot.version,
+        'kb_source': snapshot.source,
+        'rendered_responses': rendered,
+        'seconds': round(time.monotonic() - started, 3)
+    }
+    logger.info("Shared state warmed", extra=stats)
+    return stats
+
+
+def freeze_for_fork():
+    """Move everything allocated so far out of the collector's reach.
+
+    A collection in a worker would otherwise write to the GC headers of
+    the inherited objects and un-share their pages.
+    """
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def init_worker_resources():
+    """Open this process's connections and threads (call in each worker after fork)"""
+    if DIALOGFLOW_HEDGE_AFTER > 0:
+        get_hedge_executor()
+    get_dedup_store()
+    get_conversation_store()
+    start_delivery_workers()
+    if DIALOGFLOW_WARM_ON_BOOT:
+        threading.Thread(target=get_dialogflow_client, name='dialogflow-warm', daemon=True).start()
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket of ``rate`` sends per second with bursts up to ``burst``.
+
+    reserve() always succeeds and returns how long the caller must wait
+    before using its token, so the same bucket serves blocking threads
+    (acquire) and asyncio code (sleep on the returned delay). pause_for()
+    empties the bucket for a server-imposed pause such as a Retry-After.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token; return the seconds to wait before it may be used"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paused_until)
+            self._tokens = min(self.burst, self._tokens + (start - self._updated) * self.rate)
+            self._updated = start
+            self._tokens -= 1
+            wait = start - now
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+            return wait
+
+    def acquire(self):
+        """Block until a send is allowed; return the time waited"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause_for(self, seconds):
+        """Hold every send for ``seconds`` (e.g. Twilio's Retry-After)"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                self._tokens = min(self._tokens, 0.0)
+
+    def snapshot(self):
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'tokens': round(self._tokens, 2),
+            'paused_for_seconds': round(max(0.0, self._paused_until - time.monotonic()), 2)
+        }
+
+
+class TokenBucketRegistry:
+    """One bucket per key (e.g. Twilio account), created on first use"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def get(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def snapshot(self):
+        return {key[-4:]: bucket.snapshot() for key, bucket in list(self._buckets.items())}
+
+    def _after_fork(self):
+        # A lock held by another thread at fork time would never be released in the child
+        self._lock = threading.Lock()
+        for bucket in self._buckets.values():
+            bucket._lock = threading.Lock()
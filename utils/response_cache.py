@@ -0,0 +1,46 @@
+import functools
+import os
+
+from utils.knowledge_base import get_knowledge_base
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '1024'))
+
+_cached_renderers = []
+
+
+def cached_response(func):
+    """Memoize a response renderer in a bounded LRU cache.
+
+    Renderers take the knowledge base version as their first argument, so an
+    entry rendered from old data can never be served after a reload even if
+    it races with the cache clear below.
+    """
+    cached = functools.lru_cache(maxsize=RESPONSE_CACHE_SIZE)(func)
+    _cached_renderers.append(cached)
+    return cached
+
+
+def clear_response_cache():
+    """Drop every memoized response"""
+    for renderer in _cached_renderers:
+        renderer.cache_clear()
+
+
+def get_response_cache_stats():
+    """Return hit/miss counters per renderer and in total"""
+    renderers = {}
+    hits = misses = 0
+    for renderer in _cached_renderers:
+        info = renderer.cache_info()
+        renderers[renderer.__name__] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize
+        }
+        hits += info.hits
+        misses += info.misses
+    return {'hits': hits, 'misses': misses, 'renderers': renderers}
+
+
+get_knowledge_base().add_reload_listener(lambda snapshot: clear_response_cache())
@@ -0,0 +1,117 @@
+"""Split long replies into WhatsApp-sized segments.
+
+Twilio rejects WhatsApp bodies over 1600 characters, counted in UTF-16
+code units (an emoji counts as two). Long Odia/Hindi disease texts plus an
+emergency alert and disclaimer can exceed that, so a reply is cut at the
+coarsest boundary that fits: blank-line sections, then lines, sentences,
+words and finally grapheme clusters, so a conjunct or an emoji is never
+split between two messages.
+
+Renderers decorated with ``segmented`` return a SegmentedText: the
+rendered string with its segments attached, so the split is computed once
+and cached together with the text instead of on every send.
+"""
+import functools
+import os
+import re
+import unicodedata
+
+MAX_SEGMENT_CHARS = int(os.environ.get('WHATSAPP_SEGMENT_CHARS', '1600'))
+
+SENTENCE_END = re.compile(r'(?<=[.!?।॥])\s+')
+
+# (separator used to rejoin pieces, how to split), coarsest first
+_LEVELS = (
+    ('\n\n', lambda text: text.split('\n\n')),
+    ('\n', lambda text: text.split('\n')),
+    (' ', SENTENCE_END.split),
+    (' ', lambda text: text.split(' ')),
+)
+
+_JOINERS = ('\u200c', '\u200d')  # ZWNJ, ZWJ
+
+
+class SegmentedText(str):
+    """Rendered reply text carrying its precomputed WhatsApp segments"""
+    segments = None
+
+
+def text_length(text):
+    """Length as Twilio counts it (UTF-16 code units)"""
+    return len(text) + sum(1 for ch in text if ord(ch) > 0xFFFF)
+
+
+def _extends_cluster(previous, ch):
+    if (previous in _JOINERS or unicodedata.combining(previous) == 9) and not ch.isspace():
+        # After ZWJ/ZWNJ or a virama the next letter is part of the same conjunct/emoji
+        return True
+    return (unicodedata.category(ch) in ('Mn', 'Mc', 'Me') or ch in _JOINERS
+            or '\ufe00' <= ch <= '\ufe0f' or '\U0001f3fb' <= ch <= '\U0001f3ff')
+
+
+def graphemes(text):
+    """Split text into user-perceived characters (base letter + marks, conjuncts, emoji sequences)"""
+    clusters = []
+    for ch in text:
+        if clusters and _extends_cluster(clusters[-1][-1], ch):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return clusters
+
+
+def _split(text, limit, level):
+    if level == len(_LEVELS):
+        separator, pieces = '', graphemes(text)
+    else:
+        separator, splitter = _LEVELS[level]
+        pieces = splitter(text)
+
+    segments = []
+    current, current_length = None, 0
+    for piece in pieces:
+        length = text_length(piece)
+        if length > limit and level < len(_LEVELS):
+            if current is not None:
+                segments.append(current)
+                current = None
+            segments.extend(_split(piece, limit, level + 1))
+            continue
+        if current is not None and current_length + len(separator) + length <= limit:
+            current += separator + piece
+            current_length += len(separator) + length
+        else:
+            if current is not None:
+                segments.append(current)
+            current, current_length = piece, length
+    if current is not None:
+        segments.append(current)
+    return segments
+
+
+def split_message(text, limit=MAX_SEGMENT_CHARS):
+    """Return ``text`` as a tuple of segments of at most ``limit`` UTF-16 units each"""
+    if text_length(text) <= limit:
+        return (text,)
+    return tuple(segment for segment in (s.strip() for s in _split(text, limit, 0)) if segment)
+
+
+def with_segments(text, limit=MAX_SEGMENT_CHARS):
+    """Wrap ``text`` as a SegmentedText with its segments computed"""
+    segmented_text = SegmentedText(text)
+    segmented_text.segments = split_message(text, limit)
+    return segmented_text
+
+
+def message_segments(text):
+    """Segments of a reply, reusing the ones computed at render time if present"""
+    return getattr(text, 'segments', None) or split_message(text)
+
+
+def segmented(func):
+    """Decorator: attach WhatsApp segments to a renderer's result (apply under cached_response)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        text = func(*args, **kwargs)
+        return with_segments(text) if isinstance(text, str) else text
+    return wrapper
@@ -0,0 +1,240 @@
+"""JSON logs written off the request path, with correlation IDs and redaction.
+
+configure_logging() routes the root logger through a bounded in-memory
+queue; a listener thread formats each record as one JSON line on stdout.
+Request threads only enqueue, and when the queue is full the record is
+dropped and counted rather than waited on.
+
+Each line carries the request_id set with request_context() (the Twilio
+MessageSid or a hash of the Dialogflow session). The delivery queue and
+asyncio tasks carry it over to the threads and tasks that finish the
+request. Info lines logged with extra={'sample': True} are kept for a
+LOG_INFO_SAMPLE_RATE fraction of requests. Whole requests are kept or
+dropped together. Phone numbers are masked and message bodies are never
+written when LOG_REDACT is on (the default).
+"""
+import atexit
+import contextlib
+import contextvars
+import copy
+import datetime
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+import zlib
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_INFO_SAMPLE_RATE = float(os.environ.get('LOG_INFO_SAMPLE_RATE', '1'))
+LOG_REDACT = os.environ.get('LOG_REDACT', '1').lower() not in ('0', 'false', 'no')
+
+# International numbers as Twilio sends them ('whatsapp:+919876543210') or typed with separators
+PHONE_PATTERN = re.compile(r'\+?\d(?:[\s-]?\d){9,14}')
+# Extra fields that hold message text; only their length is logged
+BODY_FIELDS = frozenset(['body', 'message', 'message_body', 'reply', 'query_text', 'text'])
+_REDACTED_BODY = re.compile(r'<\d+ chars>')
+
+# Libraries that log every HTTP request at INFO (with account IDs in the URL)
+QUIET_LOGGERS = ('httpx', 'httpcore', 'urllib3')
+
+_STANDARD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'sample', 'taskName'
+}
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+_listener = None
+_handler = None
+_dropped = 0
+_configure_lock = threading.Lock()
+
+
+def get_request_id():
+    """Return the correlation ID of the current request, if any"""
+    return _request_id.get()
+
+
+def bind_request_id(request_id=None):
+    """Set the current correlation ID (generated if missing); returns a token for reset_request_id"""
+    return _request_id.set(request_id or uuid.uuid4().hex[:16])
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+@contextlib.contextmanager
+def request_context(request_id=None):
+    """Tag every log line inside the block with ``request_id`` (generated if missing)"""
+    token = bind_request_id(request_id)
+    try:
+        yield
+    finally:
+        reset_request_id(token)
+
+
+def session_correlation_id(session):
+    """Stable correlation ID for a Dialogflow session path without exposing the session ID"""
+    if not session:
+        return None
+    return 'df-' + hashlib.sha1(session.encode('utf-8')).hexdigest()[:12]
+
+
+def redact_phone(text):
+    """Mask every phone number in ``text`` down to its last four digits"""
+    def mask(match):
+        digits = re.sub(r'\D', '', match.group())
+        return ('+' if match.group().startswith('+') else '') + '*' * (len(digits) - 4) + digits[-4:]
+    return PHONE_PATTERN.sub(mask, text)
+
+
+def is_redacted(value):
+    """True for the '<N chars>' placeholder a redacted message body is logged as"""
+    return isinstance(value, str) and _REDACTED_BODY.fullmatch(value) is not None
+
+
+def _redact_value(key, value):
+    if key in BODY_FIELDS and isinstance(value, str):
+        return f'<{len(value)} chars>'
+    if isinstance(value, str):
+        return redact_phone(value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, extra fields"""
+
+    def format(self, record):
+        message = record.getMessage()
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact_phone(message) if LOG_REDACT else message
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = _redact_value(key, value) if LOG_REDACT else value
+        if record.exc_info:
+            exception = self.formatException(record.exc_info)
+            entry['exc'] = redact_phone(exception) if LOG_REDACT else exception
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _keep_sampled(record):
+    """Drop sampled info lines of requests outside LOG_INFO_SAMPLE_RATE"""
+    if LOG_INFO_SAMPLE_RATE >= 1 or record.levelno > logging.INFO or not getattr(record, 'sample', False):
+        return True
+    request_id = getattr(record, 'request_id', None)
+    if request_id is None:
+        return random.random() < LOG_INFO_SAMPLE_RATE
+    return _request_sampled(request_id)
+
+
+def _request_sampled(request_id):
+    # Same decision for every line of a request so kept requests are complete
+    return zlib.crc32(request_id.encode('utf-8')) % 10000 < LOG_INFO_SAMPLE_RATE * 10000
+
+
+def sampled_info_enabled(logger):
+    """False when a sampled info line logged now would be dropped, so its fields need not be computed"""
+    if not logger.isEnabledFor(logging.INFO):
+        return False
+    request_id = _request_id.get()
+    return LOG_INFO_SAMPLE_RATE >= 1 or request_id is None or _request_sampled(request_id)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread; never waits for queue space"""
+
+    def prepare(self, record):
+        # Merge the arguments now, as QueueHandler.prepare does, since they may
+        # change before the listener gets to the record; JSON formatting and
+        # redaction still happen on the listener thread
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = None
+        record.request_id = _request_id.get()
+        return record
+
+    def emit(self, record):
+        global _dropped
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if not _keep_sampled(record):
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _start(level):
+    global _listener, _handler
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler = NonBlockingQueueHandler(log_queue)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Route all logging through the JSON queue handler (idempotent)"""
+    with _configure_lock:
+        if _listener is None:
+            _start(level)
+
+
+def _restart_after_fork():
+    """The listener thread does not survive fork; a child starts its own"""
+    global _listener, _configure_lock, _dropped
+    _configure_lock = threading.Lock()
+    _dropped = 0
+    if _listener is not None:
+        _listener = None
+        _start(logging.getLogger().level)
+
+
+def _flush_at_exit():
+    if _listener is not None:
+        _listener.stop()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_flush_at_exit)
+
+
+def get_logging_stats():
+    """Return queue depth and the number of records dropped because it was full"""
+    return {
+        'queue_depth': _handler.queue.qsize() if _handler is not None else 0,
+        'queue_capacity': LOG_QUEUE_SIZE,
+        'dropped': _dropped,
+        'info_sample_rate': LOG_INFO_SAMPLE_RATE
+    }
@@ -1,106 +1,181 @@
-import json
-import os
+from utils.entity_matcher import SCHEDULE_ENTRY, SCHEDULE_KEY, get_vaccine_matcher
+from utils.knowledge_base import get_knowledge_base
+from utils.metrics import STAGE_SECONDS
+from utils.response_cache import cached_response
+from utils.segmentation import segmented
+from utils.vaccine_schedule import doses_by_status, get_schedule
 
 def load_vaccine_data():
-    """Load vaccine data from JSON file"""
-    try:
-        with open('data/vaccines.json', 'r', encoding='utf-8') as f:
-            vaccines = json.load(f)
-        
-        with open('data/phrases.json', 'r', encoding='utf-8') as f:
-            phrases = json.load(f)
-            
-        return vaccines, phrases
-    except Exception as e:
-        print(f"Error loading vaccine data: {e}")
-        return {}, {}
+    """Return vaccine and phrases data from the in-memory knowledge base"""
+    snapshot = get_knowledge_base().snapshot()
+    return snapshot.vaccines, snapshot.phrases
 
 def get_vaccine_info(vaccine_name=None, language='english'):
     """Get vaccination information in specified language"""
+    vaccine_key = str(vaccine_name).lower() if vaccine_name else None
+    with STAGE_SECONDS.time('render'):
+        return render_vaccine_info(get_knowledge_base().snapshot().version, vaccine_key, language)
+
+def get_due_vaccines_info(age_weeks, language='english'):
+    """Vaccines due now and next for a child ``age_weeks`` old"""
+    with STAGE_SECONDS.time('render'):
+        return render_due_vaccines(get_knowledge_base().snapshot().version, round(age_weeks * 7), language)
+
+def resolve_vaccine_key(vaccine_name, vaccines):
+    """Data key for a vaccine name or phrase, SCHEDULE_KEY for the whole schedule, or None"""
+    if not vaccine_name:
+        return SCHEDULE_KEY
+    vaccine_name = str(vaccine_name).lower()
+    if vaccine_name in ('all', SCHEDULE_KEY):
+        return SCHEDULE_KEY
+    # Already-normalized keys ('dpt_booster_2', 'opv_booster') map to themselves
+    if vaccine_name in vaccines and vaccine_name != SCHEDULE_ENTRY:
+        return vaccine_name
+    matcher = get_vaccine_matcher()
+    return matcher.lookup(vaccine_name) or matcher.match(vaccine_name.replace('_', ' '))
+
+@cached_response
+@segmented
+def render_vaccine_info(kb_version, vaccine_name, language):
+    """Render the full vaccine reply (schedule or single vaccine + disclaimer)"""
     vaccines, phrases = load_vaccine_data()
     
-    if not vaccine_name or str(vaccine_name).lower() in ['baby', 'schedule', 'complete', 'all']:
+    vaccine_key = resolve_vaccine_key(vaccine_name, vaccines)
+    
+    if vaccine_key == SCHEDULE_KEY:
         # Return complete vaccination schedule
-        if 'complete_schedule' in vaccines:
-            response = vaccines['complete_schedule'][language]
+        if SCHEDULE_ENTRY in vaccines:
+            response = vaccines[SCHEDULE_ENTRY][language]
         else:
             response = get_complete_schedule_manual(vaccines, language)
-    else:
+    elif vaccine_key in vaccines:
         # Return specific vaccine information
-        vaccine_name = str(vaccine_name).lower().replace(' ', '_')
-        
-        # Handle vaccine name variations
-        vaccine_mapping = {
-            'bcg': 'bcg',
-            'polio': 'opv',
-            'opv': 'opv',
-            'dpt': 'dpt',
-            'diphtheria': 'dpt',
-            'pertussis': 'dpt', 
-            'tetanus': 'dpt',
-            'measles': 'mr_vaccine',
-            'mr': 'mr_vaccine',
-            'hepatitis': 'hepatitis_b',
-            'hepatitis_b': 'hepatitis_b',
-            'pentavalent': 'pentavalent',
-            'penta': 'pentavalent',
-            'rotavirus': 'rotavirus',
-            'rota': 'rotavirus',
-            'pcv': 'pcv',
-            'pneumococcal': 'pcv',
-            'ipv': 'ipv',
-            'fipv': 'ipv',
-            'je': 'je_vaccine',
-            'japanese': 'je_vaccine',
-            'dpt_booster': 'dpt_booster_1',
-            'opv_booster': 'opv_booster',
-            'td': 'td_vaccine',
-            'booster': 'dpt_booster_1'
-        }
-        
-        matched_vaccine = None
-        for key, value in vaccine_mapping.items():
-            if key in vaccine_name:
-                matched_vaccine = value
-                break
-        
-        if matched_vaccine and matched_vaccine in vaccines:
-            vaccine_info = vaccines[matched_vaccine]
-            response = format_single_vaccine_response(matched_vaccine, vaccine_info, language)
-        else:
-            response = get_vaccine_not_found_response(language)
+        response = format_single_vaccine_response(vaccine_key, vaccines[vaccine_key], language)
+    else:
+        response = get_vaccine_not_found_response(language)
     
     # Add disclaimer
     response += "\n\n" + phrases['disclaimers']['medical_advice'][language]
     
     return response
 
+VACCINE_DISPLAY_NAMES = {
+    'bcg': {'odia': 'BCG', 'english': 'BCG', 'hindi': 'BCG'},
+    'opv': {'odia': 'OPV (ପୋଲିଓ)', 'english': 'OPV (Polio)', 'hindi': 'OPV (पोलियो)'},
+    'dpt': {'odia': 'DPT', 'english': 'DPT', 'hindi': 'DPT'},
+    'mr_vaccine': {'odia': 'MR Vaccine', 'english': 'MR Vaccine', 'hindi': 'MR टीका'},
+    'hepatitis_b': {'odia': 'ହେପାଟାଇଟିସ୍ B', 'english': 'Hepatitis B', 'hindi': 'हेपेटाइटिस B'},
+    'pentavalent': {'odia': 'Pentavalent', 'english': 'Pentavalent', 'hindi': 'पेंटावैलेंट'},
+    'rotavirus': {'odia': 'Rotavirus', 'english': 'Rotavirus', 'hindi': 'रोटावायरस'},
+    'pcv': {'odia': 'PCV', 'english': 'PCV', 'hindi': 'PCV'},
+    'ipv': {'odia': 'IPV (fIPV)', 'english': 'IPV (fIPV)', 'hindi': 'IPV (fIPV)'},
+    'je_vaccine': {'odia': 'JE Vaccine', 'english': 'JE Vaccine', 'hindi': 'JE टीका'},
+    'dpt_booster_1': {'odia': 'DPT Booster-1', 'english': 'DPT Booster-1', 'hindi': 'DPT बूस्टर-1'},
+    'dpt_booster_2': {'odia': 'DPT Booster-2', 'english': 'DPT Booster-2', 'hindi': 'DPT बूस्टर-2'},
+    'opv_booster': {'odia': 'OPV Booster', 'english': 'OPV Booster', 'hindi': 'OPV बूस्टर'},
+    'td_vaccine': {'odia': 'Td Vaccine', 'english': 'Td Vaccine', 'hindi': 'Td टीका'}
+}
+
+VACCINE_TEMPLATES = {
+    'odia': "💉 {name} ଟିକା:\n📅 ସମୟ: {age}\n🛡️ {description}",
+    'english': "💉 {name} Vaccine:\n📅 Age: {age}\n🛡️ {description}",
+    'hindi': "💉 {name} टीका:\n📅 उम्र: {age}\n🛡️ {description}"
+}
+
 def format_single_vaccine_response(vaccine_name, vaccine_info, language):
     """Format response for a single vaccine"""
-    vaccine_names = {
-        'bcg': {'odia': 'BCG', 'english': 'BCG', 'hindi': 'BCG'},
-        'opv': {'odia': 'OPV (ପୋଲିଓ)', 'english': 'OPV (Polio)', 'hindi': 'OPV (पोलियो)'},
-        'dpt': {'odia': 'DPT', 'english': 'DPT', 'hindi': 'DPT'},
-        'mr_vaccine': {'odia': 'MR Vaccine', 'english': 'MR Vaccine', 'hindi': 'MR टीका'},
-        'hepatitis_b': {'odia': 'ହେପାଟାଇଟିସ୍ B', 'english': 'Hepatitis B', 'hindi': 'हेपेटाइटिस B'},
-        'pentavalent': {'odia': 'Pentavalent', 'english': 'Pentavalent', 'hindi': 'पेंटावैलेंट'},
-        'rotavirus': {'odia': 'Rotavirus', 'english': 'Rotavirus', 'hindi': 'रोटावायरस'},
-        'pcv': {'odia': 'PCV', 'english': 'PCV', 'hindi': 'PCV'},
-        'ipv': {'odia': 'IPV (fIPV)', 'english': 'IPV (fIPV)', 'hindi': 'IPV (fIPV)'},
-        'je_vaccine': {'odia': 'JE Vaccine', 'english': 'JE Vaccine', 'hindi': 'JE टीका'},
-        'dpt_booster_1': {'odia': 'DPT Booster-1', 'english': 'DPT Booster-1', 'hindi': 'DPT बूस्टर-1'},
-        'dpt_booster_2': {'odia': 'DPT Booster-2', 'english': 'DPT Booster-2', 'hindi': 'DPT बूस्टर-2'},
-        'opv_booster': {'odia': 'OPV Booster', 'english': 'OPV Booster', 'hindi': 'OPV बूस्टर'},
-        'td_vaccine': {'odia': 'Td Vaccine', 'english': 'Td Vaccine', 'hindi': 'Td टीका'}
-    }
-    
-    templates = {
-        'odia': f"💉 {vaccine_names.get(vaccine_name, {}).get('odia', vaccine_name.upper())} ଟିକା:\n📅 ସମୟ: {vaccine_info.get('age_odia', '')}\n🛡️ {vaccine_info.get('description_odia', '')}",
-        'english': f"💉 {vaccine_names.get(vaccine_name, {}).get('english', vaccine_name.upper())} Vaccine:\n📅 Age: {vaccine_info.get('age_english', '')}\n🛡️ {vaccine_info.get('description_english', '')}",
-        'hindi': f"💉 {vaccine_names.get(vaccine_name, {}).get('hindi', vaccine_name.upper())} टीका:\n📅 उम्र: {vaccine_info.get('age_hindi', '')}\n🛡️ {vaccine_info.get('description_hindi', '')}"
-    }
+    if language not in VACCINE_TEMPLATES:
+        language = 'english'
     
-    return templates.get(language, templates['english'])
+    # Only the requested language is rendered
+    return VACCINE_TEMPLATES[language].format(
+        name=VACCINE_DISPLAY_NAMES.get(vaccine_name, {}).get(language, vaccine_name.upper()),
+        age=vaccine_info.get(f'age_{language}', ''),
+        description=vaccine_info.get(f'description_{language}', '')
+    )
+
+DUE_VACCINE_TEMPLATES = {
+    'odia': {'title': "👶 {age} ଶିଶୁ ପାଇଁ ଟିକା:", 'due': "✅ ଏବେ ଦେବାକୁ ହେବ: {doses}", 'next': "📅 ପରବର୍ତ୍ତୀ ({when}): {doses}",
+             'missed': "⚠️ ପୂର୍ବରୁ କୌଣସି ଟିକା ଛାଡିଯାଇଥିଲେ, ସ୍ୱାସ୍ଥ୍ୟକେନ୍ଦ୍ରରେ ଏବେ ବି ଦିଆଯାଇପାରିବ।",
+             'none': "ଏହି ବୟସ ପାଇଁ ନିୟମିତ ଟିକା ସମ୍ପୂର୍ଣ୍ଣ।",
+             'days': "{} ଦିନ", 'weeks': "{} ସପ୍ତାହ", 'months': "{} ମାସ", 'years': "{} ବର୍ଷ"},
+    'english': {'title': "👶 Vaccines for a child of {age}:", 'due': "✅ Due now: {doses}", 'next': "📅 Next ({when}): {doses}",
+                'missed': "⚠️ If any earlier vaccine was missed, it can still be given at your health center.",
+                'none': "The routine schedule is complete for this age.",
+                'days': "{} days", 'weeks': "{} weeks", 'months': "{} months", 'years': "{} years"},
+    'hindi': {'title': "👶 {age} के बच्चे के लिए टीके:", 'due': "✅ अभी लगवाएं: {doses}", 'next': "📅 अगला ({when}): {doses}",
+              'missed': "⚠️ अगर पहले कोई टीका छूट गया हो, तो स्वास्थ्य केंद्र पर अब भी लगवाया जा सकता है।",
+              'none': "इस उम्र तक के सभी नियमित टीके पूरे हैं।",
+              'days': "{} दिन", 'weeks': "{} सप्ताह", 'months': "{} महीने", 'years': "{} साल"}
+}
+
+def format_days(days, language):
+    """Render a number of days as days, weeks, months or years"""
+    units = DUE_VACCINE_TEMPLATES.get(language, DUE_VACCINE_TEMPLATES['english'])
+    if days < 14:
+        return units['days'].format(days)
+    if days < 16 * 7:
+        return units['weeks'].format(round(days / 7))
+    if days < 2 * 365:
+        return units['months'].format(round(days / 30.4375))
+    return units['years'].format(round(days / 365.25))
+
+def format_dose(dose, language):
+    """Label like "OPV (Polio)-2"; single-dose vaccines have no number"""
+    name = VACCINE_DISPLAY_NAMES.get(dose.vaccine, {}).get(language, dose.vaccine.upper())
+    return f"{name}-{dose.number}" if dose.doses > 1 else name
+
+@cached_response
+@segmented
+def render_due_vaccines(kb_version, age_days, language):
+    """Render the due-now / next vaccines reply for a child ``age_days`` old"""
+    _, phrases = load_vaccine_data()
+    templates = DUE_VACCINE_TEMPLATES.get(language, DUE_VACCINE_TEMPLATES['english'])
+    grouped = doses_by_status(age_days)
+
+    # Only the lowest dose of each vaccine that is due now
+    due = []
+    seen = set()
+    for dose in sorted(grouped['due'], key=lambda dose: dose.number):
+        if dose.vaccine not in seen:
+            seen.add(dose.vaccine)
+            due.append(dose)
+    due.sort(key=grouped['due'].index)
+
+    lines = [templates['title'].format(age=format_days(age_days, language))]
+    if due:
+        lines.append(templates['due'].format(doses=', '.join(format_dose(dose, language) for dose in due)))
+    if grouped['upcoming']:
+        next_day = grouped['upcoming'][0].start_day
+        doses = [dose for dose in grouped['upcoming'] if dose.start_day == next_day]
+        lines.append(templates['next'].format(
+            when=format_days(next_day - age_days, language),
+            doses=', '.join(format_dose(dose, language) for dose in doses)
+        ))
+    if grouped['overdue']:
+        lines.append(templates['missed'])
+    if not grouped['due'] and not grouped['upcoming']:
+        lines.append(templates['none'])
+
+    return "\n".join(lines) + "\n\n" + phrases['disclaimers']['medical_advice'][language]
+
+REMINDER_TEMPLATES = {
+    'odia': {'text': "💉 ଟିକାକରଣ ସ୍ମାରକ\nଆପଣଙ୍କ ଶିଶୁର {age} ଟିକା ଦେବାର ସମୟ ହୋଇଛି: {doses}\nଦୟାକରି ନିକଟସ୍ଥ ସ୍ୱାସ୍ଥ୍ୟକେନ୍ଦ୍ରକୁ ଯାଆନ୍ତୁ।",
+             'birth': "ଜନ୍ମ ସମୟର"},
+    'english': {'text': "💉 Vaccination reminder\nYour child's {age} vaccines are due: {doses}\nPlease visit your nearest health center.",
+                'birth': "birth"},
+    'hindi': {'text': "💉 टीकाकरण अनुस्मारक\nआपके बच्चे के {age} के टीके लगवाने का समय है: {doses}\nकृपया नजदीकी स्वास्थ्य केंद्र जाएं।",
+              'birth': "जन्म"}
+}
+
+@cached_response
+def render_reminder(kb_version, start_day, language):
+    """Render the reminder for the doses that fall due ``start_day`` days after birth"""
+    templates = REMINDER_TEMPLATES.get(language, REMINDER_TEMPLATES['english'])
+    doses = [dose for dose in get_schedule() if dose.start_day == start_day]
+    age = templates['birth'] if start_day == 0 else format_days(start_day, language)
+    text = templates['text'].format(age=age, doses=', '.join(format_dose(dose, language) for dose in doses))
+    return text + "\n\n" + get_vaccination_reminder(language)
 
 def get_complete_schedule_manual(vaccines, language):
     """Generate complete schedule manually if not in data"""
@@ -135,4 +210,4 @@ def get_vaccination_reminder(language):
 def get_available_vaccines():
     """Return list of available vaccines"""
     vaccines, _ = load_vaccine_data()
-    return [v for v in vaccines.keys() if v != 'complete_schedule']
+    return [v for v in vaccines.keys() if v != SCHEDULE_ENTRY]
@@ -0,0 +1,189 @@
+"""Age-based vaccination schedule: which doses are due, overdue or upcoming.
+
+The ages in vaccines.json ("At birth (0), 6, 10, 14 weeks", "9-12 months,
+16-24 months", "10 and 16 years") are parsed into one Dose per shot with
+the day it becomes due and the last day of its window. A dose is upcoming
+before its first day, due until DOSE_GRACE_DAYS after its window ends (but
+never once the next dose of the same vaccine is due) and overdue after
+that, unless it was given. Doses are numbered from 1, or from 0 when the
+data marks a birth dose "(0)" as for OPV.
+
+One child is evaluated in plain Python (doses_by_status, child_schedule).
+evaluate_batch() evaluates a whole register of birth dates at once with
+NumPy for the nightly reminder runs; NumPy is imported on first use so the
+web workers never load it.
+"""
+import collections
+import collections.abc
+import datetime
+import logging
+import os
+import re
+import threading
+
+from utils.knowledge_base import get_knowledge_base
+
+logger = logging.getLogger(__name__)
+
+# How long after the end of its window a dose still counts as due rather than overdue
+DOSE_GRACE_DAYS = int(os.environ.get('DOSE_GRACE_DAYS', '28'))
+# Children evaluated per NumPy step; bounds the temporary (rows x doses) arrays
+BATCH_CHUNK_ROWS = int(os.environ.get('SCHEDULE_BATCH_CHUNK_ROWS', '65536'))
+
+UNIT_DAYS = {'day': 1, 'week': 7, 'month': 30.4375, 'year': 365.25}
+
+UPCOMING, DUE, OVERDUE, GIVEN = 0, 1, 2, 3
+STATUS_NAMES = ('upcoming', 'due', 'overdue', 'given')
+
+_AGE_TOKEN = re.compile(
+    r'(?P<birth>birth)'
+    r'|(?P<start>\d+(?:\.\d+)?)(?:\s*-\s*(?P<end>\d+(?:\.\d+)?))?'
+    r'|(?P<unit>day|week|month|year)s?\b'
+)
+_PARENTHESES = re.compile(r'\([^)]*\)')
+
+
+class Dose(collections.namedtuple('Dose', ['id', 'vaccine', 'number', 'doses', 'start_day', 'end_day', 'due_until'])):
+    """One shot: vaccine key, dose number of ``doses``, window and last due day in days of age"""
+    __slots__ = ()
+
+
+def parse_age_offsets(text):
+    """Parse an age description into [(start_day, end_day), ...] in order.
+
+    Numbers take the next unit ("6, 10, 14 weeks"), ranges give a window
+    ("9-12 months") and "birth" is day 0; parenthesised notes are ignored.
+    """
+    offsets = []
+    pending = []
+    for token in _AGE_TOKEN.finditer(_PARENTHESES.sub(' ', text.lower())):
+        if token.group('birth'):
+            offsets.append((0, 0))
+        elif token.group('start'):
+            pending.append((float(token.group('start')), float(token.group('end') or token.group('start'))))
+        elif pending:
+            days = UNIT_DAYS[token.group('unit')]
+            offsets.extend((round(start * days), round(end * days)) for start, end in pending)
+            pending = []
+    if pending:
+        raise ValueError(f"Age without a unit: {text!r}")
+    return offsets
+
+
+def build_schedule(vaccines):
+    """Doses for every vaccine in the data, ordered by the day they become due"""
+    doses = []
+    for vaccine, info in vaccines.items():
+        age = info.get('age_english') if isinstance(info, collections.abc.Mapping) else None
+        if not age:
+            continue
+        try:
+            offsets = parse_age_offsets(age)
+        except ValueError as e:
+            logger.warning("Skipping vaccine with an unparseable age", extra={'vaccine': vaccine, 'error': str(e)})
+            continue
+        first = 0 if '(0)' in age else 1
+        for index, (start_day, end_day) in enumerate(offsets):
+            due_until = end_day + DOSE_GRACE_DAYS
+            if index + 1 < len(offsets):
+                # Due windows of one vaccine never overlap: the next dose takes over
+                due_until = min(due_until, offsets[index + 1][0] - 1)
+            number = first + index
+            doses.append(Dose(f'{vaccine}-{number}', vaccine, number, len(offsets), start_day, end_day, due_until))
+    # Stable sort keeps the data file's vaccine order within a day
+    return tuple(sorted(doses, key=lambda dose: dose.start_day))
+
+
+_schedule = ()
+_schedule_version = None
+_schedule_lock = threading.Lock()
+
+
+def get_schedule():
+    """Return the parsed schedule for the current knowledge base"""
+    global _schedule, _schedule_version
+    snapshot = get_knowledge_base().snapshot()
+    if _schedule_version == snapshot.version:
+        return _schedule
+    with _schedule_lock:
+        if _schedule_version != snapshot.version:
+            _schedule = build_schedule(snapshot.vaccines)
+            _schedule_version = snapshot.version
+    return _schedule
+
+
+def dose_status(dose, age_days, given=False):
+    """Status code of ``dose`` for a child ``age_days`` old"""
+    if given:
+        return GIVEN
+    if age_days < dose.start_day:
+        return UPCOMING
+    if age_days <= dose.due_until:
+        return DUE
+    return OVERDUE
+
+
+def doses_by_status(age_days, given=()):
+    """{'due': [Dose], 'overdue': [...], 'upcoming': [...], 'given': [...]} for one child"""
+    grouped = {name: [] for name in STATUS_NAMES}
+    for dose in get_schedule():
+        grouped[STATUS_NAMES[dose_status(dose, age_days, dose.id in given)]].append(dose)
+    return grouped
+
+
+def child_schedule(date_of_birth, today=None, given=()):
+    """Like doses_by_status, with (Dose, due date) pairs for a child born on ``date_of_birth``"""
+    today = today or datetime.date.today()
+    grouped = doses_by_status((today - date_of_birth).days, given)
+    return {
+        name: [(dose, date_of_birth + datetime.timedelta(days=dose.start_day)) for dose in doses]
+        for name, doses in grouped.items()
+    }
+
+
+BatchResult = collections.namedtuple('BatchResult', ['doses', 'status', 'next_due_days', 'counts'])
+
+
+def evaluate_batch(birth_dates, today=None, given=None, doses=None):
+    """Evaluate the schedule for many children at once.
+
+    ``birth_dates`` is anything numpy.asarray turns into datetime64[D]
+    (dates, ISO strings, a datetime64 column); ``given`` an optional
+    (children x doses) boolean array of doses already recorded. Returns a
+    BatchResult with ``status`` (children x doses, int8 status codes),
+    ``next_due_days`` (days until each child's next upcoming dose, -1 if
+    none) and per-status ``counts`` for each dose.
+    """
+    import numpy as np
+
+    doses = doses if doses is not None else get_schedule()
+    births = np.asarray(birth_dates, dtype='datetime64[D]').reshape(-1)
+    today = np.datetime64(today or datetime.date.today(), 'D')
+    ages = (today - births).astype(np.int32)
+
+    starts = np.array([dose.start_day for dose in doses], dtype=np.int32)
+    last_due = np.array([dose.due_until for dose in doses], dtype=np.int32)
+    if given is not None:
+        given = np.asarray(given, dtype=bool)
+        if given.shape != (len(ages), len(doses)):
+            raise ValueError(f"given must have shape {(len(ages), len(doses))}, got {given.shape}")
+
+    status = np.empty((len(ages), len(doses)), dtype=np.int8)
+    next_due_days = np.empty(len(ages), dtype=np.int32)
+    no_dose = np.iinfo(np.int32).max
+    for begin in range(0, len(ages), BATCH_CHUNK_ROWS):
+        rows = slice(begin, begin + BATCH_CHUNK_ROWS)
+        age = ages[rows, None]
+        chunk = status[rows]
+        chunk.fill(OVERDUE)
+        chunk[age <= last_due] = DUE
+        upcoming = age < starts
+        chunk[upcoming] = UPCOMING
+        if given is not None:
+            chunk[given[rows]] = GIVEN
+            upcoming &= ~given[rows]
+        days_until = np.where(upcoming, starts - age, no_dose).min(axis=1, initial=no_dose)
+        next_due_days[rows] = np.where(days_until == no_dose, -1, days_until)
+
+    counts = {name: np.count_nonzero(status == code, axis=0) for code, name in enumerate(STATUS_NAMES)}
+    return BatchResult(doses, status, next_due_days, counts)
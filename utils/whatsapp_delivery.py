@@ -0,0 +1,583 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import STAGE_SECONDS, DELIVERIES, timed
+from utils.rate_limiter import TokenBucketRegistry
+from utils.segmentation import MAX_SEGMENT_CHARS, message_segments, text_length
+
+logger = logging.getLogger(__name__)
+
+TWILIO_API_BASE = os.environ.get('TWILIO_API_BASE', 'https://api.twilio.com')
+TWILIO_FROM_NUMBER = os.environ.get('TWILIO_FROM_NUMBER', 'whatsapp:+14155238886')  # Twilio sandbox number
+
+DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', '4'))
+# Threads computing queued replies (Dialogflow calls etc.), separate from the senders
+DELIVERY_BUILDERS = int(os.environ.get('DELIVERY_BUILDERS', '16'))
+DELIVERY_QUEUE_SIZE = int(os.environ.get('DELIVERY_QUEUE_SIZE', '500'))
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_MAX_ATTEMPTS', '4'))
+DELIVERY_BACKOFF_BASE = float(os.environ.get('DELIVERY_BACKOFF_BASE', '0.25'))
+DELIVERY_BACKOFF_CAP = float(os.environ.get('DELIVERY_BACKOFF_CAP', '4'))
+# Replies for one recipient queued within this many seconds of each other go out as one message
+DELIVERY_COALESCE_WINDOW = float(os.environ.get('DELIVERY_COALESCE_WINDOW', '0.25'))
+# (connect, read) timeouts in seconds for each Twilio request
+TWILIO_TIMEOUT = (
+    float(os.environ.get('TWILIO_CONNECT_TIMEOUT', '3')),
+    float(os.environ.get('TWILIO_READ_TIMEOUT', '10'))
+)
+
+# Pooled connections per event loop in async serving mode
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('TWILIO_ASYNC_MAX_CONNECTIONS', '100'))
+
+# Sends per second (and burst) per Twilio account in each worker process; split
+# the account's limit across processes when running several workers
+TWILIO_RATE_PER_SECOND = float(os.environ.get('TWILIO_RATE_PER_SECOND', '20'))
+TWILIO_RATE_BURST = float(os.environ.get('TWILIO_RATE_BURST', '20'))
+# Longest Retry-After (seconds) we pause for; beyond that the attempt just fails
+TWILIO_MAX_RETRY_AFTER = float(os.environ.get('TWILIO_MAX_RETRY_AFTER', '30'))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_rate_limits = TokenBucketRegistry(TWILIO_RATE_PER_SECOND, TWILIO_RATE_BURST)
+
+_local = threading.local()
+
+
+def _get_session():
+    """Return this thread's keep-alive session to api.twilio.com"""
+    session = getattr(_local, 'session', None)
+    if session is None or getattr(_local, 'pid', None) != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _local.session = session
+        _local.pid = os.getpid()
+    return session
+
+
+def _backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given (0-based) retry"""
+    return random.uniform(0, min(DELIVERY_BACKOFF_CAP, DELIVERY_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _retry_after_seconds(response):
+    """Seconds from a Retry-After header, or None if absent/unparseable"""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return min(max(float(value), 0.0), TWILIO_MAX_RETRY_AFTER)
+    except ValueError:
+        return None
+
+
+def _throttle(account_sid, response):
+    """Pause this account's sends when Twilio asks us to slow down"""
+    retry_after = _retry_after_seconds(response)
+    if response.status_code == 429 or retry_after:
+        _count('throttled')
+        bucket = _rate_limits.get(account_sid)
+        bucket.pause_for(retry_after if retry_after is not None else 1.0)
+
+
+@timed(STAGE_SECONDS, 'delivery')
+def send_whatsapp_message(to_number, message):
+    """Send WhatsApp message via Twilio, split into ordered segments if it is too long"""
+    # Each segment waits for Twilio to accept the previous one so they arrive
+    # in order; a failed segment stops the rest rather than leave a gap
+    sent = all(_send_body(to_number, segment) for segment in message_segments(message))
+    _record_outcome(sent)
+    return sent
+
+
+def _twilio_credentials():
+    """(account_sid, auth_token), or None (logged) when they are not configured"""
+    account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    if not account_sid or not auth_token:
+        logger.error("Twilio credentials not found in environment variables")
+        return None
+    return account_sid, auth_token
+
+
+def _post_once(to_number, message, credentials, attempt):
+    """One Twilio request; return 'sent', 'retry' (transient failure) or 'failed'"""
+    account_sid = credentials[0]
+    url = f"{TWILIO_API_BASE}/2010-04-01/Accounts/{account_sid}/Messages.json"
+    data = {
+        'From': TWILIO_FROM_NUMBER,
+        'To': f'whatsapp:{to_number}',
+        'Body': message
+    }
+    try:
+        response = _get_session().post(url, data=data, auth=credentials, timeout=TWILIO_TIMEOUT)
+        if response.status_code == 201:
+            logger.info("WhatsApp message sent", extra={'attempt': attempt + 1, 'sample': True})
+            return 'sent'
+        logger.warning("Twilio API error", extra={'status': response.status_code, 'response': response.text[:500], 'attempt': attempt + 1})
+        _throttle(account_sid, response)
+        return 'retry' if response.status_code in RETRYABLE_STATUS_CODES else 'failed'
+    except requests.RequestException as e:
+        logger.warning("Error sending WhatsApp message", extra={'error': str(e), 'attempt': attempt + 1})
+        return 'retry'
+
+
+def _send_body(to_number, message):
+    """Send one message body, retrying transient failures (blocks while backing off)"""
+    credentials = _twilio_credentials()
+    if credentials is None:
+        return False
+
+    logger.info("Sending WhatsApp message", extra={'to': to_number, 'chars': len(message), 'sample': True})
+    bucket = _rate_limits.get(credentials[0])
+
+    for attempt in range(DELIVERY_MAX_ATTEMPTS):
+        # Also holds the attempt until a Retry-After from an earlier 429 has passed
+        waited = bucket.acquire()
+        if waited:
+            STAGE_SECONDS.observe(waited, 'rate_limit_wait')
+        outcome = _post_once(to_number, message, credentials, attempt)
+        if outcome == 'sent':
+            return True
+        if outcome == 'failed' or attempt == DELIVERY_MAX_ATTEMPTS - 1:
+            break
+        _count('retries')
+        DELIVERIES.inc('retry')
+        time.sleep(_backoff_delay(attempt))
+    return False
+
+
+_async_clients = {}  # event loop -> httpx.AsyncClient
+
+
+def _get_async_client():
+    """Return the pooled httpx client for the running event loop"""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(TWILIO_TIMEOUT[1], connect=TWILIO_TIMEOUT[0]),
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS)
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_clients():
+    """Close the httpx client of the running event loop (call on shutdown)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def send_whatsapp_message_async(to_number, message):
+    """Async twin of send_whatsapp_message for the ASGI server"""
+    with STAGE_SECONDS.time('delivery'):
+        for segment in message_segments(message):
+            if not await _send_body_async(to_number, segment):
+                return False
+    return True
+
+
+async def _send_body_async(to_number, message):
+    import httpx
+
+    credentials = _twilio_credentials()
+    if credentials is None:
+        return False
+    account_sid = credentials[0]
+
+    url = f"{TWILIO_API_BASE}/2010-04-01/Accounts/{account_sid}/Messages.json"
+    data = {
+        'From': TWILIO_FROM_NUMBER,
+        'To': f'whatsapp:{to_number}',
+        'Body': message
+    }
+
+    bucket = _rate_limits.get(account_sid)
+
+    for attempt in range(DELIVERY_MAX_ATTEMPTS):
+        retryable = True
+        waited = bucket.reserve()
+        if waited > 0:
+            STAGE_SECONDS.observe(waited, 'rate_limit_wait')
+            await asyncio.sleep(waited)
+        try:
+            response = await _get_async_client().post(url, data=data, auth=credentials)
+            if response.status_code == 201:
+                return True
+            logger.warning("Twilio API error", extra={'status': response.status_code, 'response': response.text[:500], 'attempt': attempt + 1})
+            retryable = response.status_code in RETRYABLE_STATUS_CODES
+            _throttle(account_sid, response)
+        except httpx.HTTPError as e:
+            logger.warning("Error sending WhatsApp message", extra={'error': str(e), 'attempt': attempt + 1})
+
+        if not retryable or attempt == DELIVERY_MAX_ATTEMPTS - 1:
+            break
+        _count('retries')
+        DELIVERIES.inc('retry')
+        await asyncio.sleep(_backoff_delay(attempt))
+    return False
+
+
+# Delivery queue ------------------------------------------------------------
+#
+# Replies are sharded by recipient over DELIVERY_WORKERS threads: one
+# recipient's replies are always handled by the same thread, in order,
+# while different recipients are served in parallel. Replies that still
+# need computing (e.g. a Dialogflow round trip) are built on a separate
+# pool of DELIVERY_BUILDERS threads, so a slow build never holds up other
+# recipients of the shard. One recipient's replies are still built one at
+# a time in arrival order, since each build reads and then saves that
+# conversation's state. A shard thread waits until the oldest built reply
+# of a recipient is DELIVERY_COALESCE_WINDOW old, then takes every built
+# reply for that recipient queued within that window and sends them
+# joined into as few messages as fit Twilio's body limit.
+#
+# Shard threads never sleep on a send: a rate-limit wait or a retry
+# backoff puts the unsent segments back at the front of the recipient's
+# queue with a due time, and the thread moves on to other recipients.
+
+_Job = collections.namedtuple(
+    '_Job',
+    ['body', 'enqueued_at', 'context', 'built', 'due_at', 'segments', 'attempt', 'started', 'reserved'],
+    # built: Future of a callable body; segments: set once the job is a body ready to send
+    defaults=(None, 0.0, None, 0, 0.0, False)
+)
+
+
+class _Shard:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.pending = collections.OrderedDict()  # recipient -> deque of _Job, least recently served first
+        self.building = {}  # recipient -> Future of its latest queued build
+        self.ready = threading.Condition()
+
+
+_shards = []
+_workers = []
+_builders = None
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+_stats = collections.Counter()
+_stats_lock = threading.Lock()
+_latencies = collections.deque(maxlen=1000)  # (queue wait, delivery time) in seconds
+
+
+def _count(key, amount=1):
+    """Bump a delivery counter; called from request, worker and event-loop threads"""
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _ensure_workers():
+    """Start the worker pool in the current process if it is not running"""
+    global _shards, _workers, _builders, _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        # A forked child gets fresh shards: the parent's threads are not running here
+        capacity = -(-DELIVERY_QUEUE_SIZE // DELIVERY_WORKERS)
+        _shards = [_Shard(capacity) for _ in range(DELIVERY_WORKERS)]
+        _builders = concurrent.futures.ThreadPoolExecutor(DELIVERY_BUILDERS, thread_name_prefix='whatsapp-reply-builder')
+        _workers = []
+        for i, shard in enumerate(_shards):
+            worker = threading.Thread(target=_worker_loop, args=(shard,), name=f'whatsapp-delivery-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+        _workers_pid = os.getpid()
+
+
+def _run_build(built, context, body):
+    if not built.set_running_or_notify_cancel():
+        return
+    try:
+        # Run in the enqueuing request's context so its log lines keep the request_id
+        result = context.run(body)
+    except BaseException as e:
+        built.set_exception(e)
+    else:
+        built.set_result(result)
+
+
+def _chain_build(shard, recipient, context, body):
+    """Build a reply once the recipient's previous build has finished (call with shard.ready held)"""
+    built = concurrent.futures.Future()
+    previous = shard.building.get(recipient)
+    shard.building[recipient] = built
+
+    def start(_=None):
+        _builders.submit(_run_build, built, context, body)
+
+    def finished(_):
+        with shard.ready:
+            if shard.building.get(recipient) is built:
+                del shard.building[recipient]
+            shard.ready.notify()
+
+    built.add_done_callback(finished)
+    if previous is None:
+        start()
+    else:
+        previous.add_done_callback(start)
+    return built
+
+
+def _is_built(job):
+    return job.built is None or job.built.done()
+
+
+def _next_batch(shard):
+    """Block until a recipient's replies are due; return (recipient, jobs)"""
+    with shard.ready:
+        while True:
+            now = time.monotonic()
+            wake_at = None
+            for recipient, jobs in shard.pending.items():
+                head = jobs[0]
+                # A reply still being built is woken for by its Future
+                if not _is_built(head):
+                    continue
+                if head.due_at <= now:
+                    break
+                wake_at = head.due_at if wake_at is None else min(wake_at, head.due_at)
+            else:
+                shard.ready.wait(None if wake_at is None else wake_at - now)
+                continue
+
+            if head.segments is not None:
+                batch = [jobs.popleft()]
+            else:
+                batch = []
+                while (jobs and jobs[0].segments is None and _is_built(jobs[0])
+                       and jobs[0].enqueued_at <= head.due_at):
+                    batch.append(jobs.popleft())
+            if jobs:
+                shard.pending.move_to_end(recipient)
+            else:
+                del shard.pending[recipient]
+            shard.size -= len(batch)
+            return recipient, batch
+
+
+def _requeue(shard, recipient, jobs):
+    """Put unsent bodies back at the front of a recipient's queue, ahead of newer replies"""
+    with shard.ready:
+        pending = shard.pending.get(recipient)
+        if pending is None:
+            pending = shard.pending[recipient] = collections.deque()
+        pending.extendleft(reversed(jobs))
+        shard.size += len(jobs)
+        shard.ready.notify()
+
+
+def start_delivery_workers():
+    """Start this process's delivery threads now instead of on the first reply"""
+    _ensure_workers()
+
+
+def _worker_loop(shard):
+    # Open the thread's Twilio session before the first reply needs it
+    _get_session()
+    while True:
+        recipient, jobs = _next_batch(shard)
+        try:
+            _deliver_batch(shard, recipient, jobs)
+        except Exception:
+            _record_outcome(False, len(jobs))
+            logger.exception("Delivery worker error")
+
+
+def coalesce_messages(messages, limit=MAX_SEGMENT_CHARS):
+    """Join consecutive messages into as few bodies as fit ``limit``; drops exact repeats.
+
+    A message too long to join is kept as is (with any precomputed segments).
+    """
+    bodies = []
+    last_length = 0
+    previous = None
+    for message in messages:
+        if message == previous:
+            continue
+        previous = message
+        length = text_length(message)
+        if bodies and last_length + 2 + length <= limit:
+            bodies[-1] = bodies[-1] + '\n\n' + message
+            last_length += 2 + length
+        else:
+            bodies.append(message)
+            last_length = length
+    return bodies
+
+
+def _deliver_batch(shard, recipient, jobs):
+    if jobs[0].segments is None:
+        jobs = _sendable_bodies(jobs)
+    for i, job in enumerate(jobs):
+        later = job.context.run(_send_segments, recipient, job)
+        if later is not None:
+            _requeue(shard, recipient, [later] + jobs[i + 1:])
+            return
+
+
+def _sendable_bodies(jobs):
+    """Collect built replies and coalesce them into bodies ready to send"""
+    messages = []
+    for job in jobs:
+        try:
+            message = job.built.result() if job.built is not None else job.body
+        except Exception:
+            _record_outcome(False)
+            # Log in the enqueuing request's context so the line keeps its request_id
+            job.context.run(logger.exception, "Error building WhatsApp reply")
+            continue
+        if message:
+            messages.append(message)
+
+    bodies = coalesce_messages(messages)
+    if len(bodies) < len(messages):
+        _count('coalesced', len(messages) - len(bodies))
+    first = jobs[0]
+    started = time.monotonic()
+    return [first._replace(body=None, built=None, segments=tuple(message_segments(body)), started=started)
+            for body in bodies]
+
+
+def _send_segments(recipient, job):
+    """Send a body's remaining segments in order.
+
+    Returns None once the body is sent or has failed for good, or the job
+    to re-queue (remaining segments, with a due time) when it has to wait
+    for the rate limit or back off before a retry.
+    """
+    credentials = _twilio_credentials()
+    if credentials is None:
+        return _finish_body(False, job)
+    bucket = _rate_limits.get(credentials[0])
+
+    segments = job.segments
+    while segments:
+        if not job.reserved:
+            # Also covers a Retry-After pause from an earlier 429
+            waited = bucket.reserve()
+            if waited > 0:
+                STAGE_SECONDS.observe(waited, 'rate_limit_wait')
+                return job._replace(segments=segments, due_at=time.monotonic() + waited, reserved=True)
+        if job.attempt == 0:
+            logger.info("Sending WhatsApp message", extra={'to': recipient, 'chars': len(segments[0]), 'sample': True})
+        outcome = _post_once(recipient, segments[0], credentials, job.attempt)
+        if outcome == 'sent':
+            segments = segments[1:]
+            job = job._replace(attempt=0, reserved=False)
+            continue
+        if outcome == 'retry' and job.attempt < DELIVERY_MAX_ATTEMPTS - 1:
+            _count('retries')
+            DELIVERIES.inc('retry')
+            return job._replace(segments=segments, attempt=job.attempt + 1, reserved=False,
+                                due_at=time.monotonic() + _backoff_delay(job.attempt))
+        # A failed segment stops the rest rather than leave a gap
+        return _finish_body(False, job)
+    return _finish_body(True, job)
+
+
+def _finish_body(sent, job):
+    duration = time.monotonic() - job.started
+    STAGE_SECONDS.observe(duration, 'delivery')
+    record_delivery(sent, job.started - job.enqueued_at, duration)
+    return None
+
+
+def _record_outcome(success, amount=1):
+    # Counted per reply body (not per Twilio segment or attempt) in both the stats and the metric
+    outcome = 'sent' if success else 'failed'
+    _count(outcome, amount)
+    DELIVERIES.inc(outcome, amount=amount)
+
+
+def record_delivery(success, queue_wait, duration):
+    """Count one finished delivery and its latency (seconds)"""
+    _record_outcome(success)
+    _latencies.append((queue_wait, duration))
+    STAGE_SECONDS.observe(queue_wait, 'queue_wait')
+
+
+def enqueue_whatsapp_message(to_number, body):
+    """Queue a reply for background delivery.
+
+    ``body`` is either the message text or a zero-argument callable that
+    builds it on a builder thread. Returns False when the queue is full so
+    the caller can fall back to sending inline.
+    """
+    _ensure_workers()
+    shard = _shards[zlib.crc32(to_number.encode('utf-8')) % len(_shards)]
+    with shard.ready:
+        if shard.size >= shard.capacity:
+            _count('rejected')
+            return False
+        jobs = shard.pending.get(to_number)
+        if jobs is None:
+            jobs = shard.pending[to_number] = collections.deque()
+        enqueued_at = time.monotonic()
+        context = contextvars.copy_context()
+        built = _chain_build(shard, to_number, context, body) if callable(body) else None
+        jobs.append(_Job(body, enqueued_at, context, built, enqueued_at + DELIVERY_COALESCE_WINDOW))
+        shard.size += 1
+        shard.ready.notify()
+    _count('enqueued')
+    return True
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def get_delivery_stats():
+    """Return queue depth, counters and recent latency percentiles (ms)"""
+    samples = list(_latencies)
+    with _stats_lock:
+        stats = dict(_stats)
+    waits = sorted(wait for wait, _ in samples)
+    deliveries = sorted(delivery for _, delivery in samples)
+    return {
+        'queue_depth': sum(shard.size for shard in _shards) if _workers_pid == os.getpid() else 0,
+        'queue_capacity': DELIVERY_QUEUE_SIZE,
+        'workers': len(_workers) if _workers_pid == os.getpid() else 0,
+        'builders': DELIVERY_BUILDERS,
+        'coalesce_window_seconds': DELIVERY_COALESCE_WINDOW,
+        'enqueued': stats.get('enqueued', 0),
+        'sent': stats.get('sent', 0),
+        'failed': stats.get('failed', 0),
+        'retries': stats.get('retries', 0),
+        'rejected': stats.get('rejected', 0),
+        'coalesced': stats.get('coalesced', 0),
+        'throttled': stats.get('throttled', 0),
+        'rate_limits': _rate_limits.snapshot(),
+        'queue_wait_ms': {
+            'p50': round(_percentile(waits, 0.50) * 1000, 2),
+            'p95': round(_percentile(waits, 0.95) * 1000, 2)
+        },
+        'delivery_ms': {
+            'p50': round(_percentile(deliveries, 0.50) * 1000, 2),
+            'p95': round(_percentile(deliveries, 0.95) * 1000, 2),
+            'p99': round(_percentile(deliveries, 0.99) * 1000, 2)
+        }
+    }